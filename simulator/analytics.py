@@ -0,0 +1,316 @@
+from pathlib import Path
+import os
+import sys
+
+import numpy as np
+
+import simlog
+from simulator import Simulator
+from smp import SMPSimulator
+
+# Analytics over whole runs with NumPy, which is only needed by this module.
+# Events are kept in the layout of binary trace records, so a run recorded in memory and a trace written with --trace
+# (read with load_trace, without parsing) are analysed the same way.
+EVENT_DTYPE = np.dtype([("time", "<u8"), ("kind", "u1"), ("a", "<i8"), ("b", "<i8")])
+assert(EVENT_DTYPE.itemsize == simlog.RECORD.size)
+# Ready queue lengths of one CPU after a kernel call. Kernels with a single ready queue report it as foreground,
+# and multilevel ones their top level (MLFQ's background being all the levels below it).
+QUEUE_DTYPE = np.dtype([("time", "<u8"), ("cpu", "<u2"), ("foreground", "<u4"), ("background", "<u4")])
+# A stretch of time one process ran on one CPU.
+SEGMENT_DTYPE = np.dtype([("pid", "<i8"), ("cpu", "<i8"), ("start", "<u8"), ("end", "<u8")])
+
+# Rows are gathered in a list and copied into the array in batches, which is much cheaper per row than assigning them one at a time.
+BATCH_SIZE = 65536
+INITIAL_CAPACITY = 1 << 16
+# Most processes shown in a Gantt chart.
+MAX_GANTT_ROWS = 40
+DEFAULT_WINDOWS = 20
+
+# A preallocated array of dtype rows that doubles its capacity when full.
+class GrowableArray:
+    data: np.ndarray
+    size: int
+    pending: list[tuple]
+
+    def __init__(self, dtype: np.dtype, capacity: int = INITIAL_CAPACITY):
+        self.data = np.empty(capacity, dtype)
+        self.size = 0
+        self.pending = []
+
+    def append(self, row: tuple):
+        self.pending.append(row)
+        if len(self.pending) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        rows = np.array(self.pending, self.data.dtype)
+        end = self.size + len(rows)
+        if end > len(self.data):
+            grown = np.empty(max(2 * len(self.data), end), self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:end] = rows
+        self.size = end
+        self.pending.clear()
+
+    def array(self) -> np.ndarray:
+        self.flush()
+        return self.data[:self.size]
+
+# Records every log event of a simulation (whatever the log level) and the ready queue lengths after every kernel call.
+# Pass it to Simulator or SMPSimulator as recorder.
+class TraceRecorder:
+    events: GrowableArray
+    queues: GrowableArray
+    # Last queue lengths recorded for each CPU; only changes are recorded.
+    last_lengths: dict[int, tuple[int, int]]
+
+    def __init__(self):
+        self.events = GrowableArray(EVENT_DTYPE)
+        self.queues = GrowableArray(QUEUE_DTYPE)
+        self.last_lengths = {}
+
+    def tee(self, log) -> "RecordingLog":
+        return RecordingLog(log, self)
+
+    def kernel_called(self, time: int, cpu: int, kernel):
+        lengths = queue_lengths(kernel)
+        if lengths is not None and self.last_lengths.get(cpu) != lengths:
+            self.last_lengths[cpu] = lengths
+            self.queues.append((time, cpu, *lengths))
+
+# Forwards everything to the simulation's log, recording events on the way.
+class RecordingLog:
+    def __init__(self, log, recorder: TraceRecorder):
+        self.log = log
+        self.events = recorder.events
+
+    def event(self, time: int, kind: int, a: int = 0, b: int = 0):
+        self.events.append((time, kind, a, b))
+        self.log.event(time, kind, a, b)
+
+    def message(self, time: int, message: str, student_log: bool):
+        self.log.message(time, message, student_log)
+
+    def close(self, now: int | None = None):
+        self.log.close(now)
+
+def queue_lengths(kernel) -> tuple[int, int] | None:
+    if getattr(kernel, "scheduling_algorithm", None) in ("Multilevel", "MLFQ"):
+        top = len(kernel.levels[0])
+        return top, len(kernel.levels) - top
+    ready_queue = getattr(kernel, "ready_queue", None)
+    return None if ready_queue is None else (len(ready_queue), 0)
+
+# The records of a binary trace, memory mapped rather than read.
+def load_trace(trace_path: Path) -> np.ndarray:
+    if Path(trace_path).stat().st_size == 0:
+        return np.empty(0, EVENT_DTYPE)
+    return np.memmap(trace_path, EVENT_DTYPE, mode='r')
+
+def end_time(events: np.ndarray) -> int:
+    return int(events["time"][-1]) if len(events) else 0
+
+# Time, CPU and new PID of every context switch, ordered by CPU and then time.
+def switches(events: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    kinds = events["kind"]
+    single = events[kinds == simlog.SWITCH]
+    multi = events[kinds == simlog.CPU_SWITCH]
+    times = np.concatenate([single["time"], multi["time"]])
+    cpus = np.concatenate([np.zeros(len(single), np.int64), multi["a"]])
+    pids = np.concatenate([single["a"], multi["b"]])
+    order = np.argsort(cpus, kind="stable")
+    return times[order], cpus[order], pids[order]
+
+def cpu_count(events: np.ndarray) -> int:
+    multi = events["a"][events["kind"] == simlog.CPU_SWITCH]
+    return int(multi.max()) + 1 if len(multi) else 1
+
+# Every stretch of time a process ran, ordered by CPU and then time. A process still running at end is cut off there.
+def run_segments(events: np.ndarray, end: int | None = None) -> np.ndarray:
+    end = end_time(events) if end is None else end
+    times, cpus, pids = switches(events)
+    ends = np.full(len(times), end, np.uint64)
+    same_cpu = cpus[1:] == cpus[:-1]
+    ends[:-1][same_cpu] = times[1:][same_cpu]
+    keep = (pids != 0) & (ends > times)
+
+    segments = np.empty(np.count_nonzero(keep), SEGMENT_DTYPE)
+    segments["pid"] = pids[keep]
+    segments["cpu"] = cpus[keep]
+    segments["start"] = times[keep]
+    segments["end"] = ends[keep]
+    return segments
+
+# The segments of every process, grouped by PID (in time order within each process),
+# and the index of each PID's first segment (pids, starts), so process i has segments[starts[i]:starts[i + 1]].
+def segments_by_process(segments: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    grouped = segments[np.lexsort((segments["start"], segments["pid"]))]
+    pids, starts = np.unique(grouped["pid"], return_index=True)
+    return grouped, pids, starts
+
+# For each time in times, the sum over the intervals of weight times the part of the interval before that time.
+# The intervals must be in time order and must not overlap. Exact: everything is done in integers.
+def area_before(starts: np.ndarray, ends: np.ndarray, weights: np.ndarray, times: np.ndarray) -> np.ndarray:
+    starts = starts.astype(np.int64)
+    ends = ends.astype(np.int64)
+    weights = weights.astype(np.int64)
+    times = times.astype(np.int64)
+    areas = np.concatenate([[0], np.cumsum(weights * (ends - starts))])
+    last = np.searchsorted(starts, times, side="right") - 1
+    clamped = np.maximum(last, 0)
+    partial = weights[clamped] * np.clip(times - starts[clamped], 0, ends[clamped] - starts[clamped]) if len(starts) else 0
+    return np.where(last >= 0, areas[clamped] + partial, 0)
+
+# area_before summed over CPUs, for intervals ordered by CPU and then time that do not overlap on any one CPU.
+def area_before_per_cpu(cpus: np.ndarray, starts: np.ndarray, ends: np.ndarray, weights: np.ndarray, times: np.ndarray) -> np.ndarray:
+    total = np.zeros(len(times), np.int64)
+    boundaries = np.flatnonzero(np.diff(cpus)) + 1
+    for cpu_slice in np.split(np.arange(len(cpus)), boundaries):
+        if len(cpu_slice):
+            first, last = cpu_slice[0], cpu_slice[-1] + 1
+            total += area_before(starts[first:last], ends[first:last], weights[first:last], times)
+    return total
+
+def window_edges(end: int, window: int) -> np.ndarray:
+    return np.append(np.arange(0, end, window, dtype=np.uint64), np.uint64(end))
+
+# Fraction of the CPUs' time spent running processes in each window.
+def utilization(segments: np.ndarray, edges: np.ndarray, cpus: int) -> np.ndarray:
+    busy = area_before_per_cpu(segments["cpu"], segments["start"], segments["end"], np.ones(len(segments), np.int64), edges)
+    return np.diff(busy) / (np.diff(edges.astype(np.float64)) * cpus)
+
+# Time weighted mean foreground and background queue lengths in each window, summed over the CPUs.
+def queue_means(queues: np.ndarray, edges: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    queues = queues[np.argsort(queues["cpu"], kind="stable")]
+    ends = np.full(len(queues), edges[-1], np.uint64)
+    same_cpu = queues["cpu"][1:] == queues["cpu"][:-1]
+    ends[:-1][same_cpu] = queues["time"][1:][same_cpu]
+    widths = np.diff(edges.astype(np.float64))
+    means = []
+    for column in ["foreground", "background"]:
+        area = area_before_per_cpu(queues["cpu"], queues["time"], ends, queues[column], edges)
+        means.append(np.diff(area) / widths)
+    return means[0], means[1]
+
+# A text Gantt chart of the processes that ran between start and end, one row per process and up to width columns.
+# A column is marked if the process ran for at least half of it, with the CPU it ran on most (# on a single CPU).
+def gantt(segments: np.ndarray, start: int, end: int, cpus: int, width: int = 100) -> list[str]:
+    shown = segments[(segments["end"] > start) & (segments["start"] < end)]
+    pids = np.unique(shown["pid"])[:MAX_GANTT_ROWS]
+    width = min(width, end - start)
+    column_edges = np.linspace(start, end, width + 1).round().astype(np.int64)
+    half = np.diff(column_edges) / 2
+    lines = [f"{start / 1000:.3f}ms to {end / 1000:.3f}ms, {(end - start) / width:.1f}us per column"]
+    for pid in pids:
+        own = shown[shown["pid"] == pid]
+        best = np.zeros(width, np.int64)
+        row = np.full(width, ".", "<U1")
+        for cpu in np.unique(own["cpu"]):
+            on_cpu = own[own["cpu"] == cpu]
+            time_run = np.diff(area_before(on_cpu["start"], on_cpu["end"], np.ones(len(on_cpu), np.int64), column_edges))
+            better = (time_run >= half) & (time_run > best)
+            row[better] = "#" if cpus == 1 else str(cpu % 10)
+            best = np.maximum(best, time_run)
+        lines.append(f"{pid:>8} {''.join(row)}")
+    all_pids = np.unique(shown["pid"])
+    if len(all_pids) > len(pids):
+        lines.append(f"... and {len(all_pids) - len(pids)} more processes")
+    return lines
+
+# Prints utilisation (and queue lengths when recorded) per window, and optionally a Gantt chart and CSV exports.
+def report(events: np.ndarray, queues: np.ndarray | None, window: int | None, gantt_range: tuple[int, int] | None,
+           segments_path: Path | None, queues_path: Path | None):
+    end = end_time(events)
+    cpus = cpu_count(events)
+    segments = run_segments(events, end)
+    window = window or max(-(-end // DEFAULT_WINDOWS), 1)
+    edges = window_edges(end, window)
+
+    print(f"{end / 1000:.3f}ms simulated on {cpus} CPU(s), {len(events)} events, {len(segments)} run segments "
+          f"of {len(np.unique(segments['pid']))} processes")
+    columns = [utilization(segments, edges, cpus)]
+    header = f"{'window ms':>10} {'util':>7}"
+    if queues is not None and len(queues):
+        columns.extend(queue_means(queues, edges))
+        header += f" {'mean FGQ':>9} {'mean BGQ':>9}"
+    print(header)
+    for i in range(len(edges) - 1):
+        line = f"{edges[i] / 1000:>10.3f} {columns[0][i]:>7.1%}"
+        for column in columns[1:]:
+            line += f" {column[i]:>9.2f}"
+        print(line)
+
+    if gantt_range is not None:
+        print()
+        gantt_start, gantt_end = gantt_range[0], min(gantt_range[1], end)
+        if gantt_start < gantt_end:
+            print("\n".join(gantt(segments, gantt_start, gantt_end, cpus)))
+        else:
+            print(f"No Gantt chart: the run ended at {end / 1000:.3f}ms, before the chart would start")
+    if segments_path is not None:
+        grouped, _, _ = segments_by_process(segments)
+        np.savetxt(segments_path, np.column_stack([grouped[name] for name in SEGMENT_DTYPE.names]), "%d", ",",
+                   header=",".join(SEGMENT_DTYPE.names), comments="")
+    if queues_path is not None and queues is not None:
+        np.savetxt(queues_path, np.column_stack([queues[name] for name in QUEUE_DTYPE.names]), "%d", ",",
+                   header=",".join(QUEUE_DTYPE.names), comments="")
+
+# Runs a simulation with a TraceRecorder and returns its events and queue lengths. No log is written.
+def record_run(description_path: Path, cpus: int, event_driven: bool) -> tuple[np.ndarray, np.ndarray]:
+    recorder = TraceRecorder()
+    if cpus == 1:
+        simulator = Simulator(description_path, os.devnull, False, event_driven, simlog.LEVEL_SWITCHES, True, recorder=recorder)
+    else:
+        simulator = SMPSimulator(description_path, os.devnull, False, cpus, event_driven, simlog.LEVEL_SWITCHES, True, recorder=recorder)
+    simulator.run_simulator()
+    return recorder.events.array(), recorder.queues.array()
+
+def print_usage():
+    print("Usage: python analytics.py <trace_path> <options>")
+    print("       python analytics.py run <simulation_description_path> <optional --cpus=N> <optional --event-driven> <options>")
+    print("       Options: <optional --window=US> <optional --gantt=START,END (in us)> <optional --segments=CSV_PATH>")
+    print("                <optional --queues=CSV_PATH (run only: queue lengths after every kernel call that changed them)>")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or (sys.argv[1] == "run" and len(sys.argv) < 3):
+        print_usage()
+    running = sys.argv[1] == "run"
+    cpus = 1
+    event_driven = False
+    window = None
+    gantt_range = None
+    segments_path = None
+    queues_path = None
+    for option in sys.argv[3 if running else 2:]:
+        key, _, value = option.partition("=")
+        try:
+            if key == "--window" and int(value) > 0:
+                window = int(value)
+            elif key == "--gantt":
+                start, end = (int(time) for time in value.split(","))
+                if not 0 <= start < end:
+                    print_usage()
+                gantt_range = (start, end)
+            elif key == "--segments" and value:
+                segments_path = Path(value)
+            elif running and key == "--queues" and value:
+                queues_path = Path(value)
+            elif running and key == "--cpus" and int(value) > 0:
+                cpus = int(value)
+            elif running and option == "--event-driven":
+                event_driven = True
+            else:
+                print_usage()
+        except ValueError:
+            print_usage()
+
+    if running:
+        events, queues = record_run(Path(sys.argv[2]), cpus, event_driven)
+        report(events, queues, window, gantt_range, segments_path, queues_path)
+    else:
+        report(load_trace(Path(sys.argv[1])), None, window, gantt_range, segments_path, None)
@@ -0,0 +1,123 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from itertools import zip_longest
+from pathlib import Path
+import os
+import sys
+import tempfile
+import time
+
+from simulator import Simulator, DeadlockError, run_cached
+import cache
+
+SIMULATIONS_DIR = Path(__file__).parent / "simulations"
+CORRECT_OUTPUT_DIR = Path(__file__).parent / "correct_output"
+
+@dataclass
+class ScenarioResult:
+    name: str
+    passed: bool
+    wall_time: float
+    # Human readable reason for a failure, e.g. the first line that differs from the expected output.
+    detail: str
+    # Whether the log came from the result cache instead of being simulated.
+    cached: bool = False
+
+# Compares two logs line by line without reading either one fully into memory.
+# Returns None if they are identical, otherwise a description of the first differing line.
+def first_difference(log_path: Path, expected_path: Path) -> str | None:
+    with open(log_path, 'r') as log, open(expected_path, 'r') as expected:
+        for line_number, (actual_line, expected_line) in enumerate(zip_longest(log, expected), start=1):
+            if actual_line != expected_line:
+                actual_line = "<end of file>" if actual_line is None else actual_line.rstrip("\n")
+                expected_line = "<end of file>" if expected_line is None else expected_line.rstrip("\n")
+                return f"line {line_number}: got {actual_line!r}, expected {expected_line!r}"
+    return None
+
+# Runs one scenario and checks its log. Executed inside the worker processes.
+# With a cache_dir, scenarios whose description and source code are unchanged since a cached run are not simulated again.
+def run_scenario(simulation_path: Path, expected_path: Path, output_dir: Path, event_driven: bool, cache_dir: Path | None = None) -> ScenarioResult:
+    name = simulation_path.stem
+    log_path = output_dir / f"{name}.txt"
+    start = time.perf_counter()
+    cached = False
+    try:
+        if cache_dir is None:
+            simulator = Simulator(simulation_path, log_path, False, event_driven)
+            simulator.run_simulator()
+        else:
+            cached = run_cached(cache.ResultCache(cache_dir), simulation_path, log_path, False, event_driven)
+    except DeadlockError:
+        # Some scenarios deadlock on purpose. Their log ends with the deadlock, so comparing it checks it is the expected one.
+        pass
+    except Exception as e:
+        return ScenarioResult(name, False, time.perf_counter() - start, f"{type(e).__name__}: {e}".strip())
+    wall_time = time.perf_counter() - start
+
+    if not expected_path.exists():
+        return ScenarioResult(name, False, wall_time, f"no expected output at {expected_path}")
+    difference = first_difference(log_path, expected_path)
+    return ScenarioResult(name, difference is None, wall_time, difference or "", cached)
+
+def run_batch(simulations_dir: Path, expected_dir: Path, output_dir: Path, jobs: int, event_driven: bool,
+              cache_dir: Path | None = None) -> list[ScenarioResult]:
+    simulation_paths = sorted(simulations_dir.glob("*.json"))
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_scenario, path, expected_dir / f"{path.stem}.txt", output_dir, event_driven, cache_dir) for path in simulation_paths]
+        for future in as_completed(futures):
+            results.append(future.result())
+    results.sort(key=lambda r: r.name)
+    return results
+
+def print_results(results: list[ScenarioResult]):
+    name_width = max([len("scenario")] + [len(r.name) for r in results])
+    print(f"{'scenario':<{name_width}}  result  {'wall (s)':>8}  cached  first difference")
+    for r in results:
+        print(f"{r.name:<{name_width}}  {'PASS' if r.passed else 'FAIL':<6}  {r.wall_time:>8.3f}  {'yes' if r.cached else 'no':<6}  {r.detail}")
+    failed = sum(1 for r in results if not r.passed)
+    cached = sum(1 for r in results if r.cached)
+    print(f"\n{len(results) - failed}/{len(results)} passed, {cached} from the cache")
+
+def print_usage():
+    print("Usage: python batch.py <optional --simulations=DIR> <optional --expected=DIR> <optional --output=DIR> <optional --jobs=N> <optional --event-driven>")
+    print(f"       <optional --cache (reuse cached logs, from {cache.DEFAULT_CACHE_DIR} or --cache=DIR)>")
+    print("       Every scenario is simulated unless --cache is given.")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    simulations_dir = SIMULATIONS_DIR
+    expected_dir = CORRECT_OUTPUT_DIR
+    output_dir = None
+    jobs = os.cpu_count() or 1
+    event_driven = False
+    cache_dir = None
+    for option in sys.argv[1:]:
+        key, _, value = option.partition("=")
+        if key == "--simulations" and value:
+            simulations_dir = Path(value)
+        elif key == "--expected" and value:
+            expected_dir = Path(value)
+        elif key == "--output" and value:
+            output_dir = Path(value)
+        elif key == "--jobs" and value.isdigit() and int(value) > 0:
+            jobs = int(value)
+        elif option == "--event-driven":
+            event_driven = True
+        elif option == "--cache":
+            cache_dir = cache.DEFAULT_CACHE_DIR
+        elif key == "--cache" and value:
+            cache_dir = Path(value)
+        elif option == "--no-cache":
+            cache_dir = None
+        else:
+            print_usage()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if output_dir is None:
+            output_dir = Path(temp_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        results = run_batch(simulations_dir, expected_dir, output_dir, jobs, event_driven, cache_dir)
+    print_results(results)
+    sys.exit(0 if all(r.passed for r in results) else 1)
@@ -0,0 +1,171 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from generator import generate_workload
+from kernel import Kernel
+from simulator import Simulator, StudentLogger, VALID_SCHEDULING_ALGORITHMS
+
+READY_QUEUE_SIZES = [1000, 10000, 100000]
+READY_QUEUE_EVENTS = 20000
+
+SCALING_SIZES = [1000, 10000, 100000]
+SCALING_SEMAPHORES = 100
+SCALING_MUTEXES = 100
+RESULTS_PATH = Path(__file__).parent / "bench_results.jsonl"
+
+# Measures the average cost of one Priority scheduling event while a fixed number of processes are ready.
+# Each round is a set-priority syscall that preempts the running process, a new arrival, and an exit,
+# so every path through the Priority branch of choose_next_process is exercised.
+def bench_priority_ready_queue(ready: int, events: int = READY_QUEUE_EVENTS) -> float:
+    kernel = Kernel("Priority", StudentLogger(None))
+    next_pid = 1
+    for _ in range(ready):
+        kernel.new_process_arrived(next_pid, 10 + next_pid % 20, "Foreground")
+        next_pid += 1
+
+    rounds = events // 3
+    start = time.perf_counter()
+    for _ in range(rounds):
+        kernel.syscall_set_priority(40)
+        kernel.new_process_arrived(next_pid, 10 + next_pid % 20, "Foreground")
+        next_pid += 1
+        kernel.syscall_exit()
+    elapsed = time.perf_counter() - start
+    return elapsed / (rounds * 3)
+
+def run_ready_queue_benchmark():
+    print(f"{'ready':>10} {'us/event':>10}")
+    for ready in READY_QUEUE_SIZES:
+        print(f"{ready:>10} {bench_priority_ready_queue(ready) * 1e6:>10.3f}")
+
+# Forwards every call to the wrapped kernel while counting calls and the time spent inside them.
+class TimedKernel:
+    calls: int
+    kernel_time: float
+
+    def __init__(self, kernel: Kernel):
+        self.kernel = kernel
+        self.calls = 0
+        self.kernel_time = 0.0
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.kernel, name)
+        if not callable(attribute):
+            return attribute
+
+        def timed(*args):
+            start = time.perf_counter()
+            try:
+                return attribute(*args)
+            finally:
+                self.kernel_time += time.perf_counter() - start
+                self.calls += 1
+        # Cache the wrapper so __getattr__ only runs once per method.
+        setattr(self, name, timed)
+        return timed
+
+# Runs one generated workload in event-driven mode. Executed in a fresh worker process so peak RSS is its own.
+def run_scaling_case(workload_path: Path, log_path: Path) -> dict:
+    simulator = Simulator(workload_path, log_path, False, True)
+    kernel = TimedKernel(simulator.kernel)
+    simulator.kernel = kernel
+    start = time.perf_counter()
+    simulator.run_simulator()
+    wall_time = time.perf_counter() - start
+    return {
+        "simulated_us": simulator.elapsed_time,
+        "wall_s": wall_time,
+        "simulated_us_per_s": simulator.elapsed_time / wall_time,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "kernel_calls": kernel.calls,
+        "kernel_ns_per_call": kernel.kernel_time * 1e9 / max(kernel.calls, 1),
+    }
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def load_results(results_path: Path) -> list[dict]:
+    if not results_path.exists():
+        return []
+    with open(results_path, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+# Generates each (algorithm, size) workload, runs it, appends the measurements to results_path
+# and prints them next to the most recent result for the same case from a different commit.
+def run_scaling_benchmark(algorithms: list[str], sizes: list[int], seed: int, results_path: Path):
+    commit = current_commit()
+    previous = {}
+    for result in load_results(results_path):
+        if result["commit"] != commit:
+            previous[(result["algorithm"], result["processes"], result["seed"])] = result
+
+    print(f"{'algorithm':<10} {'processes':>9} {'sim us/s':>12} {'peak RSS MB':>11} {'calls':>10} {'ns/call':>8}  vs previous")
+    with tempfile.TemporaryDirectory() as temp_dir, open(results_path, 'a') as results_file:
+        for algorithm in algorithms:
+            for size in sizes:
+                workload_path = Path(temp_dir) / f"{algorithm}_{size}.json"
+                with open(workload_path, 'w') as file:
+                    json.dump(generate_workload(algorithm, size, seed, SCALING_SEMAPHORES, SCALING_MUTEXES), file)
+
+                with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+                    measured = pool.submit(run_scaling_case, workload_path, Path(temp_dir) / "log.txt").result()
+                workload_path.unlink()
+
+                result = {"commit": commit, "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                          "algorithm": algorithm, "processes": size, "seed": seed, **measured}
+                results_file.write(json.dumps(result) + "\n")
+                results_file.flush()
+
+                comparison = ""
+                before = previous.get((algorithm, size, seed))
+                if before is not None:
+                    change = (result["simulated_us_per_s"] / before["simulated_us_per_s"] - 1) * 100
+                    comparison = f"{change:+.1f}% sim rate vs {before['commit']}"
+                print(f"{algorithm:<10} {size:>9} {result['simulated_us_per_s']:>12.0f} {result['peak_rss_kb'] / 1024:>11.1f} "
+                      f"{result['kernel_calls']:>10} {result['kernel_ns_per_call']:>8.0f}  {comparison}")
+
+def print_usage():
+    print("Usage: python benchmark.py ready-queue")
+    print("       python benchmark.py scaling <optional --algorithms=A,B> <optional --sizes=N,M> <optional --seed=N> <optional --results=PATH>")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print_usage()
+    if sys.argv[1] == "ready-queue" and len(sys.argv) == 2:
+        run_ready_queue_benchmark()
+    elif sys.argv[1] == "scaling":
+        algorithms = sorted(VALID_SCHEDULING_ALGORITHMS)
+        sizes = SCALING_SIZES
+        seed = 0
+        results_path = RESULTS_PATH
+        for option in sys.argv[2:]:
+            key, _, value = option.partition("=")
+            try:
+                if key == "--algorithms" and all(a in VALID_SCHEDULING_ALGORITHMS for a in value.split(",")):
+                    algorithms = value.split(",")
+                elif key == "--sizes":
+                    sizes = [int(size) for size in value.split(",")]
+                elif key == "--seed":
+                    seed = int(value)
+                elif key == "--results" and value:
+                    results_path = Path(value)
+                else:
+                    print_usage()
+            except ValueError:
+                print_usage()
+        run_scaling_benchmark(algorithms, sizes, seed, results_path)
+    else:
+        print_usage()
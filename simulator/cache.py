@@ -0,0 +1,137 @@
+from pathlib import Path
+from typing import Callable
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "simulator"
+DEFAULT_MAX_BYTES = 1 << 30
+READ_SIZE = 1 << 20
+# Names of directories being written or deleted start with this, so they are never taken for entries.
+TEMPORARY_PREFIX = "."
+# Temporary directories older than this were left by a process that died and are removed during eviction.
+STALE_TEMPORARY_S = 24 * 60 * 60
+
+# Stores the output files of runs on local disk, keyed by a hash of their input files and options.
+# Each entry is a directory holding one file per output, written to a temporary directory and renamed into place,
+# so concurrent processes never see part of an entry; if two of them store the same key, the first rename wins.
+# An entry's modification time is refreshed whenever it is used, and the least recently used entries are removed
+# once the cache is larger than max_bytes.
+class ResultCache:
+    def __init__(self, directory: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, inputs: list[Path], options: dict) -> str:
+        digest = hashlib.sha256()
+        for path in inputs:
+            with open(path, 'rb') as file:
+                while block := file.read(READ_SIZE):
+                    digest.update(block)
+            # Separates the files so moving bytes from one to the next changes the key.
+            digest.update(b"\0" + str(os.path.getsize(path)).encode() + b"\0")
+        digest.update(json.dumps(options, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    # Copies the entry's files to outputs (name -> destination). Returns False on a miss.
+    def get(self, key: str, outputs: dict[str, Path]) -> bool:
+        entry = self.directory / key
+        try:
+            os.utime(entry)
+            for name, destination in outputs.items():
+                if (entry / name).exists():
+                    shutil.copyfile(entry / name, destination)
+        except FileNotFoundError:
+            return False # missing, or evicted while it was being copied
+        return True
+
+    # Stores the outputs that exist under key.
+    def put(self, key: str, outputs: dict[str, Path]):
+        present = {name: path for name, path in outputs.items() if os.path.exists(path)}
+        if sum(os.path.getsize(path) for path in present.values()) > self.max_bytes:
+            return
+        temporary = Path(tempfile.mkdtemp(prefix=TEMPORARY_PREFIX, dir=self.directory))
+        for name, path in present.items():
+            shutil.copyfile(path, temporary / name)
+        try:
+            os.rename(temporary, self.directory / key)
+        except OSError:
+            shutil.rmtree(temporary, ignore_errors=True) # another process stored it first
+        self.evict()
+
+    # Looks key up and otherwise calls compute, which must write outputs, and stores them. Returns whether it was a hit.
+    def run(self, inputs: list[Path], options: dict, outputs: dict[str, Path], compute: Callable[[], None]) -> bool:
+        key = self.key(inputs, options)
+        if self.get(key, outputs):
+            return True
+        compute()
+        self.put(key, outputs)
+        return False
+
+    def entries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        now = time.time()
+        for entry in self.directory.iterdir():
+            try:
+                modified = entry.stat().st_mtime
+                if entry.name.startswith(TEMPORARY_PREFIX):
+                    if now - modified > STALE_TEMPORARY_S:
+                        shutil.rmtree(entry, ignore_errors=True)
+                    continue
+                size = sum(file.stat().st_size for file in entry.iterdir())
+            except FileNotFoundError:
+                continue # removed by another process meanwhile
+            entries.append((modified, size, entry))
+        return entries
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            self.remove(entry)
+            total -= size
+
+    # Renames the entry away first, so it disappears at once for everyone.
+    def remove(self, entry: Path):
+        doomed = self.directory / f"{TEMPORARY_PREFIX}evicted-{entry.name}-{os.getpid()}"
+        try:
+            os.rename(entry, doomed)
+        except OSError:
+            return
+        shutil.rmtree(doomed, ignore_errors=True)
+
+    def clear(self):
+        for _, _, entry in self.entries():
+            self.remove(entry)
+
+def print_usage():
+    print("Usage: python cache.py <stats|clear> <optional --cache=DIR>")
+    print(f"       The cache defaults to {DEFAULT_CACHE_DIR}.")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("stats", "clear"):
+        print_usage()
+    directory = DEFAULT_CACHE_DIR
+    for option in sys.argv[2:]:
+        key, _, value = option.partition("=")
+        if key == "--cache" and value:
+            directory = Path(value)
+        else:
+            print_usage()
+
+    result_cache = ResultCache(directory)
+    if sys.argv[1] == "clear":
+        result_cache.clear()
+    else:
+        entries = result_cache.entries()
+        print(f"{directory}: {len(entries)} entries, {sum(size for _, size, _ in entries)} bytes (limit {result_cache.max_bytes})")
@@ -0,0 +1,68 @@
+from pathlib import Path
+import sys
+
+import simlog
+from simulator import Simulator, load_checkpoint, NO_CHECKPOINT
+
+# Checkpoints are taken and resumed from this module rather than from simulator.py, so the pickled classes are
+# always those of the simulator module (when simulator.py is run directly they would belong to __main__).
+
+def run_with_checkpoints(description_path: Path, log_path: Path, directory: Path, times: list[int], every: int | None,
+                         student_logs: bool, event_driven: bool, log_level: int, binary_trace: bool):
+    simulator = Simulator(description_path, log_path, student_logs, event_driven, log_level, binary_trace)
+    simulator.schedule_checkpoints(directory, times, every)
+    simulator.run_simulator()
+
+# Continues a run from a checkpoint. Its logs are truncated back to the checkpoint and then written to the end again.
+def resume(checkpoint_path: Path, keep_checkpointing: bool = True):
+    simulator = load_checkpoint(checkpoint_path)
+    if not keep_checkpointing:
+        simulator.next_checkpoint = NO_CHECKPOINT
+    simulator.run_simulator()
+
+def print_usage():
+    print("Usage: python checkpoint.py run <simulation_description_path> <log_path> <optional --dir=DIR> <optional --at=T1,T2>")
+    print("       <optional --every=N> <optional --no-student-logs> <optional --event-driven> <optional --log-level=switches|lifecycle|all>")
+    print("       <optional --trace>")
+    print("       python checkpoint.py resume <checkpoint_path> <optional --no-checkpoints>")
+    print("       Checkpoints are written to DIR (default: checkpoints) as checkpoint_<simulated time>.pickle.")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 4 and sys.argv[1] == "run":
+        directory = Path("checkpoints")
+        times = []
+        every = None
+        student_logs = True
+        event_driven = False
+        log_level = simlog.LEVEL_ALL
+        binary_trace = False
+        for option in sys.argv[4:]:
+            key, _, value = option.partition("=")
+            try:
+                if key == "--dir" and value:
+                    directory = Path(value)
+                elif key == "--at":
+                    times = [int(time) for time in value.split(",")]
+                elif key == "--every" and int(value) > 0:
+                    every = int(value)
+                elif option == "--no-student-logs":
+                    student_logs = False
+                elif option == "--event-driven":
+                    event_driven = True
+                elif key == "--log-level" and value in simlog.LOG_LEVELS:
+                    log_level = simlog.LOG_LEVELS[value]
+                elif option == "--trace":
+                    binary_trace = True
+                else:
+                    print_usage()
+            except ValueError:
+                print_usage()
+        run_with_checkpoints(Path(sys.argv[2]), Path(sys.argv[3]), directory, times, every, student_logs, event_driven, log_level, binary_trace)
+    elif len(sys.argv) in (3, 4) and sys.argv[1] == "resume":
+        if len(sys.argv) == 4 and sys.argv[3] != "--no-checkpoints":
+            print_usage()
+        resume(Path(sys.argv[2]), len(sys.argv) == 3)
+    else:
+        print_usage()
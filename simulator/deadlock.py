@@ -0,0 +1,134 @@
+from typing import Callable, Collection
+
+from metrics import SEMAPHORE, MUTEX
+
+PID = int
+
+# Longest list of blocked processes shown in a deadlock report.
+MAX_SHOWN_WAITS = 20
+
+# Follows which processes wait for which semaphores and mutexes, so a deadlock is noticed the moment it happens.
+# It keeps its own copy of the semaphore and mutex values (the kernel's are private to it), which tells it exactly when a p or lock blocks.
+# A v or unlock with waiters wakes one of them, but only the kernel knows which: that wake-up stays pending until a waiter is dispatched,
+# which also makes that waiter the new holder of a mutex.
+#
+# Mutexes have holders, so a process blocking on one adds an edge to the holder, and a path of such edges back to the process is a cycle.
+# That is only a deadlock while mutexes are unlocked by their holders; the simulator allows anyone to unlock a mutex,
+# so a mutex wait is only reported through its holder once no other process has an unlock of it left, and after an unlock
+# by another process holders are no longer trusted for the rest of the run.
+# Semaphores have no holder, so deadlocks involving them are only found once every live process is blocked,
+# which happens when the last process still able to run either blocks or exits.
+class WaitForGraph:
+    values: dict[tuple[str, int], int]
+    holders: dict[int, PID]
+    blocked: dict[PID, tuple[str, int]]
+    # Wake-ups on each resource that no dispatched process has claimed yet.
+    pending_wakes: dict[tuple[str, int], int]
+    total_pending: int
+    # False once a mutex was unlocked by a process other than its holder.
+    holders_trusted: bool
+
+    def __init__(self):
+        self.values = {}
+        self.holders = {}
+        self.blocked = {}
+        self.pending_wakes = {}
+        self.total_pending = 0
+        self.holders_trusted = True
+
+    def init_semaphore(self, id: int, value: int):
+        self.values[(SEMAPHORE, id)] = value
+
+    def init_mutex(self, id: int):
+        self.values[(MUTEX, id)] = 1
+
+    # pid calls p or lock. Returns whether it blocks.
+    def acquire(self, pid: PID, kind: str, id: int) -> bool:
+        resource = (kind, id)
+        self.values[resource] -= 1
+        if self.values[resource] < 0:
+            self.blocked[pid] = resource
+            return True
+        if kind == MUTEX:
+            self.holders[id] = pid
+        return False
+
+    # Someone calls v or unlock. If the resource has waiters one of them is woken, and for a mutex it becomes the holder when it runs.
+    def release(self, pid: PID, kind: str, id: int):
+        resource = (kind, id)
+        self.values[resource] += 1
+        if kind == MUTEX and self.holders.pop(id, None) != pid:
+            self.holders_trusted = False
+        if self.values[resource] <= 0:
+            self.pending_wakes[resource] = self.pending_wakes.get(resource, 0) + 1
+            self.total_pending += 1
+
+    def dispatched(self, pid: PID):
+        resource = self.blocked.pop(pid, None)
+        if resource is None:
+            return
+        if self.pending_wakes.get(resource, 0) > 0:
+            self.pending_wakes[resource] -= 1
+            self.total_pending -= 1
+        if resource[0] == MUTEX:
+            self.holders[resource[1]] = pid
+
+    # True if pid is blocked and no pending wake-up can be for it.
+    def surely_blocked(self, pid: PID) -> bool:
+        resource = self.blocked.get(pid)
+        return resource is not None and self.pending_wakes.get(resource, 0) == 0
+
+    # Called right after pid blocked. live is every process that has arrived and not exited, more_arrivals whether others will arrive.
+    # may_unlock(id, excluded) tells whether a process not in excluded, live or still to arrive, can still unlock mutex id.
+    # Returns a description of the deadlock pid is now part of, or None.
+    def find_deadlock(self, pid: PID, live, more_arrivals: bool, may_unlock: Callable[[int, Collection[PID]], bool]) -> str | None:
+        kind, id = self.blocked[pid]
+        if kind == MUTEX and self.holders_trusted:
+            holder = self.holders.get(id)
+            if holder is not None and holder not in live and not may_unlock(id, (pid,)):
+                return f"process {pid} waits for mutex {id}, which is held by process {holder}, which has exited"
+            cycle = self.find_cycle(pid)
+            if cycle is not None and not any(may_unlock(self.blocked[waiter][1], cycle) for waiter in cycle):
+                return ", ".join(self.describe_wait(waiter) for waiter in cycle)
+
+        return self.find_all_blocked(live, more_arrivals)
+
+    # Called right after pid exited, with live no longer including it. An exit can leave the remaining processes waiting forever
+    # as well, for a mutex pid still held or because pid was the last process that was not blocked.
+    def find_deadlock_after_exit(self, pid: PID, live, more_arrivals: bool, may_unlock: Callable[[int, Collection[PID]], bool]) -> str | None:
+        if self.holders_trusted and pid in self.holders.values():
+            for waiter, (kind, id) in self.blocked.items():
+                if kind == MUTEX and self.holders.get(id) == pid and not may_unlock(id, (waiter,)):
+                    return f"process {waiter} waits for mutex {id}, which is held by process {pid}, which has exited"
+        return self.find_all_blocked(live, more_arrivals)
+
+    def find_all_blocked(self, live, more_arrivals: bool) -> str | None:
+        if not more_arrivals and live and len(self.blocked) - self.total_pending == len(live):
+            waits = [self.describe_wait(waiter) for waiter in list(self.blocked)[:MAX_SHOWN_WAITS]]
+            if len(self.blocked) > MAX_SHOWN_WAITS:
+                waits.append(f"... ({len(self.blocked) - MAX_SHOWN_WAITS} more)")
+            return "every live process is blocked and no more processes will arrive: " + ", ".join(waits)
+        return None
+
+    # The processes on a cycle of mutex waits through pid, starting with pid, or None if there is none.
+    def find_cycle(self, pid: PID) -> list[PID] | None:
+        cycle = [pid]
+        waiter = pid
+        while len(cycle) <= len(self.blocked):
+            kind, id = self.blocked[waiter]
+            if kind != MUTEX:
+                return None
+            holder = self.holders.get(id)
+            if holder == pid:
+                return cycle
+            if holder is None or not self.surely_blocked(holder):
+                return None
+            cycle.append(holder)
+            waiter = holder
+        return None
+
+    def describe_wait(self, pid: PID) -> str:
+        kind, id = self.blocked[pid]
+        if kind == MUTEX and id in self.holders:
+            return f"process {pid} waits for mutex {id} held by process {self.holders[id]}"
+        return f"process {pid} waits for {kind} {id}"
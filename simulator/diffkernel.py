@@ -0,0 +1,147 @@
+from collections import deque
+from pathlib import Path
+import importlib.util
+import os
+import sys
+
+from simulator import Simulator, StudentLogger, SimulationError
+
+# The kernel methods the simulator calls. The lockstep kernel deliberately has no next_timer_deadline,
+# so both kernels receive every timer interrupt even if one of them supports tickless mode.
+ENTRY_POINTS = {
+    "new_process_arrived", "syscall_exit", "syscall_set_priority", "syscall_init_semaphore", "syscall_semaphore_p",
+    "syscall_semaphore_v", "syscall_init_mutex", "syscall_mutex_lock", "syscall_mutex_unlock", "timer_interrupt",
+}
+# Longest queue shown in a divergence report.
+MAX_SHOWN_ITEMS = 20
+
+class KernelDivergence(SimulationError):
+    pass
+
+# Loads the Kernel class of the kernel module at path. Each call gets its own copy of the module,
+# so the same file can be loaded as both the reference and the candidate.
+def load_kernel_class(path: Path, module_name: str):
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    if spec is None:
+        raise ImportError(f"Can not load a kernel from {path}")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.Kernel
+
+# Forwards every call from the simulator to a reference and a candidate kernel and checks that they agree.
+# The reference kernel's PID is what the simulation continues with. Only the reference kernel's logs reach the simulator's log.
+class LockstepKernel:
+    calls: int
+    simulator: Simulator | None
+
+    def __init__(self, reference, candidate):
+        self.reference = reference
+        self.candidate = candidate
+        self.calls = 0
+        self.simulator = None
+
+    def __getattr__(self, name: str):
+        if name not in ENTRY_POINTS:
+            raise AttributeError(name)
+        reference_method = getattr(self.reference, name)
+        candidate_method = getattr(self.candidate, name)
+
+        def lockstep(*args):
+            reference_outcome = call(reference_method, args)
+            candidate_outcome = call(candidate_method, args)
+            self.calls += 1
+            if reference_outcome[:2] != candidate_outcome[:2]:
+                raise KernelDivergence(self.describe(name, args, reference_outcome, candidate_outcome))
+            if reference_outcome[0] == "raised":
+                raise reference_outcome[2]
+            return reference_outcome[1]
+        setattr(self, name, lockstep)
+        return lockstep
+
+    def describe(self, name: str, args: tuple, reference_outcome: tuple, candidate_outcome: tuple) -> str:
+        time = self.simulator.elapsed_time if self.simulator is not None else 0
+        lines = [
+            f"Kernels diverged at {time / 1000:.3f}ms on call {self.calls}: {name}({', '.join(repr(arg) for arg in args)})",
+            f"  reference {reference_outcome[0]} {reference_outcome[1]}",
+            f"  candidate {candidate_outcome[0]} {candidate_outcome[1]}",
+            "  reference state after the call:",
+            *(f"    {line}" for line in kernel_state(self.reference)),
+            "  candidate state after the call:",
+            *(f"    {line}" for line in kernel_state(self.candidate)),
+        ]
+        return "\n".join(lines)
+
+# Returns ("returned", value, None) or ("raised", description, exception), so outcomes can be compared.
+def call(method, args: tuple) -> tuple:
+    try:
+        return ("returned", method(*args), None)
+    except Exception as e:
+        return ("raised", f"{type(e).__name__}: {e}", e)
+
+# The running PID and every queue-like attribute of a kernel, one per line. Works on any kernel implementation.
+def kernel_state(kernel) -> list[str]:
+    lines = []
+    for name, value in vars(kernel).items():
+        if name == "running":
+            lines.append(f"running: {render(value)}")
+        elif "queue" in name or name in ("semaphores", "mutexes"):
+            lines.append(f"{name}: {render(value)}")
+    return lines
+
+def render(value) -> str:
+    if hasattr(value, "pid"):
+        return str(value.pid)
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{key}: {render(item)}" for key, item in value.items()) + "}"
+    if isinstance(value, (list, tuple, deque)) or (hasattr(value, "__iter__") and not isinstance(value, (str, bytes))):
+        items = list(value)
+        shown = ", ".join(render(item) for item in items[:MAX_SHOWN_ITEMS])
+        if len(items) > MAX_SHOWN_ITEMS:
+            shown += f", ... ({len(items) - MAX_SHOWN_ITEMS} more)"
+        return f"[{shown}]"
+    return repr(value)
+
+# Runs the simulation with both kernels in lockstep. Raises KernelDivergence at the first call they disagree on.
+def run_lockstep(description_path: Path, reference_path: Path, candidate_path: Path, log_path: Path, event_driven: bool) -> tuple[Simulator, LockstepKernel]:
+    reference_class = load_kernel_class(reference_path, "reference_kernel")
+    candidate_class = load_kernel_class(candidate_path, "candidate_kernel")
+
+    def create_lockstep_kernel(scheduling_algorithm: str, logger, **kernel_options) -> LockstepKernel:
+        return LockstepKernel(reference_class(scheduling_algorithm, logger, **kernel_options),
+                              candidate_class(scheduling_algorithm, StudentLogger(None), **kernel_options))
+
+    simulator = Simulator(description_path, log_path, False, event_driven, kernel_factory=create_lockstep_kernel)
+    lockstep = simulator.kernel
+    lockstep.simulator = simulator
+    simulator.run_simulator()
+    return simulator, lockstep
+
+def print_usage():
+    print("Usage: python diffkernel.py <simulation_description_path> <reference_kernel_path> <candidate_kernel_path> <optional --event-driven>")
+    print("       <optional --log=PATH (the reference kernel's log, not written by default)>")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print_usage()
+    event_driven = False
+    log_path = Path(os.devnull)
+    for option in sys.argv[4:]:
+        key, _, value = option.partition("=")
+        if option == "--event-driven":
+            event_driven = True
+        elif key == "--log" and value:
+            log_path = Path(value)
+        else:
+            print_usage()
+
+    try:
+        simulator, lockstep = run_lockstep(Path(sys.argv[1]), Path(sys.argv[2]), Path(sys.argv[3]), log_path, event_driven)
+    except KernelDivergence as e:
+        print(e)
+        sys.exit(1)
+    except SimulationError as e:
+        print(f"The kernels agreed until the simulation failed: {e}")
+        sys.exit(2)
+    print(f"The kernels agreed on all {lockstep.calls} calls over {simulator.elapsed_time / 1000:.3f}ms")
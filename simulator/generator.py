@@ -0,0 +1,122 @@
+from itertools import count, groupby
+from pathlib import Path
+from typing import Iterable, Iterator
+import json
+import random
+import sys
+
+from simulator import VALID_SCHEDULING_ALGORITHMS, VALID_PROCESS_TYPES, DEFAULT_PRIORITY, NUM_MICRO_IN_SEC, STREAMING_SUFFIX, Process, parse_process
+
+MEAN_CPU_TIME = 400
+MAX_CPU_TIME = 5000
+# Fraction of the CPU the generated processes ask for on average. Kept below 1 so queues stay bounded.
+DEFAULT_LOAD = 0.9
+# Arrival gaps are capped well below the simulator's 1 second idle limit.
+MAX_ARRIVAL_GAP = NUM_MICRO_IN_SEC // 2
+
+# Generates a random but valid simulation description.
+# The same seed always produces the same workload.
+# Every process holds at most one semaphore or mutex at a time and always releases it before taking another,
+# so generated workloads can not deadlock.
+def generate_workload(scheduling_algorithm: str, num_processes: int, seed: int = 0, num_semaphores: int = 0, num_mutexes: int = 0,
+                      load: float = DEFAULT_LOAD) -> dict:
+    header, processes = generate_stream(scheduling_algorithm, num_processes, seed, num_semaphores, num_mutexes, load)
+    return {**header, "processes": list(processes)}
+
+# Same workload as generate_workload, split into the description header and a lazy iterator over its processes (in arrival order).
+# With num_processes None the iterator never ends: arrivals are a Poisson process averaging load / MEAN_CPU_TIME per microsecond.
+# With parsed the processes come as simulator Process objects, ready to simulate, rather than as description dicts.
+def generate_stream(scheduling_algorithm: str, num_processes: int | None, seed: int = 0, num_semaphores: int = 0, num_mutexes: int = 0,
+                    load: float = DEFAULT_LOAD, parsed: bool = False) -> tuple[dict, Iterator[dict] | Iterator[Process]]:
+    assert(scheduling_algorithm in VALID_SCHEDULING_ALGORITHMS)
+    rng = random.Random(seed)
+    semaphores = [{"id": id, "init_val": rng.randint(1, 3)} for id in range(num_semaphores)]
+    mutexes = list(range(num_mutexes))
+
+    header = {"scheduling_algorithm": scheduling_algorithm}
+    if semaphores:
+        header["semaphores"] = semaphores
+    if mutexes:
+        header["mutexes"] = mutexes
+    return header, generate_processes(rng, scheduling_algorithm, num_processes, semaphores, mutexes, load, parsed)
+
+def generate_processes(rng: random.Random, scheduling_algorithm: str, num_processes: int | None, semaphores: list[dict], mutexes: list[int],
+                       load: float, parsed: bool = False) -> Iterator[dict] | Iterator[Process]:
+    arrival = 0
+    for _ in count() if num_processes is None else range(num_processes):
+        total_cpu_time = min(max(int(rng.expovariate(1 / MEAN_CPU_TIME)), 1), MAX_CPU_TIME)
+        process = {"arrival": arrival, "total_cpu_time": total_cpu_time}
+        if scheduling_algorithm == "Priority" or rng.random() < 0.5:
+            process["priority"] = rng.randint(DEFAULT_PRIORITY // 2, DEFAULT_PRIORITY * 3 // 2)
+        if scheduling_algorithm == "Multilevel" or scheduling_algorithm == "MLFQ":
+            process["type"] = rng.choice(sorted(VALID_PROCESS_TYPES))
+
+        add_events(process, rng, semaphores, mutexes)
+        parsed_process = parse_process(process) # also checks the dict is a valid description process
+        yield parsed_process if parsed else process
+
+        arrival += min(int(rng.expovariate(load / MEAN_CPU_TIME)), MAX_ARRIVAL_GAP)
+
+# Writes a description in the streaming JSON Lines format.
+# processes must be sorted by arrival. Processes that share an arrival time are written in reverse,
+# because in a JSON description the last one listed arrives first; this way both formats simulate identically.
+def write_jsonl(header: dict, processes: Iterable[dict], path: Path):
+    with open(path, 'w') as file:
+        file.write(json.dumps(header) + "\n")
+        for _, same_arrival in groupby(processes, key=lambda process: process["arrival"]):
+            for process in reversed(list(same_arrival)):
+                file.write(json.dumps(process) + "\n")
+
+# Adds priority changes and non-overlapping critical sections at distinct times before the process finishes.
+def add_events(process: dict, rng: random.Random, semaphores: list[dict], mutexes: list[int]):
+    total_cpu_time = process["total_cpu_time"]
+    num_events = min(rng.randint(0, 6), total_cpu_time)
+    times = sorted(rng.sample(range(total_cpu_time), num_events))
+
+    i = 0
+    while i < len(times):
+        choice = rng.random()
+        if i + 1 < len(times) and mutexes and choice < 0.35:
+            mutex = rng.choice(mutexes)
+            process.setdefault("mutex", []).extend([{"id": mutex, "lock": times[i]}, {"id": mutex, "unlock": times[i + 1]}])
+            i += 2
+        elif i + 1 < len(times) and semaphores and choice < 0.7:
+            semaphore = rng.choice(semaphores)["id"]
+            process.setdefault("semaphore", []).extend([{"id": semaphore, "p": times[i]}, {"id": semaphore, "v": times[i + 1]}])
+            i += 2
+        else:
+            process.setdefault("priority_change", []).append({"arrival": times[i], "new_priority": rng.randint(DEFAULT_PRIORITY // 2, DEFAULT_PRIORITY * 3 // 2)})
+            i += 1
+
+def print_usage():
+    print("Usage: python generator.py <scheduling_algorithm> <num_processes> <output_path> <optional --seed=N> <optional --semaphores=N> <optional --mutexes=N> <optional --load=F>")
+    print("       An output_path ending in .jsonl is written in the streaming format.")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4 or sys.argv[1] not in VALID_SCHEDULING_ALGORITHMS or not sys.argv[2].isdigit():
+        print_usage()
+    options = {"seed": 0, "num_semaphores": 0, "num_mutexes": 0, "load": DEFAULT_LOAD}
+    for option in sys.argv[4:]:
+        key, _, value = option.partition("=")
+        try:
+            if key == "--seed":
+                options["seed"] = int(value)
+            elif key == "--semaphores":
+                options["num_semaphores"] = int(value)
+            elif key == "--mutexes":
+                options["num_mutexes"] = int(value)
+            elif key == "--load":
+                options["load"] = float(value)
+            else:
+                print_usage()
+        except ValueError:
+            print_usage()
+
+    output_path = Path(sys.argv[3])
+    if output_path.suffix == STREAMING_SUFFIX:
+        write_jsonl(*generate_stream(sys.argv[1], int(sys.argv[2]), **options), output_path)
+    else:
+        with open(output_path, 'w') as file:
+            json.dump(generate_workload(sys.argv[1], int(sys.argv[2]), **options), file)
@@ -4,31 +4,204 @@
 
 from typing import Callable
 from collections import deque
+from itertools import chain
+from operator import attrgetter
 import heapq
 
 # PID is just an integer, but it is used to make it clear when a integer is expected to be a valid PID.
 PID = int
 
+# Default timing, in microseconds. Each can be overridden per run through the Kernel constructor.
+RR_QUANTUM = 40 # how long RR lets a process run before moving it to the back of the queue
+LEVEL_SLICE = 200 # how long Multilevel stays on one level while the other has work
+TIMER_INTERVAL = 10 # time between timer interrupts, which is how much the kernel's counters grow per interrupt
+FAIR_LATENCY = 200 # how long Fair aims to take to run every ready process once, shared out by weight
+FAIR_GRANULARITY = 20 # the shortest slice Fair gives, and how far a woken process must be behind to preempt
+BOOST_INTERVAL = 1000 # how often MLFQ moves every process back to the top level, so the ones that sank are not starved
+
+# MLFQ's levels, highest priority first, as (policy, quantum) with policy "RR" or "FCFS". A process that uses up the quantum
+# of an RR level moves down a level (on the bottom level, to the back of it). FCFS levels ignore the quantum.
+MLFQ_LEVELS = [("RR", 20), ("RR", 40), ("RR", 80), ("RR", 160)]
+# Multilevel is the Foreground/Background preset of the same levels: Foreground processes on an RR level with rr_quantum,
+# Background ones on an FCFS level. Processes never change level, and rather than the highest level always going first,
+# the levels take turns of level_slice while both have work. Its levels' (short, long) names in the student log:
+FOREGROUND_BACKGROUND_NAMES = [("FG", "foreground"), ("BG", "background")]
+
+# Fair scheduling weights by nice value (-20 to 19), as in Linux: each nice level is worth about 10% CPU.
+# A process's nice value is its priority minus FAIR_NICE_0_PRIORITY (the simulator's default priority), clamped to that range.
+FAIR_WEIGHTS = [
+	88761, 71755, 56483, 46273, 36291, 29154, 23254, 18705, 14949, 11916,
+	9548, 7620, 6100, 4904, 3906, 3121, 2501, 1991, 1586, 1277,
+	1024, 820, 655, 526, 423, 335, 272, 215, 172, 137,
+	110, 87, 70, 56, 45, 36, 29, 23, 18, 15,
+]
+FAIR_NICE_0_PRIORITY = 32
+# Virtual runtime grows by FAIR_SCALE / weight per microsecond run, so a nice 0 process gains 1024 per microsecond.
+FAIR_SCALE = 1024 * 1024
+
+def fair_weight(priority: int) -> int:
+	return FAIR_WEIGHTS[min(max(priority - FAIR_NICE_0_PRIORITY, -20), 19) + 20]
+
 # This class represents the PCB of processes.
 # It is only here for your convinience and can be modified however you see fit.
+# PCBs use __slots__ to stay small, and are only ever looked up by PID: queues and heaps hold plain PIDs.
 class PCB:
+	__slots__ = ("pid", "priority", "exiting", "runtime", "waiting", "process_type", "vruntime", "level")
 	pid: PID
 	priority: int
-	exiting: bool = False
-	runtime: int = 0
-	waiting: bool = False
+	exiting: bool
+	runtime: int
+	waiting: bool
 	process_type: str
+	vruntime: int # Fair only: weighted CPU time, see FAIR_SCALE
+	level: int # Multilevel and MLFQ only: the level whose queue the process joins when it is ready
 
 	def __init__(self, pid: PID, priority: int=None, process_type: str=""):
 		self.pid = pid
 		self.priority = priority
+		self.exiting = False
+		self.runtime = 0
+		self.waiting = False
 		self.process_type = process_type
+		self.vruntime = 0
+		self.level = 0
+
+# Ready queue used by Priority scheduling.
+# It is a binary heap of [priority, sequence, pid] entries, where sequence numbers are handed out as processes are appended,
+# so processes with equal priority leave in the order they arrived (the same order a stable sort of the queue would give).
+# A PCB whose priority changes while it is queued is handled lazily: a new entry is pushed and the old one,
+# no longer the live entry for its PID, is dropped when it reaches the top.
+class ReadyHeap:
+	pcbs: dict[PID, PCB]
+	heap: list[tuple[int, int, PID]]
+	entries: dict[PID, tuple[int, int, PID]]
+	sequence: int
+
+	def __init__(self, pcbs: dict[PID, PCB]):
+		self.pcbs = pcbs
+		self.heap = []
+		self.entries = {}
+		self.sequence = 0
+
+	def __len__(self):
+		return len(self.entries)
+
+	def __iter__(self):
+		return (entry[2] for entry in sorted(self.entries.values()))
+
+	def append(self, pid: PID):
+		entry = (self.pcbs[pid].priority, self.sequence, pid)
+		self.sequence += 1
+		self.entries[pid] = entry
+		heapq.heappush(self.heap, entry)
+
+	# Must be called after the priority of a queued PCB changes. Does nothing if pid is not queued.
+	def reprioritize(self, pid: PID):
+		entry = self.entries.get(pid)
+		if entry is None or entry[0] == self.pcbs[pid].priority:
+			return
+		new_entry = (self.pcbs[pid].priority, entry[1], pid)
+		self.entries[pid] = new_entry
+		heapq.heappush(self.heap, new_entry)
+
+	def peek(self) -> PID:
+		while self.entries.get(self.heap[0][2]) is not self.heap[0]:
+			heapq.heappop(self.heap)
+		return self.heap[0][2]
+
+	def popleft(self) -> PID:
+		pid = self.peek()
+		heapq.heappop(self.heap)
+		del self.entries[pid]
+		return pid
+
+# Ready queue used by Fair scheduling: a binary heap of (vruntime, sequence, pid) entries, so the process that has had
+# the least weighted CPU time runs next and ties go to the one queued first. A process's vruntime only changes while it runs,
+# so entries never go stale.
+class FairQueue:
+	pcbs: dict[PID, PCB]
+	heap: list[tuple[int, int, PID]]
+	sequence: int
+
+	def __init__(self, pcbs: dict[PID, PCB]):
+		self.pcbs = pcbs
+		self.heap = []
+		self.sequence = 0
+
+	def __len__(self):
+		return len(self.heap)
+
+	def __iter__(self):
+		return (entry[2] for entry in sorted(self.heap))
+
+	def append(self, pid: PID):
+		heapq.heappush(self.heap, (self.pcbs[pid].vruntime, self.sequence, pid))
+		self.sequence += 1
+
+	def peek(self) -> PID:
+		return self.heap[0][2]
+
+	def popleft(self) -> PID:
+		return heapq.heappop(self.heap)[2]
+
+# One level of a LevelQueues: a deque of PIDs that keeps its bit of the occupancy bitmap up to date.
+class LevelQueue(deque):
+	levels: "LevelQueues"
+	bit: int
+
+	def __init__(self, levels: "LevelQueues" = None, bit: int = 0):
+		super().__init__()
+		self.levels = levels
+		self.bit = bit
+
+	def append(self, pid: PID):
+		super().append(pid)
+		self.levels.occupied |= self.bit
+
+	def appendleft(self, pid: PID):
+		super().appendleft(pid)
+		self.levels.occupied |= self.bit
+
+	def popleft(self) -> PID:
+		pid = super().popleft()
+		if not self:
+			self.levels.occupied &= ~self.bit
+		return pid
+
+# Ready queues used by Multilevel and MLFQ scheduling, one per level from the highest priority (level 0) down.
+# Bit n of occupied is set while level n has processes, so the highest level with work is its lowest set bit,
+# found in constant time however many levels there are.
+class LevelQueues:
+	queues: list[LevelQueue]
+	occupied: int
+
+	def __init__(self, count: int):
+		self.occupied = 0
+		self.queues = [LevelQueue(self, 1 << level) for level in range(count)]
 
-	def __eq__(self, other):
-		return self.pid == other.pid
+	def __len__(self):
+		return sum(map(len, self.queues))
 
-	def __lt__(self, other):
-		return self.pid < other.pid
+	def __bool__(self):
+		return self.occupied != 0
+
+	def __iter__(self):
+		return chain.from_iterable(self.queues)
+
+	def __getitem__(self, level: int) -> LevelQueue:
+		return self.queues[level]
+
+	# The highest level with processes, or None if they are all empty.
+	def highest(self) -> int | None:
+		return lowest_bit(self.occupied)
+
+	# The first level after level with processes, wrapping around to the top (so level itself if only it has any), or None.
+	def next_after(self, level: int) -> int | None:
+		return lowest_bit(self.occupied >> (level + 1) << (level + 1) or self.occupied)
+
+# The index of the lowest set bit, or None if no bit is set.
+def lowest_bit(bits: int) -> int | None:
+	return (bits & -bits).bit_length() - 1 if bits else None
 
 # This class represents the Kernel of the simulation.
 # The simulator will create an instance of this object and use it to respond to syscalls and interrupts.
@@ -37,9 +210,13 @@ class Kernel:
 	scheduling_algorithm: str
 	logger: any
 	ready_queue: any
-	foreground_queue: any
-	background_queue: any
-	waiting_queues: dict[int, list[tuple[PID, PCB]]]
+	levels: LevelQueues # empty unless Multilevel or MLFQ
+	level_policies: list[str]
+	level_quanta: list[int]
+	level_names: list[tuple[str, str]]
+	pcbs: dict[PID, PCB]
+	waiting_queues: dict[int, list[tuple[int, PID]]]
+	mutex_waiting_queues: dict[int, list[tuple[int, PID]]]
 	idle_pcb: PCB
 	running: PCB
 	semaphores: dict[int, int]
@@ -48,29 +225,101 @@ class Kernel:
 	mut_key: Callable[[PCB], int]
 	level_runtime: int = 0
 	multilevel_scheduling_algorithm: str = ""
+	rr_quantum: int
+	level_slice: int
+	timer_interval: int
+	# Priority inheritance state, only kept up to date when priority_inheritance is on.
+	priority_inheritance: bool
+	mutex_owners: dict[int, PID]
+	held_mutexes: dict[PID, set[int]]
+	blocked_mutex: dict[PID, int] # the mutex each process waiting on one waits on
+	base_priorities: dict[PID, int] # own priority of every process currently running at an inherited priority
+	ready_heaps: list[ReadyHeap] # the ready queue of every CPU (one unless in SMP mode)
+	# Fair scheduling state.
+	fair_latency: int
+	fair_granularity: int
+	fair_load: int # total weight of the ready processes and the running one
+	min_vruntime: int # never decreases; where arriving and waking processes are placed
+	# MLFQ state.
+	boost_interval: int
+	boost_runtime: int = 0 # timer time since the last boost
 
 	# Called before the simulation begins.
 	# Use this method to initilize any variables you need throughout the simulation.
 	# DO NOT rename or delete this method. DO NOT change its arguments.
-	def __init__(self, scheduling_algorithm: str, logger):
+	# The timing arguments are optional and default to the values the simulator has always used.
+	# priority_inheritance makes a process holding a mutex run at the priority of its highest priority waiter (Priority scheduling only).
+	# fair_latency and fair_granularity tune Fair scheduling, see FAIR_LATENCY and FAIR_GRANULARITY.
+	# mlfq_levels and boost_interval configure MLFQ scheduling, see MLFQ_LEVELS and BOOST_INTERVAL.
+	# shared_with is only used in SMP mode, where every CPU has its own Kernel (and so its own run queue and running process).
+	# The per-CPU kernels share the PCB table and the semaphores and mutexes with the CPU 0 kernel passed here.
+	def __init__(self, scheduling_algorithm: str, logger, rr_quantum: int = RR_QUANTUM, level_slice: int = LEVEL_SLICE,
+				 timer_interval: int = TIMER_INTERVAL, priority_inheritance: bool = False, fair_latency: int = FAIR_LATENCY,
+				 fair_granularity: int = FAIR_GRANULARITY, mlfq_levels: list[tuple[str, int]] = MLFQ_LEVELS,
+				 boost_interval: int = BOOST_INTERVAL, shared_with: "Kernel | None" = None):
 		self.scheduling_algorithm = scheduling_algorithm
+		self.rr_quantum = rr_quantum
+		self.level_slice = level_slice
+		self.timer_interval = timer_interval
+		self.fair_latency = fair_latency
+		self.fair_granularity = fair_granularity
+		self.fair_load = 0
+		self.min_vruntime = 0
+		self.boost_interval = boost_interval
+		if scheduling_algorithm == "MLFQ":
+			levels = mlfq_levels
+			self.level_names = [(f"L{level}", f"level {level}") for level in range(len(levels))]
+		else:
+			levels = [("RR", rr_quantum), ("FCFS", 0)]
+			self.level_names = FOREGROUND_BACKGROUND_NAMES
+		self.levels = LevelQueues(len(levels))
+		self.level_policies = [policy for policy, _ in levels]
+		self.level_quanta = [quantum for _, quantum in levels]
+		self.priority_inheritance = priority_inheritance and scheduling_algorithm == "Priority"
+		self.pcbs = {} if shared_with is None else shared_with.pcbs
 		if scheduling_algorithm == "FCFS" or scheduling_algorithm == "RR":
 			self.ready_queue = deque()
-			self.sem_key = lambda pcb: pcb.pid
-			self.mut_key = lambda pcb: pcb.pid
+			self.sem_key = attrgetter("pid") # attrgetter rather than a lambda so the kernel can be pickled
+			self.mut_key = attrgetter("pid")
 		elif scheduling_algorithm == "Priority":
-			self.ready_queue = []
-			self.sem_key = lambda pcb: pcb.priority
-			self.mut_key = lambda pcb: pcb.priority
+			self.ready_queue = ReadyHeap(self.pcbs)
+			self.sem_key = attrgetter("priority")
+			self.mut_key = attrgetter("priority")
+		elif scheduling_algorithm == "Fair":
+			self.ready_queue = FairQueue(self.pcbs)
+			self.sem_key = attrgetter("pid")
+			self.mut_key = attrgetter("pid")
+		elif scheduling_algorithm == "Multilevel" or scheduling_algorithm == "MLFQ":
+			self.ready_queue = self.levels if scheduling_algorithm == "MLFQ" else self.levels[0] # Multilevel's follows the level whose turn it is
+			self.sem_key = attrgetter("pid")
+			self.mut_key = attrgetter("pid")
 
 		self.logger = logger
+		self.log_enabled = getattr(logger, "enabled", True) # loggers without the flag always log
 		self.waiting_queues = {}
+		self.mutex_waiting_queues = {} # separate from semaphores, which may use the same ids
 		self.idle_pcb = PCB(0)
+		self.pcbs[0] = self.idle_pcb # RR can briefly queue the idle process when nothing else is ready
 		self.running = self.idle_pcb
 		self.semaphores = {}
 		self.mutexes = {}
-		self.foreground_queue = deque()
-		self.background_queue = deque()
+		self.mutex_owners = {}
+		self.held_mutexes = {}
+		self.blocked_mutex = {}
+		self.base_priorities = {}
+		self.ready_heaps = [self.ready_queue] if scheduling_algorithm == "Priority" else []
+		if shared_with is not None:
+			self.pcbs[0] = shared_with.idle_pcb # the table keeps CPU 0's idle process, which is as good as any other CPU's
+			self.waiting_queues = shared_with.waiting_queues
+			self.mutex_waiting_queues = shared_with.mutex_waiting_queues
+			self.semaphores = shared_with.semaphores
+			self.mutexes = shared_with.mutexes
+			self.mutex_owners = shared_with.mutex_owners
+			self.held_mutexes = shared_with.held_mutexes
+			self.blocked_mutex = shared_with.blocked_mutex
+			self.base_priorities = shared_with.base_priorities
+			shared_with.ready_heaps.extend(self.ready_heaps)
+			self.ready_heaps = shared_with.ready_heaps
 		
 
 	# This method is triggered every time a new process has arrived.
@@ -78,18 +327,18 @@ class Kernel:
 	# priority is the priority of new_process.
 	# DO NOT rename or delete this method. DO NOT change its arguments.
 	def new_process_arrived(self, new_process: PID, priority: int, process_type: str) -> PID:
-		if self.scheduling_algorithm == "Multilevel": 
-			pcb = PCB(new_process, priority, process_type)
-			if process_type == "Foreground":
-				self.foreground_queue.append(pcb)
-			else:
-				self.background_queue.append(pcb)
+		if self.scheduling_algorithm == "Multilevel" or self.scheduling_algorithm == "MLFQ":
+			pcb = self.pcbs[new_process] = PCB(new_process, priority, process_type)
+			pcb.level = 0 if process_type == "Foreground" else len(self.level_policies) - 1 # Background processes start at the bottom
+			self.levels[pcb.level].append(new_process)
+		elif self.scheduling_algorithm == "Fair":
+			self.pcbs[new_process] = PCB(new_process, priority)
+			self.fair_enqueue(new_process, self.min_vruntime) # starts level with the processes that are furthest behind
 		else:
-			self.ready_queue.append(PCB(new_process, priority)) # everytime a process arrives, add it to the right of our queue
-		self.logger.log(
-				f"FGQ: {[pcb.pid for pcb in self.foreground_queue]}  "
-				f"-- BGQ: {[pcb.pid for pcb in self.background_queue]}"
-			)		
+			self.pcbs[new_process] = PCB(new_process, priority)
+			self.ready_queue.append(new_process) # everytime a process arrives, add it to the right of our queue
+		if self.log_enabled: # skip building the queue dump when nobody reads it
+			self.logger.log(self.level_dump())
 		self.choose_next_process() # should do nothing for FCFS, because context switching only occurs on process exit
 
 		return self.running.pid
@@ -98,13 +347,26 @@ class Kernel:
 	# DO NOT rename or delete this method. DO NOT change its arguments.
 	def syscall_exit(self) -> PID:
 		self.running.exiting = True # sets current process to not be running
+		del self.pcbs[self.running.pid] # no queue refers to the exiting process, so its PCB can go
+		if self.priority_inheritance:
+			# mutexes still held by the exiting process stay locked, but nobody can inherit from them any more
+			for mutex_id in self.held_mutexes.pop(self.running.pid, ()):
+				del self.mutex_owners[mutex_id]
+			self.base_priorities.pop(self.running.pid, None)
 		self.choose_next_process() # select new process to run as current has completed
 		return self.running.pid
 
 	# This method is triggered when the currently running process requests to change its priority.
 	# DO NOT rename or delete this method. DO NOT change its arguments.
 	def syscall_set_priority(self, new_priority: int) -> PID:
-		self.running.priority = new_priority
+		if self.scheduling_algorithm == "Fair":
+			self.fair_load += fair_weight(new_priority) - fair_weight(self.running.priority)
+		if self.priority_inheritance:
+			self.set_own_priority(self.running.pid, new_priority) # an inherited priority stays in effect while it is higher
+		else:
+			self.running.priority = new_priority
+		if self.scheduling_algorithm == "Priority":
+			self.ready_queue.reprioritize(self.running.pid)
 		
 		self.choose_next_process()
 		return self.running.pid
@@ -117,54 +379,38 @@ class Kernel:
 	def choose_next_process(self):
      
 		if self.scheduling_algorithm == "Multilevel":
-			# choose a process if we are idle
-			if not self.running.pid:
-				if self.foreground_queue:
-					self.multilevel_scheduling_algorithm = "RR"
-					self.ready_queue = self.foreground_queue
-					self.level_runtime = 0
-				elif self.background_queue:
-					self.multilevel_scheduling_algorithm = "FCFS"
-					self.ready_queue = self.background_queue
-					self.level_runtime = 0
-     
-			# if we are exiting at the moment
-			if self.running.exiting:
-				if self.running.process_type == "Foreground" and not self.foreground_queue:
-					# nothing to do if foreground queue wasn't empty, but since it is we need to switch
-					self.multilevel_scheduling_algorithm = "FCFS"
-					self.running = self.idle_pcb
-					self.ready_queue = self.background_queue
-					self.level_runtime = 0
-					self.logger.log("foreground is completely empty so only do background")
-				elif self.running.process_type == "Background" and not self.background_queue:
-					# same as above
-					self.multilevel_scheduling_algorithm = "RR"
-					self.running = self.idle_pcb
-					self.ready_queue = self.foreground_queue
-					self.level_runtime = 0
-					self.logger.log("background is completely empty so only do foreground")
-				elif not self.background_queue and not self.foreground_queue:
-					self.logger.log("both BGQ and FGQ are empty!")
-			
-			if self.running.process_type == "Foreground":
-				self.multilevel_scheduling_algorithm = "RR"
-				self.ready_queue = self.foreground_queue
-			elif self.running.process_type == "Background":
-				self.multilevel_scheduling_algorithm = "FCFS"
-				self.ready_queue = self.background_queue
-     
+			# choose a level if we are idle
+			if not self.running.pid and self.levels:
+				self.set_level(self.levels.highest())
+				self.level_runtime = 0
+
+			# if the running process leaves a level that is now empty, the next level's turn starts early
+			if (self.running.exiting or self.running.waiting) and not self.levels[self.running.level]:
+				level = self.running.level
+				next_level = self.levels.next_after(level)
+				if next_level is None:
+					next_level = (level + 1) % len(self.level_policies)
+				self.running.runtime = 0 # a waiting process gets a fresh quantum when it wakes, as under RR
+				self.running = self.idle_pcb
+				self.set_level(next_level)
+				self.level_runtime = 0
+				if self.log_enabled:
+					self.logger.log(f"{self.level_names[level][1]} is completely empty so only do {self.level_names[next_level][1]}")
+
+			if self.running.pid:
+				self.set_level(self.running.level)
+
 		if self.scheduling_algorithm == "FCFS" or self.multilevel_scheduling_algorithm == "FCFS":
 			# if currently idle
 			if not self.running.pid:
 				if self.ready_queue:
-					self.running = self.ready_queue.popleft()
+					self.running = self.pcbs[self.ready_queue.popleft()]
 					return
  
 			# if currently waiting		
 			if self.running.waiting:
 				if self.ready_queue:
-					self.running = self.ready_queue.popleft()
+					self.running = self.pcbs[self.ready_queue.popleft()]
 				else:
 					self.running = self.idle_pcb
 				return
@@ -172,64 +418,90 @@ class Kernel:
 			# if currently exiting
 			if self.running.exiting:
 				if self.ready_queue:
-					self.running = self.ready_queue.popleft()
+					self.running = self.pcbs[self.ready_queue.popleft()]
 				else:
 					self.running = self.idle_pcb
 	 
 		elif self.scheduling_algorithm == "Priority":
 			if not self.running.pid: # first time adding a process, just need to pop whatever was latest to be inserted
 				if self.ready_queue:
-					self.running = self.ready_queue.pop(0)
+					self.running = self.pcbs[self.ready_queue.popleft()]
 					return
 			elif self.running.exiting or self.running.waiting:
-				# if we are exiting a process, we need to either switch to next in line process (should be sorted as we sort everytime a new process is inserted) or switch back to idle
+				# if we are exiting a process, we need to either switch to next in line process (the heap keeps the highest priority at the front) or switch back to idle
 				if self.ready_queue:
-					# sort our array based on priority
-					self.ready_queue.sort(key=lambda process: process.priority)
-					self.running = self.ready_queue.pop(0)
+					self.running = self.pcbs[self.ready_queue.popleft()]
 				else:
 					self.running = self.idle_pcb
 			else:
-				# sort our array based on priority
-				self.ready_queue.sort(key=lambda process: process.priority)
 				# compare current running process' priority, with priority or process at front of queue
 				if self.ready_queue:
 					curr_process = self.running
-					next_process = self.ready_queue[0]
+					next_process = self.pcbs[self.ready_queue.peek()]
 					if next_process.priority < curr_process.priority: # if next in line has a higher priority, we will switch context and add current to queue, otherwise do nothing
-						self.running = self.ready_queue.pop(0) # pop front of queue
-						self.ready_queue.append(curr_process) # add curr process back to queue because we are swapping context
+						self.running = self.pcbs[self.ready_queue.popleft()] # pop front of queue
+						self.ready_queue.append(curr_process.pid) # add curr process back to queue because we are swapping context
 						return
   
 		elif self.scheduling_algorithm == "RR" or self.multilevel_scheduling_algorithm == "RR":
 			# if currently idle
 			if not self.running.pid:
 				if self.ready_queue:
-					self.running = self.ready_queue.popleft()
+					self.running = self.pcbs[self.ready_queue.popleft()]
 					return
 
 			# if currently waiting		
 			if self.running.waiting:
 				self.running.runtime = 0
 				if self.ready_queue:
-					self.running = self.ready_queue.popleft()
+					self.running = self.pcbs[self.ready_queue.popleft()]
 				else:
 					self.running = self.idle_pcb
 
 			# if currently exiting
 			if self.running.exiting:
 				if self.ready_queue:
-					self.running = self.ready_queue.popleft()
+					self.running = self.pcbs[self.ready_queue.popleft()]
 				else:
 					self.running = self.idle_pcb
 				return
 
-			# elapsed time >= 40ms
-			if self.running.runtime >= 40:
-				self.ready_queue.append(self.running)
+			# elapsed time >= quantum (40us by default)
+			if self.running.runtime >= self.rr_quantum:
+				self.ready_queue.append(self.running.pid)
 				self.running.runtime = 0
-				self.running = self.ready_queue.popleft()
+				self.running = self.pcbs[self.ready_queue.popleft()]
 				return
+
+		elif self.scheduling_algorithm == "Fair":
+			if self.running.pid:
+				if self.running.exiting or self.running.waiting:
+					self.fair_load -= fair_weight(self.running.priority)
+				elif not self.ready_queue or not self.fair_should_preempt():
+					return
+				else:
+					self.ready_queue.append(self.running.pid) # it may well be picked again
+			self.running = self.pcbs[self.ready_queue.popleft()] if self.ready_queue else self.idle_pcb
+			self.running.runtime = 0
+			self.update_min_vruntime()
+
+		elif self.scheduling_algorithm == "MLFQ":
+			if self.running.pid and not self.running.exiting and not self.running.waiting:
+				level = self.running.level
+				if self.level_policies[level] == "RR" and self.running.runtime >= self.level_quanta[level]:
+					# used up its quantum: moves down a level, and to the back of it
+					self.running.level = min(level + 1, len(self.level_policies) - 1)
+					self.running.runtime = 0
+					self.levels[self.running.level].append(self.running.pid)
+				elif self.levels.occupied & ((1 << level) - 1):
+					# a higher level has work: resumes first on its own level once that runs again
+					self.levels[level].appendleft(self.running.pid)
+				else:
+					return
+			# a waiting process keeps the time it used on its level, so giving up the CPU just before the quantum ends does not
+			# keep it at the top
+			level = self.levels.highest()
+			self.running = self.idle_pcb if level is None else self.pcbs[self.levels[level].popleft()]
 		
 					
 	# This method is triggered when the currently running process requests to initialize a new semaphore.
@@ -244,7 +516,7 @@ class Kernel:
 	def syscall_semaphore_p(self, semaphore_id: int) -> PID:
 		# might need to wait
 		if self.semaphores[semaphore_id] <= 0:
-			heapq.heappush(self.waiting_queues[semaphore_id], (self.sem_key(self.running), self.running))
+			heapq.heappush(self.waiting_queues[semaphore_id], (self.sem_key(self.running), self.running.pid))
 			self.running.waiting = True
    
 		# update semaphore value
@@ -259,15 +531,15 @@ class Kernel:
 	def syscall_semaphore_v(self, semaphore_id: int) -> PID:
 		# might need to wake up waiting process
 		if self.waiting_queues[semaphore_id]:
-			_, pcb = heapq.heappop(self.waiting_queues[semaphore_id])
-			pcb.waiting = False
-			self.ready_queue.append(pcb)
+			_, pid = heapq.heappop(self.waiting_queues[semaphore_id])
+			self.pcbs[pid].waiting = False
+			self.wake_up(pid)
    
 		# update semaphore value
 		self.semaphores[semaphore_id] += 1
   
-		# if priority, might need context switch
-		if self.scheduling_algorithm == "Priority":
+		# if priority, fair or MLFQ, the woken process might preempt
+		if self.scheduling_algorithm == "Priority" or self.scheduling_algorithm == "Fair" or self.scheduling_algorithm == "MLFQ":
 			self.choose_next_process()
 		
 		return self.running.pid
@@ -276,7 +548,7 @@ class Kernel:
 	# DO NOT rename or delete this method. DO NOT change its arguments.
 	def syscall_init_mutex(self, mutex_id: int):
 		self.mutexes[mutex_id] = 1
-		self.waiting_queues[mutex_id] = []
+		self.mutex_waiting_queues[mutex_id] = []
 		return
 
 	# This method is triggered when the currently running process calls lock() on an existing mutex.
@@ -284,8 +556,13 @@ class Kernel:
 	def syscall_mutex_lock(self, mutex_id: int) -> PID:
 		# might need to wait
 		if self.mutexes[mutex_id] <= 0:
-			heapq.heappush(self.waiting_queues[mutex_id], (self.mut_key(self.running), self.running))
+			heapq.heappush(self.mutex_waiting_queues[mutex_id], (self.mut_key(self.running), self.running.pid))
 			self.running.waiting = True
+			if self.priority_inheritance:
+				self.blocked_mutex[self.running.pid] = mutex_id
+				self.inherit_priority(self.mutex_owners.get(mutex_id), self.running.priority)
+		elif self.priority_inheritance:
+			self.take_mutex(mutex_id, self.running.pid)
 
 		# update mutex value
 		self.mutexes[mutex_id] -= 1
@@ -297,64 +574,329 @@ class Kernel:
 	# This method is triggered when the currently running process calls unlock() on an existing mutex.
 	# DO NOT rename or delete this method. DO NOT change its arguments.
 	def syscall_mutex_unlock(self, mutex_id: int) -> PID:
+		if self.priority_inheritance:
+			self.release_mutex(mutex_id)
+
 		# might need to wake up waiting process
-		if self.waiting_queues[mutex_id]:
-			_, pcb = heapq.heappop(self.waiting_queues[mutex_id])
-			pcb.waiting = False
-			self.ready_queue.append(pcb)
+		if self.mutex_waiting_queues[mutex_id]:
+			_, pid = heapq.heappop(self.mutex_waiting_queues[mutex_id])
+			self.pcbs[pid].waiting = False
+			if self.priority_inheritance:
+				# the woken process now holds the mutex, and inherits from the processes still waiting for it
+				del self.blocked_mutex[pid]
+				self.take_mutex(mutex_id, pid)
+			self.wake_up(pid)
 
 		# update mutex value
 		self.mutexes[mutex_id] += 1
   
-		# if priority, might need context switch
-		if self.scheduling_algorithm == "Priority":
+		# if priority, fair or MLFQ, the woken process might preempt
+		if self.scheduling_algorithm == "Priority" or self.scheduling_algorithm == "Fair" or self.scheduling_algorithm == "MLFQ":
 			self.choose_next_process()
   
 		return self.running.pid
 
 	# This function represents the hardware timer interrupt.
-	# It is triggered every 10 microseconds and is the only way a kernel can track passing time.
+	# It is triggered every timer_interval (10 by default) microseconds and is the only way a kernel can track passing time.
 	# Do not use real time to track how much time has passed as time is simulated.
 	# DO NOT rename or delete this method. DO NOT change its arguments.
 	def timer_interrupt(self) -> PID:
 		# for debugging only
 		# self.logger.log("Timer interrupt")
 		# self.logger.log(f"s0: {self.semaphores}")
-		self.level_runtime += 10
-		self.running.runtime += 10
+		self.level_runtime += self.timer_interval
+		self.running.runtime += self.timer_interval
   
-		if self.scheduling_algorithm == "Multilevel" and self.level_runtime >= 200: # can do a switch if needed
+		if self.scheduling_algorithm == "Multilevel" and self.level_runtime >= self.level_slice: # can do a switch if needed
 			self.level_runtime = 0
-			self.logger.log(
-				f"FGQ: {[pcb.pid for pcb in self.foreground_queue]}  "
-				f"-- BGQ: {[pcb.pid for pcb in self.background_queue]}"
-			)
-			if self.running.process_type == "Foreground" and len(self.background_queue) != 0:
-				self.logger.log(f'Time is: {self.level_runtime} and we are switching to BG')
-				self.logger.log(f'running: {self.running.pid} time: {self.running.runtime}')
-				#self.running.runtime = 0
-				self.logger.log(f'pausing: {self.running.pid} with runtime: {self.running.runtime}')
-				
-				if self.running.runtime >= 40:
+			if self.log_enabled:
+				self.logger.log(self.level_dump())
+			level = self.running.level
+			next_level = self.levels.next_after(level) if self.running.pid else None
+			if next_level is not None and next_level != level:
+				if self.log_enabled:
+					self.logger.log(f'Time is: {self.level_runtime} and we are switching to {self.level_names[next_level][0]}')
+					if self.level_policies[level] == "RR":
+						self.logger.log(f'running: {self.running.pid} time: {self.running.runtime}')
+						self.logger.log(f'pausing: {self.running.pid} with runtime: {self.running.runtime}')
+
+				# a process that used up its quantum goes to the back of its level, otherwise it resumes first on the level's next turn
+				if self.level_policies[level] == "RR" and self.running.runtime >= self.rr_quantum:
 					self.running.runtime = 0
-					self.foreground_queue.append(self.running)
+					self.levels[level].append(self.running.pid)
 				else:
-					self.foreground_queue.appendleft(self.running)
-				self.ready_queue = self.background_queue
-				self.running = self.ready_queue.popleft()
-				self.multilevel_scheduling_algorithm = "FCFS"
-    
-			elif self.running.process_type == "Background" and len(self.foreground_queue) != 0:
-				self.logger.log(f'Time is: {self.level_runtime} and we are switching to FG')
-				self.background_queue.appendleft(self.running)
-				self.ready_queue = self.foreground_queue
-				self.running = self.ready_queue.popleft()
-				self.logger.log(f'Currently running {self.running.pid}')
-				self.multilevel_scheduling_algorithm = "RR"
-			
+					self.levels[level].appendleft(self.running.pid)
+				self.set_level(next_level)
+				self.running = self.pcbs[self.ready_queue.popleft()]
+				if self.log_enabled and self.level_policies[next_level] == "RR":
+					self.logger.log(f'Currently running {self.running.pid}')
 
-		
 		if self.scheduling_algorithm == "RR" or self.multilevel_scheduling_algorithm == "RR":
 			self.choose_next_process()
+		elif self.scheduling_algorithm == "Fair":
+			self.charge_vruntime(self.timer_interval)
+			self.choose_next_process()
+		elif self.scheduling_algorithm == "MLFQ":
+			self.boost_runtime += self.timer_interval
+			if self.boost_runtime >= self.boost_interval:
+				self.boost()
+			self.choose_next_process()
    
-		return self.running.pid
\ No newline at end of file
+		return self.running.pid
+
+	# A process woken from a semaphore or mutex joins the ready queue.
+	def wake_up(self, pid: PID):
+		if self.scheduling_algorithm == "Fair":
+			# a process that slept keeps what it was owed, but gets at most half a latency period of credit over the others
+			credit = self.fair_latency // 2 * FAIR_SCALE // FAIR_WEIGHTS[20]
+			self.fair_enqueue(pid, max(self.pcbs[pid].vruntime, self.min_vruntime - credit))
+		elif self.scheduling_algorithm == "Multilevel" or self.scheduling_algorithm == "MLFQ":
+			self.levels[self.pcbs[pid].level].append(pid)
+		else:
+			self.ready_queue.append(pid)
+
+	# The ready processes of every level, for the student log.
+	def level_dump(self) -> str:
+		return "  -- ".join(f"{short_name}Q: {list(queue)}" for (short_name, _), queue in zip(self.level_names, self.levels.queues))
+
+	# Multilevel: it is level's turn.
+	def set_level(self, level: int):
+		self.ready_queue = self.levels[level]
+		self.multilevel_scheduling_algorithm = self.level_policies[level]
+
+	# MLFQ: every process goes back to the top level with a fresh quantum, the queued ones in level order.
+	def boost(self):
+		self.boost_runtime = 0
+		top = self.levels[0]
+		for queue in self.levels.queues[1:]:
+			while queue:
+				top.append(queue.popleft())
+		for pid in top:
+			self.pcbs[pid].level = 0
+			self.pcbs[pid].runtime = 0
+		self.running.level = 0
+		self.running.runtime = 0
+		# as do those waiting on a semaphore or mutex
+		for pcb in self.pcbs.values():
+			if pcb.waiting:
+				pcb.level = 0
+				pcb.runtime = 0
+
+	# Fair: pid becomes ready with the given vruntime.
+	def fair_enqueue(self, pid: PID, vruntime: int):
+		pcb = self.pcbs[pid]
+		pcb.vruntime = vruntime
+		self.fair_load += fair_weight(pcb.priority)
+		self.ready_queue.append(pid)
+
+	# Fair: how long the running process may run before the next ready process gets a turn.
+	# Every ready process gets a share of fair_latency proportional to its weight, but at least fair_granularity.
+	def fair_timeslice(self) -> int:
+		return max(self.fair_latency * fair_weight(self.running.priority) // self.fair_load, self.fair_granularity)
+
+	# Fair: how far the running process's vruntime may get ahead of the next ready process's before it is preempted.
+	def fair_wakeup_margin(self) -> int:
+		next_process = self.pcbs[self.ready_queue.peek()]
+		return next_process.vruntime + self.fair_granularity * FAIR_SCALE // fair_weight(next_process.priority) - self.running.vruntime
+
+	# Fair: the running process has used up its timeslice, or the next ready process is far enough behind it.
+	def fair_should_preempt(self) -> bool:
+		return self.running.runtime >= self.fair_timeslice() or self.fair_wakeup_margin() < 0
+
+	# Fair: adds elapsed microseconds (a whole number of timer intervals) of running time to the running process's vruntime.
+	# The vruntime grows by the same amount per interrupt whether or not interrupts are skipped.
+	def charge_vruntime(self, elapsed: int):
+		if self.running.pid:
+			self.running.vruntime += elapsed // self.timer_interval * self.vruntime_per_interrupt()
+			self.update_min_vruntime()
+
+	def vruntime_per_interrupt(self) -> int:
+		return self.timer_interval * FAIR_SCALE // fair_weight(self.running.priority)
+
+	def update_min_vruntime(self):
+		vruntime = None
+		if self.running.pid and not self.running.exiting and not self.running.waiting:
+			vruntime = self.running.vruntime
+		if self.ready_queue:
+			queued = self.pcbs[self.ready_queue.peek()].vruntime
+			vruntime = queued if vruntime is None else min(vruntime, queued)
+		if vruntime is not None and vruntime > self.min_vruntime:
+			self.min_vruntime = vruntime
+
+	# Priority inheritance: pid now holds the mutex.
+	def take_mutex(self, mutex_id: int, pid: PID):
+		self.mutex_owners[mutex_id] = pid
+		self.held_mutexes.setdefault(pid, set()).add(mutex_id)
+		waiters = self.mutex_waiting_queues[mutex_id]
+		if waiters:
+			self.inherit_priority(pid, waiters[0][0])
+
+	# Priority inheritance: the mutex's holder lets go of it and drops any priority it inherited through it.
+	# Works whoever unlocks the mutex, since the simulator does not require the holder to be the one unlocking it.
+	def release_mutex(self, mutex_id: int):
+		owner = self.mutex_owners.pop(mutex_id, None)
+		if owner is None:
+			return
+		held = self.held_mutexes[owner]
+		held.discard(mutex_id)
+		if not held:
+			del self.held_mutexes[owner]
+		if owner in self.base_priorities:
+			self.set_own_priority(owner, self.base_priorities[owner])
+
+	# Raises pid to priority if that is higher than its current one. If pid is itself waiting for a mutex,
+	# the raise is passed on to that mutex's holder, and so on down the chain of holders.
+	def inherit_priority(self, pid: PID | None, priority: int):
+		while pid is not None and pid in self.pcbs:
+			pcb = self.pcbs[pid]
+			if pcb.priority <= priority:
+				return
+			self.base_priorities.setdefault(pid, pcb.priority)
+			pcb.priority = priority
+			self.priority_changed(pid)
+			mutex_id = self.blocked_mutex.get(pid)
+			if mutex_id is None:
+				return
+			pid = self.mutex_owners.get(mutex_id)
+
+	# Sets the priority pid has of its own, and gives it the highest of that and the priorities of the waiters of the mutexes it holds.
+	# A priority that drops is also dropped down the chain of holders pid is waiting on.
+	def set_own_priority(self, pid: PID, own_priority: int):
+		priority = own_priority
+		for mutex_id in self.held_mutexes.get(pid, ()):
+			waiters = self.mutex_waiting_queues[mutex_id]
+			if waiters and waiters[0][0] < priority:
+				priority = waiters[0][0]
+		if priority < own_priority:
+			self.base_priorities[pid] = own_priority
+		else:
+			self.base_priorities.pop(pid, None)
+
+		pcb = self.pcbs[pid]
+		dropped = priority > pcb.priority
+		pcb.priority = priority
+		self.priority_changed(pid)
+		mutex_id = self.blocked_mutex.get(pid)
+		if dropped and mutex_id is not None:
+			owner = self.mutex_owners.get(mutex_id)
+			if owner in self.base_priorities:
+				self.set_own_priority(owner, self.base_priorities[owner])
+
+	# Moves pid to its new priority in whichever queue it is in: a ready queue, or the waiting queue of a mutex.
+	def priority_changed(self, pid: PID):
+		for ready_heap in self.ready_heaps:
+			ready_heap.reprioritize(pid)
+		mutex_id = self.blocked_mutex.get(pid)
+		if mutex_id is not None:
+			waiters = self.mutex_waiting_queues[mutex_id]
+			for i, (_, waiter) in enumerate(waiters):
+				if waiter == pid:
+					waiters[i] = (self.pcbs[pid].priority, pid)
+					heapq.heapify(waiters)
+					break
+
+	# SMP only: the number of processes waiting to run on this CPU.
+	def ready_count(self) -> int:
+		if self.scheduling_algorithm == "Multilevel":
+			return len(self.levels)
+		return len(self.ready_queue)
+
+	# SMP only: takes the process that would run next off this CPU's run queue so an idle CPU can run it instead.
+	# Returns None if nothing is waiting.
+	def steal_process(self) -> PID | None:
+		if self.scheduling_algorithm == "Multilevel" or self.scheduling_algorithm == "MLFQ":
+			queue = self.levels[self.levels.highest()] if self.levels else None
+		else:
+			queue = self.ready_queue
+		if not queue:
+			return None
+		pid = queue.popleft()
+		if self.scheduling_algorithm == "Fair":
+			# vruntimes only compare within a CPU, so the process leaves with its lead over this CPU's min_vruntime
+			self.pcbs[pid].vruntime -= self.min_vruntime
+			self.fair_load -= fair_weight(self.pcbs[pid].priority)
+		return pid
+
+	# SMP only: with priority inheritance another CPU can raise the priority of a process in this CPU's run queue
+	# (or lower that of the process running here). Switches to the highest priority ready process if it now outranks
+	# the running one, like a reschedule interrupt would, and returns its PID. Returns None if nothing changes.
+	def priority_preemption(self) -> PID | None:
+		if not self.priority_inheritance or not self.running.pid or not self.ready_queue:
+			return None
+		if self.pcbs[self.ready_queue.peek()].priority >= self.running.priority:
+			return None
+		self.choose_next_process()
+		return self.running.pid
+
+	# SMP only: a process stolen from another CPU (see steal_process) joins this CPU's run queue.
+	def process_migrated(self, pid: PID) -> PID:
+		pcb = self.pcbs[pid]
+		pcb.runtime = 0
+		if self.scheduling_algorithm == "Multilevel" or self.scheduling_algorithm == "MLFQ":
+			self.levels[pcb.level].append(pid)
+		elif self.scheduling_algorithm == "Fair":
+			self.fair_enqueue(pid, pcb.vruntime + self.min_vruntime)
+		else:
+			self.ready_queue.append(pid)
+		self.choose_next_process()
+		return self.running.pid
+
+	# Optional tickless mode: the simulator calls this after every syscall, arrival and delivered interrupt.
+	# Returns how many microseconds of timer interrupts may pass before one of them can change what runs (or log something),
+	# or None if no timer interrupt can until the next syscall or arrival.
+	# Interrupts before that point are not delivered; their time is handed to advance_timer instead.
+	def next_timer_deadline(self) -> int | None:
+		if self.scheduling_algorithm == "Fair":
+			if not self.running.pid or not self.ready_queue:
+				return None
+			# the first interrupt at which the timeslice is used up or the vruntime margin goes negative
+			interrupts = max(self.fair_wakeup_margin() // self.vruntime_per_interrupt() + 1, 1)
+			return min(self.timer_time_until(self.running.runtime, self.fair_timeslice()), interrupts * self.timer_interval)
+
+		if self.scheduling_algorithm == "MLFQ":
+			if not self.running.pid:
+				return None # boosting only the waiting processes can wait, see advance_timer
+			deadline = self.timer_time_until(self.boost_runtime, self.boost_interval)
+			if self.level_policies[self.running.level] == "RR":
+				deadline = min(deadline, self.timer_time_until(self.running.runtime, self.level_quanta[self.running.level]))
+			return deadline
+
+		deadline = None
+		if self.scheduling_algorithm == "Multilevel":
+			deadline = self.timer_time_until(self.level_runtime, self.level_slice)
+			queued = len(self.levels)
+		else:
+			queued = len(self.ready_queue)
+
+		if self.scheduling_algorithm == "RR" or self.multilevel_scheduling_algorithm == "RR":
+			if self.running.pid:
+				quantum_deadline = self.timer_time_until(self.running.runtime, self.rr_quantum)
+			elif queued:
+				# an idle RR kernel picks up a waiting process on its next interrupt
+				quantum_deadline = self.timer_interval
+			else:
+				quantum_deadline = None
+
+			if deadline is None or (quantum_deadline is not None and quantum_deadline < deadline):
+				deadline = quantum_deadline
+
+		return deadline
+
+	# Accounts for elapsed microseconds of timer interrupts skipped in tickless mode.
+	# Never crosses a deadline returned by next_timer_deadline, so only the counters need updating.
+	def advance_timer(self, elapsed: int):
+		self.level_runtime += elapsed
+		self.running.runtime += elapsed
+		if self.scheduling_algorithm == "Fair":
+			self.charge_vruntime(elapsed)
+		elif self.scheduling_algorithm == "MLFQ":
+			# only while idle can this pass a boost, which then just has to happen before anything wakes
+			self.boost_runtime += elapsed
+			if self.boost_runtime >= self.boost_interval:
+				since_boost = self.boost_runtime % self.timer_time_until(0, self.boost_interval)
+				self.boost()
+				self.boost_runtime = since_boost
+
+	# Timer time needed for a counter that grows by timer_interval per interrupt to reach limit (at least one interrupt).
+	def timer_time_until(self, runtime: int, limit: int) -> int:
+		return max(-(-(limit - runtime) // self.timer_interval) * self.timer_interval, self.timer_interval)
\ No newline at end of file
@@ -0,0 +1,317 @@
+from bisect import bisect_left, insort
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+import csv
+import json
+import math
+import os
+
+MICRO_S = int
+PID = int
+
+SUMMARY_SUFFIX = ".summary.json"
+
+# States of a process as seen by the collector.
+READY = 0
+RUNNING = 1
+BLOCKED = 2
+
+# Resource kinds a process can block on.
+SEMAPHORE = "semaphore"
+MUTEX = "mutex"
+
+ROW_FIELDS = ["pid", "arrival", "first_dispatch", "completion", "turnaround", "response", "ready_wait", "blocked", "dispatches", "blocked_on"]
+
+# Counts non-negative integers in logarithmic buckets so percentiles can be estimated in constant memory.
+# Values below 64 are exact; larger ones are rounded down to their top 6 bits (under 2% error).
+class Histogram:
+    counts: dict[int, int]
+    count: int
+    total: int
+    max: int
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value: int):
+        shift = max(value.bit_length() - 6, 0)
+        bucket = value >> shift << shift
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    # Adds many values at once, sorting values in place. Much cheaper per value than add:
+    # after the sort it only does Python work once per distinct bucket.
+    def add_all(self, values: list[int]):
+        if not values:
+            return
+        values.sort()
+        self.count += len(values)
+        self.total += sum(values)
+        if values[-1] > self.max:
+            self.max = values[-1]
+        i = 0
+        while i < len(values):
+            shift = max(values[i].bit_length() - 6, 0)
+            bucket = values[i] >> shift << shift
+            end = bisect_left(values, bucket + (1 << shift), i)
+            self.counts[bucket] = self.counts.get(bucket, 0) + end - i
+            i = end
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    # Nearest-rank percentile, e.g. fraction=0.99 for p99.
+    def percentile(self, fraction: float) -> int:
+        rank = max(math.ceil(fraction * self.count), 1)
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return bucket
+        return 0
+
+    def summary(self) -> dict:
+        return {"mean": self.mean(), "p50": self.percentile(0.5), "p99": self.percentile(0.99), "max": self.max}
+
+@dataclass(slots=True)
+class ProcessMetrics:
+    arrival: MICRO_S
+    state: int = READY
+    # When the process entered its current state.
+    since: MICRO_S = 0
+    first_dispatch: MICRO_S | None = None
+    ready_wait: MICRO_S = 0
+    dispatches: int = 0
+    # The resource the process is blocked on while state is BLOCKED.
+    blocked_resource: tuple[str, int] | None = None
+    blocked_on: dict[tuple[str, int], MICRO_S] = field(default_factory=dict)
+    # The process's own priority (lower is higher), as given on arrival or by set_priority.
+    priority: int = 0
+
+# Keeps scheduling metrics up to date as the simulation runs, with constant work per event.
+# The simulator reports arrivals, context switches, syscalls that blocked the caller, releases and exits.
+# Each process's row is written when it exits and then forgotten, so memory only grows with the number of live processes.
+#
+# The kernel does not say which waiter a v or unlock wakes, only that it wakes one if any are waiting.
+# A blocked process therefore ends its wait at the oldest wake-up on its resource that has not been claimed yet, when it is next dispatched.
+# That is exact whenever at most one woken process is waiting to run per resource; otherwise totals stay exact
+# but blocked time may be shifted between those processes (and into their ready wait).
+#
+# Priority inversion time is CPU time spent running a process while a process of higher priority is blocked on a mutex,
+# counted once per such blocked process, from the moment it blocks until it runs again. Priorities are the processes' own;
+# a holder running at an inherited priority still counts, so with priority inheritance only the holders' critical sections remain.
+class MetricsCollector:
+    processes: dict[PID, ProcessMetrics]
+    # Processes blocked on each resource that have not been woken yet.
+    blocked_counts: dict[tuple[str, int], int]
+    # Times of wake-ups on each resource not yet claimed by a dispatched process.
+    wake_times: dict[tuple[str, int], deque[MICRO_S]]
+    cpus: int
+    # Running process and start of the current idle period of each CPU.
+    running: list[PID]
+    idle_since: list[MICRO_S]
+    # Idle time summed over all CPUs.
+    idle_time: MICRO_S
+    context_switches: int
+    end_time: MICRO_S
+    # Sorted priorities of the processes blocked on a mutex that have not run since.
+    mutex_waiters: list[int]
+    inversion_time: MICRO_S
+    # Time up to which inversion_time has been counted.
+    inversion_since: MICRO_S
+
+    def __init__(self, rows_path: Path | None = None, cpus: int = 1):
+        self.processes = {}
+        self.blocked_counts = {}
+        self.wake_times = {}
+        self.cpus = cpus
+        self.running = [0] * cpus
+        self.idle_since = [0] * cpus
+        self.idle_time = 0
+        self.context_switches = 0
+        self.end_time = 0
+        self.mutex_waiters = []
+        self.inversion_time = 0
+        self.inversion_since = 0
+        self.turnaround = Histogram()
+        self.response = Histogram()
+        self.ready_wait = Histogram()
+        self.blocked = Histogram()
+
+        self.rows_path = None if rows_path is None else os.path.abspath(rows_path)
+        self.rows_file = None
+        self.csv_writer = None
+        if rows_path is not None:
+            self.rows_file = open(self.rows_path, 'w', newline='')
+            if Path(rows_path).suffix == ".csv":
+                self.csv_writer = csv.writer(self.rows_file)
+                self.csv_writer.writerow(ROW_FIELDS)
+
+    # Like the logs, a pickled collector remembers how far its rows were written and continues from there when unpickled.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["rows_offset"] = None
+        if self.rows_file is not None:
+            self.rows_file.flush()
+            state["rows_offset"] = self.rows_file.tell()
+        del state["rows_file"], state["csv_writer"]
+        return state
+
+    def __setstate__(self, state: dict):
+        rows_offset = state.pop("rows_offset")
+        self.__dict__.update(state)
+        self.rows_file = None
+        self.csv_writer = None
+        if rows_offset is not None:
+            self.rows_file = open(self.rows_path, 'r+', newline='')
+            self.rows_file.truncate(rows_offset)
+            self.rows_file.seek(rows_offset)
+            if Path(self.rows_path).suffix == ".csv":
+                self.csv_writer = csv.writer(self.rows_file)
+
+    def arrival(self, time: MICRO_S, pid: PID, priority: int = 0):
+        self.processes[pid] = ProcessMetrics(time, READY, time, priority=priority)
+
+    # The running process pid set its own priority. Must be reported before the kernel is told.
+    def priority_changed(self, time: MICRO_S, pid: PID, priority: int):
+        self.count_inversion(time)
+        self.processes[pid].priority = priority
+
+    # Adds the inversion time since the last event. Called before anything it depends on changes.
+    def count_inversion(self, time: MICRO_S):
+        if self.mutex_waiters:
+            inverted = 0
+            for pid in self.running:
+                running = self.processes.get(pid)
+                if running is not None:
+                    inverted += bisect_left(self.mutex_waiters, running.priority)
+            self.inversion_time += (time - self.inversion_since) * inverted
+        self.inversion_since = time
+
+    def switch(self, time: MICRO_S, pid: PID, cpu: int = 0):
+        self.count_inversion(time)
+        previous = self.processes.get(self.running[cpu])
+        if previous is not None and previous.state == RUNNING:
+            previous.state = READY
+            previous.since = time
+        elif self.running[cpu] == 0:
+            self.idle_time += time - self.idle_since[cpu]
+
+        self.running[cpu] = pid
+        self.context_switches += 1
+        if pid == 0:
+            self.idle_since[cpu] = time
+            return
+
+        process = self.processes[pid]
+        if process.state == BLOCKED:
+            resource = process.blocked_resource
+            if resource[0] == MUTEX:
+                del self.mutex_waiters[bisect_left(self.mutex_waiters, process.priority)]
+            woken = self.wake_times[resource].popleft()
+            process.blocked_on[resource] = process.blocked_on.get(resource, 0) + woken - process.since
+            process.ready_wait += time - woken
+            process.blocked_resource = None
+        else:
+            process.ready_wait += time - process.since
+        if process.first_dispatch is None:
+            process.first_dispatch = time
+        process.dispatches += 1
+        process.state = RUNNING
+        process.since = time
+
+    # pid called p or lock on the resource and the kernel switched away from it. Must be reported before the switch.
+    def blocked_on(self, time: MICRO_S, pid: PID, kind: str, id: int):
+        process = self.processes[pid]
+        resource = (kind, id)
+        if kind == MUTEX:
+            self.count_inversion(time)
+            insort(self.mutex_waiters, process.priority)
+        process.state = BLOCKED
+        process.since = time
+        process.blocked_resource = resource
+        self.blocked_counts[resource] = self.blocked_counts.get(resource, 0) + 1
+
+    # Someone called v or unlock on the resource, which wakes one of its waiters if it has any.
+    def released(self, time: MICRO_S, kind: str, id: int):
+        resource = (kind, id)
+        if self.blocked_counts.get(resource, 0) > 0:
+            self.blocked_counts[resource] -= 1
+            self.wake_times.setdefault(resource, deque()).append(time)
+
+    # Must be reported before the switch away from the exiting process.
+    def exit(self, time: MICRO_S, pid: PID):
+        self.count_inversion(time)
+        process = self.processes.pop(pid)
+        self.turnaround.add(time - process.arrival)
+        self.response.add(process.first_dispatch - process.arrival)
+        self.ready_wait.add(process.ready_wait)
+        self.blocked.add(sum(process.blocked_on.values()))
+        self.write_row(pid, process, time)
+
+    def write_row(self, pid: PID, process: ProcessMetrics, completion: MICRO_S | None):
+        if self.rows_file is None:
+            return
+        row = {
+            "pid": pid,
+            "arrival": process.arrival,
+            "first_dispatch": process.first_dispatch,
+            "completion": completion,
+            "turnaround": None if completion is None else completion - process.arrival,
+            "response": None if process.first_dispatch is None else process.first_dispatch - process.arrival,
+            "ready_wait": process.ready_wait,
+            "blocked": sum(process.blocked_on.values()),
+            "dispatches": process.dispatches,
+            "blocked_on": {f"{kind} {id}": time for (kind, id), time in process.blocked_on.items()},
+        }
+        if self.csv_writer is not None:
+            row["blocked_on"] = ";".join(f"{resource}={time}" for resource, time in row["blocked_on"].items())
+            self.csv_writer.writerow(["" if row[name] is None else row[name] for name in ROW_FIELDS])
+        else:
+            self.rows_file.write(json.dumps(row) + "\n")
+
+    # Ends the collection at the given simulated time. Processes that never finished get a row without a completion time.
+    def finish(self, time: MICRO_S):
+        self.count_inversion(time)
+        self.end_time = time
+        for cpu in range(self.cpus):
+            if self.running[cpu] == 0:
+                self.idle_time += time - self.idle_since[cpu]
+                self.idle_since[cpu] = time
+        for pid, process in self.processes.items():
+            self.write_row(pid, process, None)
+        if self.rows_file is not None:
+            self.rows_file.close()
+            self.rows_file = None
+
+    def summary(self) -> dict:
+        cpu_time = self.end_time * self.cpus
+        busy_time = cpu_time - self.idle_time
+        return {
+            "simulated_us": self.end_time,
+            "cpus": self.cpus,
+            "completed": self.turnaround.count,
+            "unfinished": len(self.processes),
+            "busy_us": busy_time,
+            "idle_us": self.idle_time,
+            "cpu_utilization": busy_time / cpu_time if cpu_time else 0.0,
+            "throughput_per_s": self.turnaround.count * 1000000 / self.end_time if self.end_time else 0.0,
+            "context_switches": self.context_switches,
+            "priority_inversion_us": self.inversion_time,
+            "turnaround_us": self.turnaround.summary(),
+            "response_us": self.response.summary(),
+            "ready_wait_us": self.ready_wait.summary(),
+            "blocked_us": self.blocked.summary(),
+        }
+
+    def write_summary(self, path: Path):
+        with open(path, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+            file.write("\n")
@@ -0,0 +1,156 @@
+from pathlib import Path
+from time import perf_counter_ns
+import cProfile
+
+from metrics import Histogram
+
+# Groups of profiled calls.
+KERNEL = "kernel"
+LOG = "log"
+# Log calls made by the kernel (student logs). Their time is already part of the kernel handler that made them.
+LOG_IN_KERNEL = "log in kernel"
+
+# Durations are buffered and folded into the histogram in batches, which keeps the per-call cost of profiling low.
+BATCH_SIZE = 4096
+
+# Durations of the calls to one method, in nanoseconds.
+class HandlerTimes:
+    histogram: Histogram
+    pending: list[int]
+
+    def __init__(self):
+        self.histogram = Histogram()
+        self.pending = []
+
+    def flush(self):
+        self.histogram.add_all(self.pending)
+        self.pending.clear()
+
+# Wall time of every profiled call, by group and method name, in nanoseconds.
+class Profile:
+    handlers: dict[tuple[str, str], HandlerTimes]
+    in_kernel: bool
+    wall_ns: int
+    # Estimated cost of timing one call of each group, see calibrate_overhead.
+    overhead_ns: dict[str, float]
+
+    def __init__(self):
+        self.handlers = {}
+        self.in_kernel = False
+        self.wall_ns = 0
+        self.overhead_ns = {}
+
+    def times(self, group: str, name: str) -> HandlerTimes:
+        return self.handlers.setdefault((group, name), HandlerTimes())
+
+    def histogram(self, group: str, name: str) -> Histogram:
+        times = self.handlers[(group, name)]
+        times.flush()
+        return times.histogram
+
+    # Number of calls and total nanoseconds spent in a group.
+    def group_total(self, group: str) -> tuple[int, int]:
+        histograms = [self.histogram(*handler) for handler in self.handlers if handler[0] == group]
+        return sum(h.count for h in histograms), sum(h.total for h in histograms)
+
+# Forwards every method call to target while timing it into profile.
+# Wrappers are created on first use and cached on the proxy, so __getattr__ only runs once per method.
+# Nothing is wrapped unless profiling is requested: an unprofiled Simulator calls its kernel and log directly.
+class ProfiledCalls:
+    def __init__(self, target, profile: Profile, group: str):
+        self.target = target
+        self.profile = profile
+        self.group = group
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.target, name)
+        if not callable(attribute):
+            return attribute
+
+        profile = self.profile
+        times = profile.times(self.group, name)
+        if self.group == KERNEL:
+            def timed(*args):
+                profile.in_kernel = True
+                start = perf_counter_ns()
+                try:
+                    return attribute(*args)
+                finally:
+                    times.pending.append(perf_counter_ns() - start)
+                    profile.in_kernel = False
+                    if len(times.pending) >= BATCH_SIZE:
+                        times.flush()
+        else:
+            nested_times = profile.times(LOG_IN_KERNEL, name)
+            def timed(*args):
+                start = perf_counter_ns()
+                try:
+                    return attribute(*args)
+                finally:
+                    duration = perf_counter_ns() - start
+                    call_times = nested_times if profile.in_kernel else times
+                    call_times.pending.append(duration)
+                    if len(call_times.pending) >= BATCH_SIZE:
+                        call_times.flush()
+        setattr(self, name, timed)
+        return timed
+
+# Estimates how many nanoseconds ProfiledCalls adds to each call, by timing calls to an empty method with and without it.
+def calibrate_overhead(group: str, calls: int = 100000) -> float:
+    class Empty:
+        def call(self):
+            pass
+
+    target = Empty()
+    proxy = ProfiledCalls(target, Profile(), group)
+    proxy.call()
+    start = perf_counter_ns()
+    for _ in range(calls):
+        target.call()
+    direct_ns = perf_counter_ns() - start
+    start = perf_counter_ns()
+    for _ in range(calls):
+        proxy.call()
+    return max(perf_counter_ns() - start - direct_ns, 0) / calls
+
+# Runs the simulation with its kernel and log wrapped in ProfiledCalls.
+# If dump_path is given the run is also recorded with cProfile and its pstats written there;
+# cProfile slows every Python call down, so the handler latencies of such a run are inflated.
+def profile_simulation(simulator, dump_path: Path | None = None) -> Profile:
+    profile = Profile()
+    profile.overhead_ns = {group: calibrate_overhead(group) for group in [KERNEL, LOG]}
+    simulator.kernel = ProfiledCalls(simulator.kernel, profile, KERNEL)
+    simulator.simlog = ProfiledCalls(simulator.simlog, profile, LOG)
+    python_profiler = cProfile.Profile() if dump_path is not None else None
+
+    start = perf_counter_ns()
+    if python_profiler is not None:
+        python_profiler.enable()
+    try:
+        simulator.run_simulator()
+    finally:
+        if python_profiler is not None:
+            python_profiler.disable()
+            python_profiler.dump_stats(dump_path)
+        profile.wall_ns = perf_counter_ns() - start
+    return profile
+
+def print_profile(profile: Profile):
+    print(f"{'handler':<36} {'calls':>10} {'total ms':>10} {'p50 us':>8} {'p99 us':>8} {'max us':>9}")
+    histograms = {handler: profile.histogram(*handler) for handler in profile.handlers}
+    for (group, name), histogram in sorted(histograms.items(), key=lambda item: -item[1].total):
+        if histogram.count == 0:
+            continue
+        print(f"{group + '.' + name:<36} {histogram.count:>10} {histogram.total / 1e6:>10.1f} {histogram.percentile(0.5) / 1e3:>8.2f} "
+              f"{histogram.percentile(0.99) / 1e3:>8.2f} {histogram.max / 1e3:>9.2f}")
+
+    kernel_calls, kernel_ns = profile.group_total(KERNEL)
+    log_calls, log_ns = profile.group_total(LOG)
+    nested_calls, _ = profile.group_total(LOG_IN_KERNEL)
+    # The calls' own timing overhead is outside the measured spans, so without this it would be billed to the loop.
+    profiling_ns = int(kernel_calls * profile.overhead_ns.get(KERNEL, 0) + (log_calls + nested_calls) * profile.overhead_ns.get(LOG, 0))
+    loop_ns = max(profile.wall_ns - kernel_ns - log_ns - profiling_ns, 0)
+    print()
+    for label, ns in [("wall", profile.wall_ns), ("kernel", kernel_ns), ("logging", log_ns), ("simulator loop", loop_ns),
+                      ("profiling (est.)", profiling_ns)]:
+        print(f"{label:<16} {ns / 1e6:>10.1f} ms {ns * 100 / max(profile.wall_ns, 1):>6.1f}%")
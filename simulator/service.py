@@ -0,0 +1,393 @@
+from collections import deque
+from multiprocessing.connection import Connection
+from pathlib import Path
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import time
+
+from metrics import MetricsCollector
+import simlog
+from simlog import TextLog
+from simulator import Simulator
+
+# A long-lived local simulation service. Clients connect to a Unix socket and exchange JSON objects, one per line.
+#
+# Requests:
+#   {"op": "run", "id": ID, "description": {...} or "path": PATH, optional "event_driven": false, "student_logs": true,
+#    "log_level": "all", "metrics": false, "overrides": {...}}
+#   {"op": "cancel", "id": ID}
+# Replies, for the job with that id:
+#   {"id": ID, "type": "queued"}, then {"id": ID, "type": "started"}, then any number of {"id": ID, "type": "log", "text": TEXT}
+#   with the log as it is written, and finally one of
+#   {"id": ID, "type": "done", "metrics": SUMMARY or null, "seconds": WALL_TIME}, {"id": ID, "type": "error", "message": TEXT}
+#   or {"id": ID, "type": "cancelled"}.
+#
+# Jobs run on a pool of worker processes that stay up between jobs, so each job only pays for the simulation itself.
+# A worker sends its log in chunks and stops once WINDOW chunks have not been acknowledged; the service acknowledges a chunk
+# once it has been written to the client's socket, so a slow client slows its job down instead of filling memory.
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "simulator-service.sock")
+# Log text sent per chunk, and chunks a worker may have in flight.
+CHUNK_SIZE = 1 << 16
+WINDOW = 8
+# Longest request line accepted; larger descriptions should be sent as a path.
+MAX_REQUEST_SIZE = 1 << 26
+# How long a running job gets to notice it was cancelled before its worker is restarted.
+CANCEL_GRACE_S = 2.0
+
+class JobCancelled(Exception):
+    pass
+
+# Worker side: collects log text into chunks and sends them to the service, waiting for acknowledgements when WINDOW are in flight.
+class ChunkWriter:
+    def __init__(self, connection: Connection, job_key: int):
+        self.connection = connection
+        self.job_key = job_key
+        self.buffer = []
+        self.buffered = 0
+        self.in_flight = 0
+        self.cancelled = False
+
+    def write(self, text: str):
+        if self.cancelled:
+            return
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.cancelled:
+            return
+        if self.buffer:
+            self.connection.send(("log", self.job_key, "".join(self.buffer)))
+            self.buffer.clear()
+            self.buffered = 0
+            self.in_flight += 1
+        while self.in_flight >= WINDOW or self.connection.poll():
+            self.receive()
+
+    def receive(self):
+        kind, job_key = self.connection.recv()
+        if job_key != self.job_key:
+            return # left over from an earlier job
+        if kind == "ack":
+            self.in_flight -= 1
+        elif kind == "cancel":
+            self.cancelled = True
+            raise JobCancelled()
+
+    def close(self):
+        self.flush()
+
+# The text log, streamed to the service instead of written to a file.
+class StreamLog(TextLog):
+    def __init__(self, writer: ChunkWriter, level: int):
+        self.level = level
+        self.path = None
+        self.file = writer
+        self.last_time = None
+        self.prefix = ""
+
+# Runs one job in a worker and returns the metrics summary, if asked for.
+def run_job(connection: Connection, job_key: int, request: dict) -> dict | None:
+    description_path = request.get("path")
+    temporary_path = None
+    if description_path is None:
+        with tempfile.NamedTemporaryFile('w', suffix=".json", delete=False) as file:
+            json.dump(request["description"], file)
+            temporary_path = file.name
+        description_path = temporary_path
+    try:
+        collector = MetricsCollector() if request.get("metrics", False) else None
+        log_level = simlog.LOG_LEVELS[request.get("log_level", "all")]
+        simulator = Simulator(Path(description_path), os.devnull, request.get("student_logs", True), request.get("event_driven", False),
+                              log_level, overrides=request.get("overrides"), metrics=collector)
+        simulator.simlog.close()
+        simulator.simlog = StreamLog(ChunkWriter(connection, job_key), log_level)
+        simulator.run_simulator()
+        return None if collector is None else collector.summary()
+    finally:
+        if temporary_path is not None:
+            os.unlink(temporary_path)
+
+# Body of a worker process: runs jobs as they come until the service closes the connection.
+def worker_main(connection: Connection):
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message[0] != "run":
+            continue # an acknowledgement or cancellation for a job that already ended
+        _, job_key, request = message
+        try:
+            summary = run_job(connection, job_key, request)
+        except JobCancelled:
+            connection.send(("cancelled", job_key))
+        except Exception as e:
+            connection.send(("error", job_key, f"{type(e).__name__}: {e}"))
+        else:
+            connection.send(("done", job_key, summary))
+
+class Client:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.jobs = {}
+
+class Job:
+    def __init__(self, key: int, client: Client, id, request: dict):
+        self.key = key
+        self.client = client
+        self.id = id
+        self.request = request
+        self.worker = None
+        self.started = 0.0
+
+class Worker:
+    def __init__(self, process: multiprocessing.Process, connection: Connection):
+        self.process = process
+        self.connection = connection
+        self.job = None
+
+class SimulationService:
+    def __init__(self, workers: int, socket_path: str = DEFAULT_SOCKET):
+        self.socket_path = socket_path
+        self.worker_count = workers
+        self.workers = []
+        self.pending = deque()
+        self.next_key = 0
+        self.loop = None
+
+    def start_worker(self) -> Worker:
+        connection, worker_connection = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=worker_main, args=(worker_connection,), daemon=True)
+        process.start()
+        worker_connection.close()
+        worker = Worker(process, connection)
+        self.workers.append(worker)
+        self.loop.add_reader(connection.fileno(), self.worker_readable, worker)
+        return worker
+
+    def stop_worker(self, worker: Worker):
+        self.loop.remove_reader(worker.connection.fileno())
+        self.workers.remove(worker)
+        worker.connection.close()
+        if worker.process.is_alive():
+            worker.process.terminate()
+        worker.process.join()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        for _ in range(self.worker_count):
+            self.start_worker()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self.handle_client, self.socket_path, limit=MAX_REQUEST_SIZE)
+        print(f"Serving on {self.socket_path} with {self.worker_count} workers")
+        serving = asyncio.current_task()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, serving.cancel)
+        try:
+            async with server:
+                await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            for worker in list(self.workers):
+                self.stop_worker(worker)
+            os.unlink(self.socket_path)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = Client(writer)
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    self.handle_request(client, request)
+                except (ValueError, KeyError, TypeError) as e:
+                    self.send(client, {"id": None, "type": "error", "message": f"Bad request: {e}"})
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            for job in list(client.jobs.values()):
+                self.cancel(job, reply=False)
+            writer.close()
+
+    def handle_request(self, client: Client, request: dict):
+        if not isinstance(request, dict):
+            raise ValueError("a request must be a JSON object")
+        id = request.get("id")
+        if request["op"] == "run":
+            if id in client.jobs:
+                raise ValueError(f"job {id} is already running")
+            if ("description" in request) == ("path" in request):
+                raise ValueError("a run needs either a description or a path")
+            if request.get("log_level", "all") not in simlog.LOG_LEVELS:
+                raise ValueError(f"unknown log level {request['log_level']}")
+            job = Job(self.next_key, client, id, request)
+            self.next_key += 1
+            client.jobs[id] = job
+            self.pending.append(job)
+            self.send(client, {"id": id, "type": "queued"})
+            self.dispatch()
+        elif request["op"] == "cancel":
+            job = client.jobs.get(id)
+            if job is None:
+                raise ValueError(f"no job {id}")
+            self.cancel(job)
+        else:
+            raise ValueError(f"unknown op {request['op']}")
+
+    def dispatch(self):
+        for worker in self.workers:
+            if not self.pending:
+                return
+            if worker.job is None:
+                job = self.pending.popleft()
+                job.worker = worker
+                job.started = time.perf_counter()
+                worker.job = job
+                fields = {key: value for key, value in job.request.items() if key not in ("op", "id")}
+                worker.connection.send(("run", job.key, fields))
+                self.send(job.client, {"id": job.id, "type": "started"})
+
+    def cancel(self, job: Job, reply: bool = True):
+        if job.worker is None:
+            self.pending.remove(job)
+            self.finish(job, {"type": "cancelled"} if reply else None)
+            return
+        job.client = job.client if reply else None
+        worker = job.worker
+        worker.connection.send(("cancel", job.key))
+        self.loop.call_later(CANCEL_GRACE_S, self.restart_if_stuck, worker, job)
+
+    # A job that does not notice its cancellation in time (e.g. one that logs nothing) has its worker replaced.
+    def restart_if_stuck(self, worker: Worker, job: Job):
+        if worker.job is job:
+            self.stop_worker(worker)
+            self.finish(job, {"type": "cancelled"})
+            self.start_worker()
+            self.dispatch()
+
+    def worker_readable(self, worker: Worker):
+        try:
+            message = worker.connection.recv()
+        except (EOFError, OSError):
+            job = worker.job
+            self.stop_worker(worker)
+            if job is not None:
+                self.finish(job, {"type": "error", "message": "The worker running the job exited"})
+            self.start_worker()
+            self.dispatch()
+            return
+
+        kind, job_key = message[0], message[1]
+        job = worker.job
+        if job is None or job.key != job_key:
+            return
+        if kind == "log":
+            if job.client is None:
+                return # cancelled because its client left; the worker is told to stop already
+            self.send(job.client, {"id": job.id, "type": "log", "text": message[2]})
+            asyncio.ensure_future(self.acknowledge(worker, job))
+            return
+
+        worker.job = None
+        if kind == "done":
+            self.finish(job, {"type": "done", "metrics": message[2], "seconds": time.perf_counter() - job.started})
+        elif kind == "error":
+            self.finish(job, {"type": "error", "message": message[2]})
+        else:
+            self.finish(job, {"type": "cancelled"})
+        self.dispatch()
+
+    # Lets the worker send another chunk once this one has left for the client.
+    async def acknowledge(self, worker: Worker, job: Job):
+        if job.client is None:
+            return # cancelled because its client left; the worker is told to stop already
+        try:
+            await job.client.writer.drain()
+        except ConnectionError:
+            return
+        if worker.job is job:
+            worker.connection.send(("ack", job.key))
+
+    def finish(self, job: Job, reply: dict | None):
+        if job.client is not None:
+            job.client.jobs.pop(job.id, None)
+            if reply is not None:
+                self.send(job.client, {"id": job.id, **reply})
+
+    def send(self, client: Client, message: dict):
+        if not client.writer.is_closing():
+            client.writer.write(json.dumps(message).encode() + b"\n")
+
+# Runs one simulation on a running service, writing its log to stdout. Returns the final reply.
+async def run_remote(socket_path: str, request: dict) -> dict:
+    reader, writer = await asyncio.open_unix_connection(socket_path, limit=MAX_REQUEST_SIZE)
+    writer.write(json.dumps({"op": "run", "id": 0, **request}).encode() + b"\n")
+    await writer.drain()
+    try:
+        while line := await reader.readline():
+            reply = json.loads(line)
+            if reply["type"] == "log":
+                sys.stdout.write(reply["text"])
+            elif reply["type"] in ("done", "error", "cancelled"):
+                return reply
+        return {"type": "error", "message": "The service closed the connection"}
+    finally:
+        writer.close()
+
+def print_usage():
+    print("Usage: python service.py serve <optional --socket=PATH> <optional --workers=N>")
+    print("       python service.py run <simulation_description_path> <optional --socket=PATH> <optional --no-student-logs> <optional --event-driven>")
+    print("       <optional --log-level=switches|lifecycle|all> <optional --metrics (print the metrics summary after the log)>")
+    print(f"       The socket defaults to {DEFAULT_SOCKET}.")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("serve", "run") or (sys.argv[1] == "run" and len(sys.argv) < 3):
+        print_usage()
+    socket_path = DEFAULT_SOCKET
+    if sys.argv[1] == "serve":
+        workers = os.cpu_count() or 1
+        for option in sys.argv[2:]:
+            key, _, value = option.partition("=")
+            if key == "--socket" and value:
+                socket_path = value
+            elif key == "--workers" and value.isdigit() and int(value) > 0:
+                workers = int(value)
+            else:
+                print_usage()
+        asyncio.run(SimulationService(workers, socket_path).serve())
+    else:
+        request = {"path": os.path.abspath(sys.argv[2])}
+        for option in sys.argv[3:]:
+            key, _, value = option.partition("=")
+            if key == "--socket" and value:
+                socket_path = value
+            elif option == "--no-student-logs":
+                request["student_logs"] = False
+            elif option == "--event-driven":
+                request["event_driven"] = True
+            elif key == "--log-level" and value in simlog.LOG_LEVELS:
+                request["log_level"] = value
+            elif option == "--metrics":
+                request["metrics"] = True
+            else:
+                print_usage()
+        reply = asyncio.run(run_remote(socket_path, request))
+        if reply["type"] == "done" and reply["metrics"] is not None:
+            json.dump(reply["metrics"], sys.stderr, indent=2)
+            sys.stderr.write("\n")
+        elif reply["type"] != "done":
+            print(f"Job {reply['type']}: {reply.get('message', '')}", file=sys.stderr)
+            sys.exit(1)
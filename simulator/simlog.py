@@ -0,0 +1,214 @@
+from pathlib import Path
+import os
+import struct
+import sys
+
+MICRO_S = int
+
+# Kinds of log records. The simulator logs structured records and only the text sinks turn them into strings.
+SWITCH = 0
+ARRIVAL_FOREGROUND = 1
+ARRIVAL_BACKGROUND = 2
+EXIT = 3
+SET_PRIORITY = 4
+SEMAPHORE_P = 5
+SEMAPHORE_V = 6
+MUTEX_LOCK = 7
+MUTEX_UNLOCK = 8
+SEMAPHORE_INIT = 9
+MUTEX_INIT = 10
+# Free form messages. In a binary trace their text lives in the strings file next to the trace.
+MESSAGE = 11
+STUDENT_MESSAGE = 12
+# Only logged by SMP simulations.
+CPU_SWITCH = 13
+MIGRATION = 14
+NUM_KINDS = 15
+
+FORMATS = {
+    SWITCH: "Context switching to pid: {0}",
+    ARRIVAL_FOREGROUND: "Foreground process {0} arrived with priority {1}",
+    ARRIVAL_BACKGROUND: "Background process {0} arrived with priority {1}",
+    EXIT: "Process {0} has finished execution and is exiting",
+    SET_PRIORITY: "Process {0} set priority to {1}",
+    SEMAPHORE_P: "Process {0} called p on semaphore {1}",
+    SEMAPHORE_V: "Process {0} called v on semaphore {1}",
+    MUTEX_LOCK: "Process {0} called lock on mutex {1}",
+    MUTEX_UNLOCK: "Process {0} called unlock on mutex {1}",
+    SEMAPHORE_INIT: "Semaphore {0} initilized with value {1}",
+    MUTEX_INIT: "Mutex {0} initilized",
+    CPU_SWITCH: "CPU {0} context switching to pid: {1}",
+    MIGRATION: "Process {0} migrated to CPU {1}",
+}
+
+# Log levels, each including everything logged by the levels below it.
+LEVEL_SWITCHES = 1
+LEVEL_LIFECYCLE = 2
+LEVEL_ALL = 3
+LOG_LEVELS = {"switches": LEVEL_SWITCHES, "lifecycle": LEVEL_LIFECYCLE, "all": LEVEL_ALL}
+
+KIND_LEVELS = [LEVEL_ALL] * NUM_KINDS
+KIND_LEVELS[SWITCH] = LEVEL_SWITCHES
+KIND_LEVELS[CPU_SWITCH] = LEVEL_SWITCHES
+KIND_LEVELS[MIGRATION] = LEVEL_SWITCHES
+KIND_LEVELS[ARRIVAL_FOREGROUND] = LEVEL_LIFECYCLE
+KIND_LEVELS[ARRIVAL_BACKGROUND] = LEVEL_LIFECYCLE
+KIND_LEVELS[EXIT] = LEVEL_LIFECYCLE
+
+# One binary trace record: time, kind and two arguments (e.g. pid and priority).
+RECORD = struct.Struct("<QBqq")
+WRITE_BUFFER_SIZE = 1 << 20
+STRINGS_SUFFIX = ".strings"
+
+# Writes the human readable log.
+# Every tick that logged something is followed by a blank line. Ticks are identified by their time,
+# so the blank line is written lazily, when a record for a later time arrives or the log is closed.
+# Pickling a log records how far it has been written; unpickling truncates the file back to that point and continues from there.
+class TextLog:
+    level: int
+
+    def __init__(self, path: Path, level: int = LEVEL_ALL):
+        self.level = level
+        self.path = os.path.abspath(path)
+        self.file = open(self.path, 'w', buffering=WRITE_BUFFER_SIZE)
+        self.last_time = None
+        self.prefix = ""
+
+    def event(self, time: MICRO_S, kind: int, a: int = 0, b: int = 0):
+        if KIND_LEVELS[kind] <= self.level:
+            self.write(time, ':', FORMATS[kind].format(a, b))
+
+    def message(self, time: MICRO_S, message: str, student_log: bool):
+        if self.level >= LEVEL_ALL:
+            self.write(time, '#' if student_log else ':', message)
+
+    def write(self, time: MICRO_S, delimiter: str, message: str):
+        if time != self.last_time:
+            if self.last_time is not None:
+                self.file.write("\n")
+            self.last_time = time
+            self.prefix = f"{time / 1000:.3f}ms"
+        self.file.write(f"{self.prefix} {delimiter} {message}\n")
+
+    # now is the current simulated time. If something was logged at that time the tick is still in progress
+    # (the simulation stopped part way through it), so it does not get its blank line.
+    def close(self, now: MICRO_S | None = None):
+        if self.last_time is not None and self.last_time != now:
+            self.file.write("\n")
+        self.file.close()
+
+    def __getstate__(self):
+        self.file.flush()
+        return {"level": self.level, "path": self.path, "offset": self.file.tell(), "last_time": self.last_time, "prefix": self.prefix}
+
+    def __setstate__(self, state: dict):
+        self.level = state["level"]
+        self.path = state["path"]
+        self.last_time = state["last_time"]
+        self.prefix = state["prefix"]
+        self.file = reopen_truncated(self.path, state["offset"], 'r+')
+
+# Writes fixed-width binary records instead of text. Use render_trace to turn a trace into the text log.
+class BinaryTrace:
+    level: int
+
+    def __init__(self, path: Path, level: int = LEVEL_ALL):
+        self.level = level
+        self.path = Path(path).absolute()
+        self.file = open(self.path, 'wb')
+        self.strings = None
+        self.strings_offset = 0
+        self.buffer = bytearray()
+
+    def event(self, time: MICRO_S, kind: int, a: int = 0, b: int = 0):
+        if KIND_LEVELS[kind] <= self.level:
+            self.buffer += RECORD.pack(time, kind, a, b)
+            if len(self.buffer) >= WRITE_BUFFER_SIZE:
+                self.flush()
+
+    def message(self, time: MICRO_S, message: str, student_log: bool):
+        if self.level < LEVEL_ALL:
+            return
+        if self.strings is None:
+            self.strings = open(str(self.path) + STRINGS_SUFFIX, 'wb', buffering=WRITE_BUFFER_SIZE)
+        encoded = message.encode()
+        self.strings.write(encoded)
+        self.event(time, STUDENT_MESSAGE if student_log else MESSAGE, self.strings_offset, len(encoded))
+        self.strings_offset += len(encoded)
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.buffer.clear()
+
+    def close(self, now: MICRO_S | None = None):
+        self.flush()
+        self.file.close()
+        if self.strings is not None:
+            self.strings.close()
+
+    def __getstate__(self):
+        self.flush()
+        self.file.flush()
+        if self.strings is not None:
+            self.strings.flush()
+        return {"level": self.level, "path": self.path, "offset": self.file.tell(), "strings_offset": self.strings_offset,
+                "has_strings": self.strings is not None}
+
+    def __setstate__(self, state: dict):
+        self.level = state["level"]
+        self.path = state["path"]
+        self.buffer = bytearray()
+        self.file = reopen_truncated(self.path, state["offset"], 'r+b')
+        self.strings_offset = state["strings_offset"]
+        self.strings = None
+        if state["has_strings"]:
+            self.strings = reopen_truncated(str(self.path) + STRINGS_SUFFIX, self.strings_offset, 'r+b')
+
+# Opens an existing file for writing at offset, dropping anything written after it.
+def reopen_truncated(path: Path, offset: int, mode: str):
+    file = open(path, mode, buffering=WRITE_BUFFER_SIZE)
+    file.truncate(offset)
+    file.seek(offset)
+    return file
+
+def open_log(path: Path, level: int = LEVEL_ALL, binary_trace: bool = False) -> TextLog | BinaryTrace:
+    if binary_trace:
+        return BinaryTrace(path, level)
+    return TextLog(path, level)
+
+# Yields the (time, kind, a, b) records of a binary trace.
+def read_trace(trace_path: Path):
+    with open(trace_path, 'rb') as file:
+        while True:
+            chunk = file.read(RECORD.size * 65536)
+            if not chunk:
+                return
+            yield from RECORD.iter_unpack(chunk)
+
+# Renders a binary trace into exactly the text log the simulator would have written.
+def render_trace(trace_path: Path, log_path: Path):
+    strings = None
+    strings_path = Path(str(trace_path) + STRINGS_SUFFIX)
+    if strings_path.exists():
+        strings = open(strings_path, 'rb')
+
+    log = TextLog(log_path)
+    for time, kind, a, b in read_trace(trace_path):
+        if kind == MESSAGE or kind == STUDENT_MESSAGE:
+            strings.seek(a)
+            log.write(time, '#' if kind == STUDENT_MESSAGE else ':', strings.read(b).decode())
+        else:
+            log.write(time, ':', FORMATS[kind].format(a, b))
+    log.close()
+    if strings is not None:
+        strings.close()
+
+def print_usage():
+    print("Usage: python simlog.py <trace_path> <log_path>")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print_usage()
+    render_trace(Path(sys.argv[1]), Path(sys.argv[2]))
@@ -1,10 +1,22 @@
-from io import TextIOWrapper
 import json
 from dataclasses import dataclass
 from pathlib import Path
+from typing import BinaryIO, Callable, Collection, Iterable, Iterator
+from itertools import chain, islice
+import mmap
+import os
+import pickle
+import struct
 import sys
 
 from kernel import Kernel
+import simlog
+from simlog import TextLog, BinaryTrace, LEVEL_ALL
+import metrics
+from metrics import MetricsCollector
+from deadlock import WaitForGraph
+import profiler
+import cache
 
 MICRO_S = int
 PID = int
@@ -12,7 +24,7 @@ PID = int
 NUM_MICRO_IN_SEC: MICRO_S = 1000000
 TIMER_INTERRUPT_INTERVAL: MICRO_S = 10
 
-VALID_SCHEDULING_ALGORITHMS = {"FCFS", "Priority", "RR", "Multilevel"}
+VALID_SCHEDULING_ALGORITHMS = {"FCFS", "Priority", "RR", "Multilevel", "Fair", "MLFQ"}
 VALID_PROCESS_TYPES = {"Foreground", "Background"}
 
 PROCESSES: str = "processes"
@@ -35,26 +47,78 @@ PROCESSES_MUTEX_ID: str = "id"
 PROCESS_MUTEX_LOCK: str = "lock"
 PROCESS_MUTEX_UNLOCK: str = "unlock"
 PROCESS_TYPE: str = "type"
+RR_QUANTUM: str = "rr_quantum"
+LEVEL_SLICE: str = "level_slice"
+TIMER_INTERVAL: str = "timer_interval"
+PRIORITY_INHERITANCE: str = "priority_inheritance"
+FAIR_LATENCY: str = "fair_latency"
+FAIR_GRANULARITY: str = "fair_granularity"
+BOOST_INTERVAL: str = "boost_interval"
+MLFQ_LEVELS: str = "mlfq_levels"
+VALID_LEVEL_POLICIES = {"RR", "FCFS"}
+
+# Optional top level keys of a description that are passed on to the Kernel constructor (as keyword arguments of the same name).
+# Each is a positive number of microseconds; a description without them runs with the kernel's defaults.
+KERNEL_OPTIONS = [RR_QUANTUM, LEVEL_SLICE, TIMER_INTERVAL, FAIR_LATENCY, FAIR_GRANULARITY, BOOST_INTERVAL]
+# Like KERNEL_OPTIONS, but true or false.
+KERNEL_FLAGS = [PRIORITY_INHERITANCE]
+# MLFQ_LEVELS is also passed on: a non-empty list of [policy, quantum] pairs, highest level first, with policy in
+# VALID_LEVEL_POLICIES and a positive quantum (ignored by FCFS levels, where it may be 0).
 
 DEFAULT_PRIORITY = 32
 
+# Streaming descriptions are JSON Lines files: a header object without "processes", then one process per line in arrival order.
+STREAMING_SUFFIX = ".jsonl"
+# Description path that reads a streaming description from standard input.
+STDIN_PATH = "-"
+CHECKPOINT_SUFFIX = ".pickle"
+
+# Compiled descriptions are written by workload.py after validating every process once. All little endian, they hold
+# WORKLOAD_HEADER, the top level keys as JSON, the events of every process in one table, then the processes in arrival order.
+COMPILED_SUFFIX = ".workload"
+WORKLOAD_MAGIC = b"SIMWKLD\0"
+WORKLOAD_VERSION = 1
+# Magic, version, length of the JSON, number of processes, offset of the events, offset of the processes.
+WORKLOAD_HEADER = struct.Struct("<8sIIQQQ")
+# Arrival, total CPU time, priority, index of the process type in PROCESS_TYPES, index of the first event, number of events.
+PROCESS_RECORD = struct.Struct("<qqqBQI")
+# Arrival, kind and value of a ProcessEvent, in timeline order.
+EVENT_RECORD = struct.Struct("<qBq")
+PROCESS_TYPES = ["Foreground", "Background"]
+
+# Cached results are keyed by the description and the source of every module in this directory, so a change to the kernel,
+# the simulator or anything they import (simlog, metrics, deadlock...) makes later runs miss the cache.
+SOURCE_DIR = Path(__file__).parent
+
 class SimulationError(Exception):
     pass
 
-@dataclass
-class PriorityChangeEvent:
-    arrival: MICRO_S
-    new_priority: int
+# Raised as soon as processes are blocked on semaphores and mutexes in a way that can never be undone.
+class DeadlockError(SimulationError):
+    pass
 
-@dataclass
-class SemaphoreCallEvent:
-    arrival: MICRO_S
-    id: int
+# Kinds of process events. When several events are due on the same tick they are handled in this order.
+PRIORITY_CHANGE_EVENT = 0
+SEMAPHORE_P_EVENT = 1
+SEMAPHORE_V_EVENT = 2
+MUTEX_LOCK_EVENT = 3
+MUTEX_UNLOCK_EVENT = 4
 
-@dataclass
-class MutexEvent:
+# next_event_at of a process with no events left.
+NO_EVENT: MICRO_S = sys.maxsize
+# next_checkpoint of a simulator with no checkpoints scheduled.
+NO_CHECKPOINT: MICRO_S = sys.maxsize
+
+@dataclass(slots=True)
+class ProcessEvent:
     arrival: MICRO_S
-    id: int
+    kind: int
+    # The new priority for priority changes, otherwise the semaphore or mutex id.
+    value: int
+
+    # The elapsed_cpu_time at which the event is handled. Events at time 0 or earlier happen on the process's first tick.
+    def due(self) -> MICRO_S:
+        return max(self.arrival, 1)
 
 @dataclass
 class Semaphore:
@@ -65,51 +129,124 @@ class Semaphore:
 class Mutex:
     initilized: bool
 
-@dataclass
+@dataclass(slots=True)
 class Process:
     arrival: MICRO_S
     total_cpu_time: MICRO_S
     elapsed_cpu_time: MICRO_S
     priority: int
-    priority_change_events: list[PriorityChangeEvent]
-    semaphore_p_events: list[SemaphoreCallEvent]
-    semaphore_v_events: list[SemaphoreCallEvent]
-    mutex_lock_events: list[MutexEvent]
-    mutex_unlock_events: list[MutexEvent]
+    # All of the process's events sorted by when they are due. next_event is the index of the first one not handled yet
+    # and next_event_at is when it is due, so checking for due events is a single comparison.
+    timeline: list[ProcessEvent]
     process_type: str
+    next_event: int = 0
+    next_event_at: MICRO_S = NO_EVENT
+
+    def __post_init__(self):
+        if self.next_event < len(self.timeline):
+            self.next_event_at = self.timeline[self.next_event].due()
+
+    def pop_event(self) -> ProcessEvent:
+        event = self.timeline[self.next_event]
+        self.next_event += 1
+        self.next_event_at = self.timeline[self.next_event].due() if self.next_event < len(self.timeline) else NO_EVENT
+        return event
+
+# Processes that have not arrived yet, in the order they arrive.
+# Holds a single process of lookahead, so a lazily read description is only consumed as the simulation reaches it.
+class Arrivals:
+    upcoming: Iterator[Process]
+    next: Process | None
+    # The processes of a description held in memory as a list, and how many of them have arrived.
+    known: list[Process] | None
+    arrived: int
+
+    def __init__(self, upcoming: Iterable[Process]):
+        self.known = upcoming if isinstance(upcoming, list) else None
+        self.arrived = 0
+        self.upcoming = iter(upcoming)
+        self.next = next(self.upcoming, None)
+
+    def __bool__(self):
+        return self.next is not None
+
+    def peek(self) -> Process | None:
+        return self.next
+
+    def pop(self) -> Process:
+        process = self.next
+        self.next = next(self.upcoming, None)
+        self.arrived += 1
+        return process
+
+    # Every process still to arrive, or None if they are read lazily and so can not be known in advance.
+    def remaining(self) -> Iterable[Process] | None:
+        return None if self.known is None else islice(self.known, self.arrived, None)
 
 class Simulator:
     elapsed_time: MICRO_S
     current_process: PID
     processes: dict[PID, Process]
-    arrivals: list[Process]
+    arrivals: Arrivals
     kernel: Kernel
     next_pid: PID
-    simlog: TextIOWrapper
-    needs_spacing: False
+    simlog: TextLog | BinaryTrace
     process_0_runtime: MICRO_S
     semaphores: dict[int, Semaphore]
     mutexes: dict[int, Mutex]
     student_logs: "StudentLogger"
-
-    def __init__(self, emulation_description_path: Path, logfile_path: str, student_logs: bool):
+    event_driven: bool
+    tickless: bool
+    pending_timer_time: MICRO_S
+    timer_deadline: MICRO_S | None
+    timer_interval: MICRO_S
+    scheduling_algorithm: str
+    # Keyword arguments the kernel was created with, see KERNEL_OPTIONS.
+    kernel_options: dict[str, int | bool]
+    metrics: MetricsCollector | None
+    wait_for: WaitForGraph
+    # Simulated time of the next checkpoint. See schedule_checkpoints.
+    next_checkpoint: MICRO_S
+    checkpoint_dir: Path | None
+    checkpoint_times: list[MICRO_S]
+    checkpoint_every: MICRO_S | None
+
+    # overrides replaces top level keys of the description (e.g. the scheduling algorithm or the RR quantum) without editing the file.
+    # metrics, if given, is kept up to date as the simulation runs and finished when it ends.
+    # kernel_factory creates the kernel; it is called like the Kernel constructor (e.g. another kernel module's Kernel class).
+    # recorder, if given, is an analytics.TraceRecorder that records every event and the ready queue lengths after every kernel call.
+    # description, if given, is used instead of opening emulation_description_path: the top level keys and the processes in arrival order,
+    # like open_description returns them. The processes may be an endless iterator, making the simulation run until it is stopped.
+    def __init__(self, emulation_description_path: Path | None, logfile_path: str, student_logs: bool, event_driven: bool = False,
+                 log_level: int = LEVEL_ALL, binary_trace: bool = False, overrides: dict | None = None,
+                 metrics: MetricsCollector | None = None, kernel_factory: Callable[..., Kernel] = Kernel, recorder=None,
+                 description: tuple[dict, Iterable[Process]] | None = None):
         self.elapsed_time = 0
+        self.metrics = metrics
+        self.wait_for = WaitForGraph()
+        self.next_checkpoint = NO_CHECKPOINT
+        self.checkpoint_dir = None
+        self.checkpoint_times = []
+        self.checkpoint_every = None
+        self.event_driven = event_driven
         self.current_process = 0
         self.processes = dict()
-        self.arrivals = []
         self.next_pid = 1
-        self.needs_spacing = False
         self.process_0_runtime = 0
         self.semaphores = dict()
         self.mutexes = dict()
-        if student_logs:
+        # Student logs are only written at the "all" log level, so below it they are discarded like with student_logs off.
+        if student_logs and log_level >= LEVEL_ALL:
             self.student_logs = StudentLogger(self)
         else:
             self.student_logs = StudentLogger(None)
 
-        emulation_json = None
-        with open(emulation_description_path, 'r') as file:
-            emulation_json = json.load(file)
+        if description is None:
+            description = open_description(emulation_description_path)
+        emulation_json, processes = description
+        self.arrivals = Arrivals(processes)
+        if overrides:
+            emulation_json = {**emulation_json, **overrides}
 
         if SEMAPHORES in emulation_json:
             assert(type(emulation_json[SEMAPHORES]) is list)
@@ -125,79 +262,54 @@ class Simulator:
                 assert(type(mutex_id) is int)
                 self.mutexes[mutex_id] = Mutex(False)
 
-        assert(PROCESSES in emulation_json and type(emulation_json[PROCESSES]) is list)
-        for process in emulation_json[PROCESSES]:
-            assert(ARRIVAL in process and type(process[ARRIVAL]) is MICRO_S)
-            assert(TOTAL_CPU_TIME in process and type(process[TOTAL_CPU_TIME]) is MICRO_S)
-            
-            priority = DEFAULT_PRIORITY
-            if PRIORITY in process:
-                assert(type(process[PRIORITY]) is int)
-                priority = process[PRIORITY]
-
-            priority_changes = []
-            if PRIORITY_CHANGES in process:
-                assert(type(process[PRIORITY_CHANGES]) is list)
-                for change in process[PRIORITY_CHANGES]:
-                    assert(EVENT_ARRIVAL in change and type(change[EVENT_ARRIVAL]) is int)
-                    assert(NEW_PRIORITY in change and type(change[NEW_PRIORITY]) is int)
-                    priority_changes.append(PriorityChangeEvent(change[EVENT_ARRIVAL], change[NEW_PRIORITY]))
-
-            semaphore_p_events = list()
-            semaphore_v_events = list()
-            if PROCESS_SEMAPHORE in process:
-                assert(type(process[PROCESS_SEMAPHORE]) is list)
-                for event in process[PROCESS_SEMAPHORE]:
-                    assert(PROCESSES_SEMA_ID in event and type(event[PROCESSES_SEMA_ID]) is int)
-                    id = event[PROCESSES_SEMA_ID]
-                    assert(PROCESS_SEMA_P in event or PROCESS_SEMA_V in event)
-                    if PROCESS_SEMA_P in event:
-                        assert(type(event[PROCESS_SEMA_P]) is int)
-                        semaphore_p_events.append(SemaphoreCallEvent(event[PROCESS_SEMA_P], id))
-                    elif PROCESS_SEMA_V in event:
-                        assert(type(event[PROCESS_SEMA_V]) is int)
-                        semaphore_v_events.append(SemaphoreCallEvent(event[PROCESS_SEMA_V], id))
-
-            mutex_lock_events = list()
-            mutex_unlock_events = list()
-            if PROCESS_MUTEX in process:
-                assert(type(process[PROCESS_MUTEX]) is list)
-                for event in process[PROCESS_MUTEX]:
-                    assert(PROCESSES_MUTEX_ID in event and type(event[PROCESSES_MUTEX_ID]) is int)
-                    id = event[PROCESSES_MUTEX_ID]
-                    assert(PROCESS_MUTEX_LOCK in event or PROCESS_MUTEX_UNLOCK in event)
-                    if PROCESS_MUTEX_LOCK in event:
-                        assert(type(event[PROCESS_MUTEX_LOCK]) is int)
-                        mutex_lock_events.append(MutexEvent(event[PROCESS_MUTEX_LOCK], id))
-                    elif PROCESS_MUTEX_UNLOCK in event:
-                        assert(type(event[PROCESS_MUTEX_UNLOCK]) is int)
-                        mutex_unlock_events.append(MutexEvent(event[PROCESS_MUTEX_UNLOCK], id))
-
-            # Sort all event lists such that their last element is always the next event
-            for event_list in [priority_changes, semaphore_p_events, semaphore_v_events, mutex_lock_events, mutex_unlock_events]:
-                event_list.sort(key=lambda c: c.arrival, reverse=True)
-
-            process_type = "Foreground"
-            if PROCESS_TYPE in process:
-                assert(process[PROCESS_TYPE] in VALID_PROCESS_TYPES)
-                process_type = process[PROCESS_TYPE]
-
-            process = Process(process[ARRIVAL], process[TOTAL_CPU_TIME], 0, priority, priority_changes, \
-                              semaphore_p_events, semaphore_v_events, mutex_lock_events, mutex_unlock_events, process_type)
-            assert_events_are_valid_and_not_at_same_time(process)
-            self.arrivals.append(process)
-        # Sort arrivals so earliest arrivals are at the end.
-        self.arrivals.sort(key=lambda p: p.arrival, reverse=True)
-
         assert("scheduling_algorithm" in emulation_json and emulation_json["scheduling_algorithm"] in VALID_SCHEDULING_ALGORITHMS)
-        self.kernel = Kernel(emulation_json["scheduling_algorithm"], self.student_logs)
-
-        self.simlog = open(logfile_path, 'w')
+        kernel_options = {key: emulation_json[key] for key in KERNEL_OPTIONS if key in emulation_json}
+        for value in kernel_options.values():
+            assert(type(value) is int and value > 0)
+        for key in KERNEL_FLAGS:
+            if key in emulation_json:
+                assert(type(emulation_json[key]) is bool)
+                kernel_options[key] = emulation_json[key]
+        if MLFQ_LEVELS in emulation_json:
+            levels = emulation_json[MLFQ_LEVELS]
+            assert(type(levels) is list and levels)
+            for level in levels:
+                assert(type(level) is list and len(level) == 2 and level[0] in VALID_LEVEL_POLICIES)
+                assert(type(level[1]) is int and (level[1] > 0 or level[0] == "FCFS" and level[1] == 0))
+            kernel_options[MLFQ_LEVELS] = [tuple(level) for level in levels]
+        self.timer_interval = kernel_options.get(TIMER_INTERVAL, TIMER_INTERRUPT_INTERVAL)
+        self.scheduling_algorithm = emulation_json["scheduling_algorithm"]
+        self.kernel_options = kernel_options
+        self.kernel = kernel_factory(self.scheduling_algorithm, self.student_logs, **kernel_options)
+
+        # Kernels that implement next_timer_deadline only receive the timer interrupts that can change scheduling.
+        self.tickless = hasattr(self.kernel, "next_timer_deadline")
+        self.pending_timer_time = 0
+        self.timer_deadline = self.kernel.next_timer_deadline() if self.tickless else None
+
+        self.simlog = simlog.open_log(logfile_path, log_level, binary_trace)
+        self.recorder = recorder
+        if recorder is not None:
+            self.simlog = recorder.tee(self.simlog)
 
     
     def run_simulator(self):
+        try:
+            self.run_loop()
+        finally:
+            self.simlog.close(self.elapsed_time)
+            if self.metrics is not None:
+                self.metrics.finish(self.elapsed_time)
+
+    def run_loop(self):
         # Emulation ends when all processes have finished.
-        while len(self.processes) + len(self.arrivals) > 0:
+        while self.processes or self.arrivals:
+            if self.event_driven:
+                self.skip_to_next_event()
+
+            if self.elapsed_time >= self.next_checkpoint:
+                self.take_checkpoint()
+
             if self.current_process == 0:
                 self.process_0_runtime += 1
             if self.process_0_runtime >= NUM_MICRO_IN_SEC:
@@ -209,12 +321,70 @@ class Simulator:
 
             self.check_for_arrival()
 
-            if self.elapsed_time != 0 and self.elapsed_time % TIMER_INTERRUPT_INTERVAL == 0:
-                self.switch_process(self.kernel.timer_interrupt())
+            if self.elapsed_time != 0 and self.elapsed_time % self.timer_interval == 0:
+                self.timer_interrupt()
 
-            self.log_add_spacing()
             self.elapsed_time += 1
-        self.simlog.close()
+
+    # Makes the simulation save a checkpoint into directory at each of the given simulated times and every `every` microseconds.
+    # A checkpoint is taken at the start of a tick, before anything happens in it, and holds the whole simulator and kernel state.
+    # Resuming one with load_checkpoint continues the run (including its logs and later checkpoints) exactly as if it had never stopped.
+    def schedule_checkpoints(self, directory: Path, times: Iterable[MICRO_S] = (), every: MICRO_S | None = None):
+        assert(every is None or every > 0)
+        self.checkpoint_dir = Path(directory).absolute()
+        self.checkpoint_times = sorted(set(times), reverse=True)
+        self.checkpoint_every = every
+        self.next_checkpoint = self.next_checkpoint_after(self.elapsed_time - 1)
+
+    def next_checkpoint_after(self, time: MICRO_S) -> MICRO_S:
+        while self.checkpoint_times and self.checkpoint_times[-1] <= time:
+            self.checkpoint_times.pop()
+        next_checkpoint = self.checkpoint_times[-1] if self.checkpoint_times else NO_CHECKPOINT
+        if self.checkpoint_every is not None:
+            next_checkpoint = min(next_checkpoint, (time // self.checkpoint_every + 1) * self.checkpoint_every)
+        return next_checkpoint
+
+    def take_checkpoint(self):
+        self.next_checkpoint = self.next_checkpoint_after(self.elapsed_time)
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        save_checkpoint(self, self.checkpoint_dir / f"checkpoint_{self.elapsed_time}{CHECKPOINT_SUFFIX}")
+
+    # Moves elapsed_time straight to the next tick at which something can happen: an arrival, the current process
+    # exiting or reaching one of its events, a timer interrupt or the idle timeout.
+    # The ticks skipped over would only have advanced counters, so those counters are updated in bulk.
+    def skip_to_next_event(self):
+        # First timer tick at or after now, and the first one that will actually be delivered to the kernel.
+        next_timer = max(self.elapsed_time + -self.elapsed_time % self.timer_interval, self.timer_interval)
+        next_event = next_timer
+        if self.tickless:
+            if self.timer_deadline is None:
+                next_event = float("inf")
+            else:
+                interrupts = -(-(self.timer_deadline - self.pending_timer_time) // self.timer_interval)
+                next_event = next_timer + (interrupts - 1) * self.timer_interval
+
+        if self.arrivals and self.arrivals.peek().arrival >= self.elapsed_time:
+            next_event = min(next_event, self.arrivals.peek().arrival)
+        next_event = min(next_event, self.next_checkpoint)
+
+        if self.current_process == 0:
+            next_event = min(next_event, self.elapsed_time + NUM_MICRO_IN_SEC - self.process_0_runtime - 1)
+        else:
+            current_process = self.processes[self.current_process]
+            due = min(current_process.total_cpu_time, current_process.next_event_at)
+            # The tick that brings elapsed_cpu_time up to due is the one that handles it.
+            next_event = min(next_event, self.elapsed_time + max(due - current_process.elapsed_cpu_time - 1, 0))
+
+        skipped = next_event - self.elapsed_time
+        if skipped <= 0:
+            return
+        if self.tickless and next_event > next_timer:
+            self.pending_timer_time += ((next_event - next_timer - 1) // self.timer_interval + 1) * self.timer_interval
+        self.elapsed_time = next_event
+        if self.current_process == 0:
+            self.process_0_runtime += skipped
+        else:
+            self.processes[self.current_process].elapsed_cpu_time += skipped
 
     def advance_current_process(self):
         if self.current_process == 0:
@@ -226,155 +396,453 @@ class Simulator:
         # If the current_process has finished execution
         if current_process.total_cpu_time <= current_process.elapsed_cpu_time:
             exiting_process = self.current_process
-            self.log(f"Process {exiting_process} has finished execution and is exiting")
+            self.simlog.event(self.elapsed_time, simlog.EXIT, exiting_process)
+            if self.metrics is not None:
+                self.metrics.exit(self.elapsed_time, exiting_process)
+            self.flush_timer()
             new_process = self.kernel.syscall_exit()
             if new_process == exiting_process:
                 raise SimulationError(f"Attempted to continue execution of exiting process (pid = {exiting_process})")
             
             del self.processes[exiting_process]
+            self.check_for_deadlock_after_exit(exiting_process)
             
             self.switch_process(new_process)
             return
 
 
-        event_list = current_process.priority_change_events
-        while len(event_list) > 0 and event_list[len(event_list) - 1].arrival <= current_process.elapsed_cpu_time:
-            priority_change = event_list.pop()
-            self.log(f"Process {self.current_process} set priority to {priority_change.new_priority}")
-            self.switch_process(self.kernel.syscall_set_priority(priority_change.new_priority))
-
-
-        event_list = current_process.semaphore_p_events
-        while len(event_list) > 0 and event_list[len(event_list) - 1].arrival <= current_process.elapsed_cpu_time:
-            semaphore_p = event_list.pop()
-            self.check_semaphore_inited(semaphore_p.id)
-            self.log(f"Process {self.current_process} called p on semaphore {semaphore_p.id}")
-            self.switch_process(self.kernel.syscall_semaphore_p(semaphore_p.id))
-        
-        event_list = current_process.semaphore_v_events
-        while len(event_list) > 0 and event_list[len(event_list) - 1].arrival <= current_process.elapsed_cpu_time:
-            semaphore_v = event_list.pop()
-            self.check_semaphore_inited(semaphore_v.id)
-            self.log(f"Process {self.current_process} called v on semaphore {semaphore_v.id}")
-            self.switch_process(self.kernel.syscall_semaphore_v(semaphore_v.id))
-
-
-        event_list = current_process.mutex_lock_events
-        while len(event_list) > 0 and event_list[len(event_list) - 1].arrival <= current_process.elapsed_cpu_time:
-            mutex_lock = event_list.pop()
-            self.check_mutex_inited(mutex_lock.id)
-            self.log(f"Process {self.current_process} called lock on mutex {mutex_lock.id}")
-            self.switch_process(self.kernel.syscall_mutex_lock(mutex_lock.id))
-        
-        event_list = current_process.mutex_unlock_events
-        while len(event_list) > 0 and event_list[len(event_list) - 1].arrival <= current_process.elapsed_cpu_time:
-            mutex_unlock = event_list.pop()
-            self.check_mutex_inited(mutex_unlock.id)
-            self.log(f"Process {self.current_process} called unlock on mutex {mutex_unlock.id}")
-            self.switch_process(self.kernel.syscall_mutex_unlock(mutex_unlock.id))
+        while current_process.next_event_at <= current_process.elapsed_cpu_time:
+            event = current_process.pop_event()
+            if event.kind == PRIORITY_CHANGE_EVENT:
+                self.simlog.event(self.elapsed_time, simlog.SET_PRIORITY, self.current_process, event.value)
+                if self.metrics is not None:
+                    self.metrics.priority_changed(self.elapsed_time, self.current_process, event.value)
+                self.flush_timer()
+                self.switch_process(self.kernel.syscall_set_priority(event.value))
+
+            elif event.kind == SEMAPHORE_P_EVENT:
+                self.check_semaphore_inited(event.value)
+                self.simlog.event(self.elapsed_time, simlog.SEMAPHORE_P, self.current_process, event.value)
+                if self.wait_for.acquire(self.current_process, metrics.SEMAPHORE, event.value):
+                    self.check_for_deadlock()
+                self.flush_timer()
+                new_process = self.kernel.syscall_semaphore_p(event.value)
+                if self.metrics is not None and new_process != self.current_process:
+                    self.metrics.blocked_on(self.elapsed_time, self.current_process, metrics.SEMAPHORE, event.value)
+                self.switch_process(new_process)
+
+            elif event.kind == SEMAPHORE_V_EVENT:
+                self.check_semaphore_inited(event.value)
+                self.simlog.event(self.elapsed_time, simlog.SEMAPHORE_V, self.current_process, event.value)
+                self.wait_for.release(self.current_process, metrics.SEMAPHORE, event.value)
+                if self.metrics is not None:
+                    self.metrics.released(self.elapsed_time, metrics.SEMAPHORE, event.value)
+                self.flush_timer()
+                self.switch_process(self.kernel.syscall_semaphore_v(event.value))
+
+            elif event.kind == MUTEX_LOCK_EVENT:
+                self.check_mutex_inited(event.value)
+                self.simlog.event(self.elapsed_time, simlog.MUTEX_LOCK, self.current_process, event.value)
+                if self.wait_for.acquire(self.current_process, metrics.MUTEX, event.value):
+                    self.check_for_deadlock()
+                self.flush_timer()
+                new_process = self.kernel.syscall_mutex_lock(event.value)
+                if self.metrics is not None and new_process != self.current_process:
+                    self.metrics.blocked_on(self.elapsed_time, self.current_process, metrics.MUTEX, event.value)
+                self.switch_process(new_process)
+
+            elif event.kind == MUTEX_UNLOCK_EVENT:
+                self.check_mutex_inited(event.value)
+                self.simlog.event(self.elapsed_time, simlog.MUTEX_UNLOCK, self.current_process, event.value)
+                self.wait_for.release(self.current_process, metrics.MUTEX, event.value)
+                if self.metrics is not None:
+                    self.metrics.released(self.elapsed_time, metrics.MUTEX, event.value)
+                self.flush_timer()
+                self.switch_process(self.kernel.syscall_mutex_unlock(event.value))
+
+    # The current process has just blocked. Raises DeadlockError if that leaves it, or every process, waiting forever.
+    def check_for_deadlock(self):
+        self.raise_deadlock(self.wait_for.find_deadlock(self.current_process, self.processes, bool(self.arrivals), self.may_unlock))
+
+    # pid has just exited. Raises DeadlockError if that leaves a process waiting forever, e.g. for a mutex pid held.
+    def check_for_deadlock_after_exit(self, pid: PID):
+        self.raise_deadlock(self.wait_for.find_deadlock_after_exit(pid, self.processes, bool(self.arrivals), self.may_unlock))
+
+    # The deadlock is logged too, so the log of a deadlocked run says why it stops.
+    def raise_deadlock(self, deadlock: str | None):
+        if deadlock is not None:
+            self.log(f"Deadlock: {deadlock}")
+            raise DeadlockError(f"Deadlock at {self.elapsed_time / 1000:.3f}ms: {deadlock}")
+
+    # Whether a process not in excluded, live or still to arrive, has an unlock of mutex id left in its timeline.
+    # Any process can unlock a mutex, so until none can a mutex held by an exited or blocked process may still be freed.
+    # Processes of a lazily read description that have not arrived yet might unlock anything.
+    def may_unlock(self, id: int, excluded: Collection[PID]) -> bool:
+        upcoming = self.arrivals.remaining()
+        if upcoming is None and self.arrivals:
+            return True
+        live = (process for pid, process in self.processes.items() if pid not in excluded)
+        return any(event.kind == MUTEX_UNLOCK_EVENT and event.value == id
+                   for process in chain(live, upcoming or ()) for event in islice(process.timeline, process.next_event, None))
 
     def check_semaphore_inited(self, id: int):
         if not self.semaphores[id].initilized:
-            self.log(f"Semaphore {id} initilized with value {self.semaphores[id].init_val}")
+            self.simlog.event(self.elapsed_time, simlog.SEMAPHORE_INIT, id, self.semaphores[id].init_val)
             self.kernel.syscall_init_semaphore(id, self.semaphores[id].init_val)
+            self.wait_for.init_semaphore(id, self.semaphores[id].init_val)
             self.semaphores[id].initilized = True
 
     def check_mutex_inited(self, id: int):
         if not self.mutexes[id].initilized:
-            self.log(f"Mutex {id} initilized")
+            self.simlog.event(self.elapsed_time, simlog.MUTEX_INIT, id)
             self.kernel.syscall_init_mutex(id)
+            self.wait_for.init_mutex(id)
             self.mutexes[id].initilized = True
 
     def check_for_arrival(self):
-        while len(self.arrivals) > 0 and self.arrivals[len(self.arrivals) - 1].arrival == self.elapsed_time:
+        while self.arrivals and self.arrivals.peek().arrival == self.elapsed_time:
             new_process = self.arrivals.pop()
             self.processes[self.next_pid] = new_process
-            self.log(f"{new_process.process_type} process {self.next_pid} arrived with priority {new_process.priority}")
+            arrival_kind = simlog.ARRIVAL_FOREGROUND if new_process.process_type == "Foreground" else simlog.ARRIVAL_BACKGROUND
+            self.simlog.event(self.elapsed_time, arrival_kind, self.next_pid, new_process.priority)
+            if self.metrics is not None:
+                self.metrics.arrival(self.elapsed_time, self.next_pid, new_process.priority)
+            self.flush_timer()
             self.switch_process(self.kernel.new_process_arrived(self.next_pid, new_process.priority, new_process.process_type))
             self.next_pid += 1
 
 
+    def timer_interrupt(self):
+        if self.tickless:
+            self.pending_timer_time += self.timer_interval
+            if self.timer_deadline is None or self.pending_timer_time < self.timer_deadline:
+                return
+            # Everything up to this interrupt is handed over in bulk, then the interrupt itself is delivered.
+            self.pending_timer_time -= self.timer_interval
+            self.flush_timer()
+        self.switch_process(self.kernel.timer_interrupt())
+
+    # Hands timer time skipped in tickless mode to the kernel so its counters are current before it is called.
+    def flush_timer(self):
+        if self.pending_timer_time > 0:
+            self.kernel.advance_timer(self.pending_timer_time)
+            self.pending_timer_time = 0
+
     def switch_process(self, new_process: int):
         if new_process != 0:
             if new_process not in self.processes:
                 raise SimulationError(f"Attempted to switch to unkown PID {new_process}")
             self.process_0_runtime = 0
+            self.wait_for.dispatched(new_process)
 
         if new_process != self.current_process:
-            self.log(f"Context switching to pid: {new_process}")
+            self.simlog.event(self.elapsed_time, simlog.SWITCH, new_process)
+            if self.metrics is not None:
+                self.metrics.switch(self.elapsed_time, new_process)
         self.current_process = new_process
+        if self.tickless:
+            self.timer_deadline = self.kernel.next_timer_deadline()
+        if self.recorder is not None:
+            self.recorder.kernel_called(self.elapsed_time, 0, self.kernel)
 
     def log(self, str: str, student_log = False):
-        if student_log:
-            delimiter = '#'
-        else:
-            delimiter = ':'
-        self.simlog.write(f"{self.elapsed_time / 1000:.3f}ms {delimiter} {str}\n")
-        self.needs_spacing = True
-    
-    def log_add_spacing(self):
-        if self.needs_spacing:
-            self.simlog.write("\n")
-            self.needs_spacing = False
+        self.simlog.message(self.elapsed_time, str, student_log)
 
+# Passed to the kernel as its logger. A logger without a simulator discards everything.
+# enabled tells the kernel whether logging does anything, so it can skip building messages (such as queue dumps) that would be discarded.
 class StudentLogger:
     __simluator: Simulator
+    enabled: bool
 
     def __init__(self, simulator: Simulator | None):
         self.__simluator = simulator
+        self.enabled = simulator is not None
 
     def log(self, str: str):
         if self.__simluator is not None:
             self.__simluator.log(str, student_log=True)
 
+# Checkpoints are pickles of the whole Simulator, which includes its kernel. Open files (the logs and a streaming description)
+# are stored as a path and an offset, and reopened at that offset when the checkpoint is loaded.
+def save_checkpoint(simulator: Simulator, path: Path):
+    temporary_path = Path(str(path) + ".tmp")
+    with open(temporary_path, 'wb') as file:
+        pickle.dump(simulator, file, pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, path)
+
+# Loads a checkpoint written by save_checkpoint. Its logs are truncated back to where they were when it was taken.
+def load_checkpoint(path: Path) -> Simulator:
+    with open(path, 'rb') as file:
+        simulator = pickle.load(file)
+    assert(isinstance(simulator, Simulator))
+    return simulator
+
+# Builds a Process from its entry in the "processes" list of a simulation description, asserting that it is well formed.
+def parse_process(process: dict) -> Process:
+    assert(ARRIVAL in process and type(process[ARRIVAL]) is MICRO_S)
+    assert(TOTAL_CPU_TIME in process and type(process[TOTAL_CPU_TIME]) is MICRO_S)
+    
+    priority = DEFAULT_PRIORITY
+    if PRIORITY in process:
+        assert(type(process[PRIORITY]) is int)
+        priority = process[PRIORITY]
+
+    timeline = []
+    if PRIORITY_CHANGES in process:
+        assert(type(process[PRIORITY_CHANGES]) is list)
+        for change in process[PRIORITY_CHANGES]:
+            assert(EVENT_ARRIVAL in change and type(change[EVENT_ARRIVAL]) is int)
+            assert(NEW_PRIORITY in change and type(change[NEW_PRIORITY]) is int)
+            timeline.append(ProcessEvent(change[EVENT_ARRIVAL], PRIORITY_CHANGE_EVENT, change[NEW_PRIORITY]))
+
+    if PROCESS_SEMAPHORE in process:
+        assert(type(process[PROCESS_SEMAPHORE]) is list)
+        for event in process[PROCESS_SEMAPHORE]:
+            assert(PROCESSES_SEMA_ID in event and type(event[PROCESSES_SEMA_ID]) is int)
+            id = event[PROCESSES_SEMA_ID]
+            assert(PROCESS_SEMA_P in event or PROCESS_SEMA_V in event)
+            if PROCESS_SEMA_P in event:
+                assert(type(event[PROCESS_SEMA_P]) is int)
+                timeline.append(ProcessEvent(event[PROCESS_SEMA_P], SEMAPHORE_P_EVENT, id))
+            elif PROCESS_SEMA_V in event:
+                assert(type(event[PROCESS_SEMA_V]) is int)
+                timeline.append(ProcessEvent(event[PROCESS_SEMA_V], SEMAPHORE_V_EVENT, id))
+
+    if PROCESS_MUTEX in process:
+        assert(type(process[PROCESS_MUTEX]) is list)
+        for event in process[PROCESS_MUTEX]:
+            assert(PROCESSES_MUTEX_ID in event and type(event[PROCESSES_MUTEX_ID]) is int)
+            id = event[PROCESSES_MUTEX_ID]
+            assert(PROCESS_MUTEX_LOCK in event or PROCESS_MUTEX_UNLOCK in event)
+            if PROCESS_MUTEX_LOCK in event:
+                assert(type(event[PROCESS_MUTEX_LOCK]) is int)
+                timeline.append(ProcessEvent(event[PROCESS_MUTEX_LOCK], MUTEX_LOCK_EVENT, id))
+            elif PROCESS_MUTEX_UNLOCK in event:
+                assert(type(event[PROCESS_MUTEX_UNLOCK]) is int)
+                timeline.append(ProcessEvent(event[PROCESS_MUTEX_UNLOCK], MUTEX_UNLOCK_EVENT, id))
+
+    # Sort the timeline such that events are handled in the order they are due
+    timeline.sort(key=lambda e: (e.due(), e.kind, e.arrival))
+
+    process_type = "Foreground"
+    if PROCESS_TYPE in process:
+        assert(process[PROCESS_TYPE] in VALID_PROCESS_TYPES)
+        process_type = process[PROCESS_TYPE]
+
+    parsed = Process(process[ARRIVAL], process[TOTAL_CPU_TIME], 0, priority, timeline, process_type)
+    assert_events_are_valid_and_not_at_same_time(parsed)
+    return parsed
+
+# Reads the top level keys of a description and returns them with its processes in arrival order.
+# Streaming and compiled descriptions are read lazily; STDIN_PATH reads a streaming description from standard input.
+def open_description(path: Path | str) -> tuple[dict, Iterable[Process]]:
+    if str(path) == STDIN_PATH or Path(path).suffix == STREAMING_SUFFIX:
+        description_file = sys.stdin.buffer if str(path) == STDIN_PATH else open(path, 'rb')
+        header = json.loads(description_file.readline())
+        assert(PROCESSES not in header)
+        return header, ProcessStream(description_file)
+    if Path(path).suffix == COMPILED_SUFFIX:
+        compiled = CompiledProcesses(path)
+        return compiled.header, compiled
+    with open(path, 'r') as file:
+        description = json.load(file)
+    assert(PROCESSES in description and type(description[PROCESSES]) is list)
+    return description, sort_arrivals([parse_process(process) for process in description[PROCESSES]])
+
+# Orders the processes of a JSON description by arrival.
+# Processes with the same arrival time arrive in reverse order of how they are listed (the last one listed gets the lowest PID).
+def sort_arrivals(processes: list[Process]) -> list[Process]:
+    processes.sort(key=lambda p: p.arrival, reverse=True)
+    processes.reverse()
+    return processes
+
+# Lazily parses the process lines of a streaming description, checking that they are in arrival order.
+# Unlike a generator it can be pickled: it remembers the offset of the next line and reopens the file when unpickled
+# (which a stream read from a pipe can not do).
+class ProcessStream:
+    path: str
+    offset: int
+    last_arrival: MICRO_S | None
+
+    # description_file must be open in binary mode, positioned at the first process line.
+    def __init__(self, description_file: BinaryIO):
+        self.path = os.path.abspath(description_file.name)
+        self.file = description_file
+        self.offset = description_file.tell() if description_file.seekable() else 0
+        self.last_arrival = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Process:
+        while self.file is not None:
+            line = self.file.readline()
+            self.offset += len(line)
+            if not line:
+                self.file.close()
+                self.file = None
+            elif line.strip():
+                process = parse_process(json.loads(line))
+                assert(self.last_arrival is None or process.arrival >= self.last_arrival)
+                self.last_arrival = process.arrival
+                return process
+        raise StopIteration
+
+    def __getstate__(self):
+        return {"path": self.path, "offset": self.offset, "last_arrival": self.last_arrival, "done": self.file is None}
+
+    def __setstate__(self, state: dict):
+        self.path = state["path"]
+        self.offset = state["offset"]
+        self.last_arrival = state["last_arrival"]
+        self.file = None
+        if not state["done"]:
+            self.file = open(self.path, 'rb')
+            self.file.seek(self.offset)
+
+# Reads the processes of a compiled description straight from a memory map, building each one only when the simulation reaches it.
+# The processes were validated when compiled, so nothing is checked again. Pickles like ProcessStream: by path and position.
+class CompiledProcesses:
+    path: str
+    header: dict
+    count: int
+    next_index: int
+
+    def __init__(self, path: Path):
+        self.path = os.path.abspath(path)
+        self.next_index = 0
+        self.open()
+
+    def open(self):
+        with open(self.path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_length, self.count, events_offset, self.processes_offset = WORKLOAD_HEADER.unpack_from(self.map)
+        assert(magic == WORKLOAD_MAGIC and version == WORKLOAD_VERSION)
+        self.header = json.loads(self.map[WORKLOAD_HEADER.size:WORKLOAD_HEADER.size + header_length])
+        self.events = memoryview(self.map)[events_offset:self.processes_offset]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Process:
+        if self.next_index >= self.count:
+            raise StopIteration
+        arrival, total_cpu_time, priority, process_type, first_event, event_count = \
+            PROCESS_RECORD.unpack_from(self.map, self.processes_offset + self.next_index * PROCESS_RECORD.size)
+        self.next_index += 1
+        events = self.events[first_event * EVENT_RECORD.size:(first_event + event_count) * EVENT_RECORD.size]
+        timeline = [ProcessEvent(*fields) for fields in EVENT_RECORD.iter_unpack(events)]
+        return Process(arrival, total_cpu_time, 0, priority, timeline, PROCESS_TYPES[process_type])
+
+    def __getstate__(self):
+        return {"path": self.path, "next_index": self.next_index}
+
+    def __setstate__(self, state: dict):
+        self.path = state["path"]
+        self.next_index = state["next_index"]
+        self.open()
+
 # Having events at the same time as other events in the same process could cause a desync between what the simulator thinks is running and what the handler does.
 # This assert ensures the process does not have this issue.
 # Additionally ensures that all events will happen before the process exits.
 def assert_events_are_valid_and_not_at_same_time(process: Process):
     event_arrivals = set()
-    for event in process.priority_change_events:
-        assert(event.arrival not in event_arrivals)
-        event_arrivals.add(event.arrival)
-    
-    for event in process.semaphore_p_events:
-        assert(event.arrival not in event_arrivals)
-        event_arrivals.add(event.arrival)
-    
-    for event in process.semaphore_v_events:
-        assert(event.arrival not in event_arrivals)
-        event_arrivals.add(event.arrival)
-
-    for event in process.mutex_lock_events:
-        assert(event.arrival not in event_arrivals)
-        event_arrivals.add(event.arrival)
-    
-    for event in process.mutex_unlock_events:
+    for event in process.timeline:
         assert(event.arrival not in event_arrivals)
         event_arrivals.add(event.arrival)
 
     for event_arrival in event_arrivals:
         assert(event_arrival < process.total_cpu_time)
 
+# Runs a simulation like the command line does, unless result_cache holds an identical run, whose log and metrics are copied instead.
+# Returns whether the run was cached.
+def run_cached(result_cache: cache.ResultCache, description_path: Path, log_path: Path, student_logs: bool, event_driven: bool = False,
+               log_level: int = LEVEL_ALL, binary_trace: bool = False, overrides: dict | None = None, metrics_path: Path | None = None) -> bool:
+    options = {
+        "student_logs": student_logs,
+        "event_driven": event_driven,
+        "log_level": log_level,
+        "binary_trace": binary_trace,
+        "overrides": overrides or {},
+        "metrics": None if metrics_path is None else Path(metrics_path).suffix == ".csv",
+    }
+    outputs = {"log": log_path, "log" + simlog.STRINGS_SUFFIX: Path(str(log_path) + simlog.STRINGS_SUFFIX)}
+    if metrics_path is not None:
+        outputs["metrics"] = metrics_path
+        outputs["metrics" + metrics.SUMMARY_SUFFIX] = Path(str(metrics_path) + metrics.SUMMARY_SUFFIX)
+
+    def compute():
+        collector = None if metrics_path is None else MetricsCollector(metrics_path)
+        Simulator(description_path, log_path, student_logs, event_driven, log_level, binary_trace, overrides, collector).run_simulator()
+        if collector is not None:
+            collector.write_summary(Path(str(metrics_path) + metrics.SUMMARY_SUFFIX))
+    return result_cache.run([description_path, *sorted(SOURCE_DIR.glob("*.py"))], options, outputs, compute)
+
 def print_usage():
-    print("Usage: python simulator.py <simulation_description_path> <log_path> <optional --no-student-logs>")
+    print("Usage: python simulator.py <simulation_description_path> <log_path> <optional --no-student-logs> <optional --event-driven>")
+    print(f"       A simulation_description_path of {STDIN_PATH} reads a streaming (JSON Lines) description from standard input.")
+    print("       <optional --log-level=switches|lifecycle|all> <optional --trace (write a binary trace, render it with simlog.py)>")
+    print("       <optional --metrics=PATH (per-process metrics as CSV if PATH ends in .csv, otherwise JSON Lines; summary in PATH.summary.json)>")
+    print("       <optional --profile (time every kernel and log call and print a report)> <optional --profile-dump=PATH (also write cProfile stats)>")
+    print("       <optional --priority-inheritance (mutex holders inherit the priority of their waiters under Priority scheduling)>")
+    print(f"       <optional --cache (reuse the log of an identical earlier run, cached in {cache.DEFAULT_CACHE_DIR} or --cache=DIR)>")
     sys.exit(1)
 
 
 if __name__ == "__main__":
     student_logs = True
-    if len(sys.argv) <= 2 or len(sys.argv) >= 5:
+    event_driven = False
+    log_level = LEVEL_ALL
+    binary_trace = False
+    metrics_path = None
+    profile = False
+    profile_dump_path = None
+    overrides = {}
+    cache_dir = None
+    if len(sys.argv) <= 2:
         print_usage()
     if type(sys.argv[1]) is not str or type(sys.argv[2]) is not str:
         print_usage()
-    if len(sys.argv) == 4:
-        if sys.argv[3] != "--no-student-logs":
-            print_usage()
-        else:
+    for option in sys.argv[3:]:
+        if option == "--no-student-logs":
             student_logs = False
+        elif option == "--event-driven":
+            event_driven = True
+        elif option.startswith("--log-level=") and option.partition("=")[2] in simlog.LOG_LEVELS:
+            log_level = simlog.LOG_LEVELS[option.partition("=")[2]]
+        elif option == "--trace":
+            binary_trace = True
+        elif option.startswith("--metrics=") and option.partition("=")[2]:
+            metrics_path = Path(option.partition("=")[2])
+        elif option == "--profile":
+            profile = True
+        elif option.startswith("--profile-dump=") and option.partition("=")[2]:
+            profile = True
+            profile_dump_path = Path(option.partition("=")[2])
+        elif option == "--priority-inheritance":
+            overrides[PRIORITY_INHERITANCE] = True
+        elif option == "--cache":
+            cache_dir = cache.DEFAULT_CACHE_DIR
+        elif option.startswith("--cache=") and option.partition("=")[2]:
+            cache_dir = Path(option.partition("=")[2])
+        elif option == "--no-cache":
+            cache_dir = None
+        else:
+            print_usage()
 
 
 
     sim_description = Path(sys.argv[1])
     log_path = Path(sys.argv[2])
-    simulator = Simulator(sim_description, log_path, student_logs)
-    simulator.run_simulator()
\ No newline at end of file
+    # A profile is of the simulation itself, so it always runs. A description read from standard input can not be hashed in advance.
+    if cache_dir is not None and not profile and str(sim_description) != STDIN_PATH:
+        run_cached(cache.ResultCache(cache_dir), sim_description, log_path, student_logs, event_driven, log_level, binary_trace, overrides, metrics_path)
+    else:
+        collector = None if metrics_path is None else MetricsCollector(metrics_path)
+        simulator = Simulator(sim_description, log_path, student_logs, event_driven, log_level, binary_trace, overrides, collector)
+        if profile:
+            profiler.print_profile(profiler.profile_simulation(simulator, profile_dump_path))
+        else:
+            simulator.run_simulator()
+        if collector is not None:
+            collector.write_summary(Path(str(metrics_path) + metrics.SUMMARY_SUFFIX))
\ No newline at end of file
@@ -0,0 +1,295 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+import os
+import sys
+import tempfile
+
+from kernel import Kernel
+import metrics
+from metrics import MetricsCollector
+from simulator import Simulator, SimulationError, NUM_MICRO_IN_SEC, MICRO_S, PID
+import simlog
+from simlog import LEVEL_ALL
+
+DEFAULT_SCALING_CPUS = [1, 2, 4, 8]
+
+# The per-CPU part of the simulation state. The CPU being worked on has its state loaded into the Simulator's own fields
+# (kernel, current_process, process_0_runtime and the tickless timer fields), so the uniprocessor methods run unchanged on it.
+@dataclass(slots=True)
+class Core:
+    cpu: int
+    kernel: Kernel
+    current_process: PID = 0
+    process_0_runtime: MICRO_S = 0
+    pending_timer_time: MICRO_S = 0
+    timer_deadline: MICRO_S | None = None
+
+# Simulates a machine with several CPUs. Every CPU has its own Kernel instance, with its own run queue and running process
+# and its own timer interrupts, while processes, semaphores and mutexes are shared (see the shared_with argument of Kernel).
+# All CPUs advance together, one tick at a time or from event to event, and handle each tick in CPU order.
+# New processes go to an idle CPU if there is one, otherwise to the CPU with the fewest ready processes.
+# A CPU that is idle at the end of a tick steals the next process of the CPU with the most ready processes.
+# A process woken by v or unlock joins the run queue of the CPU that woke it.
+# With one CPU the schedule is exactly the uniprocessor one; only the switch lines name the CPU.
+class SMPSimulator(Simulator):
+    cores: list[Core]
+    # The CPU whose state is loaded into the Simulator fields.
+    cpu: int
+    migrations: int
+
+    def __init__(self, emulation_description_path: Path, logfile_path: str, student_logs: bool, cpus: int, event_driven: bool = False,
+                 log_level: int = LEVEL_ALL, binary_trace: bool = False, overrides: dict | None = None,
+                 metrics: MetricsCollector | None = None, recorder=None):
+        assert(cpus > 0)
+        super().__init__(emulation_description_path, logfile_path, student_logs, event_driven, log_level, binary_trace, overrides, metrics,
+                         recorder=recorder)
+        self.cores = [Core(0, self.kernel, timer_deadline=self.timer_deadline)]
+        for cpu in range(1, cpus):
+            kernel = Kernel(self.scheduling_algorithm, self.student_logs, **self.kernel_options, shared_with=self.cores[0].kernel)
+            self.cores.append(Core(cpu, kernel, timer_deadline=kernel.next_timer_deadline() if self.tickless else None))
+        self.cpu = 0
+        self.migrations = 0
+
+    # Saves the loaded CPU's state back into its Core.
+    def store_core(self):
+        core = self.cores[self.cpu]
+        core.current_process = self.current_process
+        core.process_0_runtime = self.process_0_runtime
+        core.pending_timer_time = self.pending_timer_time
+        core.timer_deadline = self.timer_deadline
+
+    def load_core(self, core: Core):
+        self.cpu = core.cpu
+        self.kernel = core.kernel
+        self.current_process = core.current_process
+        self.process_0_runtime = core.process_0_runtime
+        self.pending_timer_time = core.pending_timer_time
+        self.timer_deadline = core.timer_deadline
+
+    def use_core(self, core: Core):
+        if core.cpu != self.cpu:
+            self.store_core()
+            self.load_core(core)
+
+    def run_loop(self):
+        while self.processes or self.arrivals:
+            if self.event_driven:
+                self.skip_to_next_event()
+
+            if self.elapsed_time >= self.next_checkpoint:
+                self.take_checkpoint()
+
+            # The idle error needs every CPU to have been idle for a second.
+            all_idle = True
+            for core in self.cores:
+                self.use_core(core)
+                if self.current_process == 0:
+                    self.process_0_runtime += 1
+                if self.process_0_runtime < NUM_MICRO_IN_SEC:
+                    all_idle = False
+            if all_idle:
+                raise SimulationError( \
+                """Every CPU has been running process 0 (idle process) for 1 second straight.
+                This will not happen in tested simulations and is likely a bug in the kernel.""")
+
+            for core in self.cores:
+                self.use_core(core)
+                self.advance_current_process()
+
+            self.check_for_arrival()
+
+            self.balance()
+
+            if self.elapsed_time != 0 and self.elapsed_time % self.timer_interval == 0:
+                for core in self.cores:
+                    self.use_core(core)
+                    self.timer_interrupt()
+
+            self.elapsed_time += 1
+
+    # Same as the uniprocessor skip, over all CPUs: the skip ends at the earliest tick at which any CPU has something to do.
+    def skip_to_next_event(self):
+        self.store_core()
+        next_timer = max(self.elapsed_time + -self.elapsed_time % self.timer_interval, self.timer_interval)
+        next_event = next_timer
+        if self.tickless:
+            next_event = float("inf")
+            for core in self.cores:
+                if core.timer_deadline is not None:
+                    interrupts = -(-(core.timer_deadline - core.pending_timer_time) // self.timer_interval)
+                    next_event = min(next_event, next_timer + (interrupts - 1) * self.timer_interval)
+
+        if self.arrivals and self.arrivals.peek().arrival >= self.elapsed_time:
+            next_event = min(next_event, self.arrivals.peek().arrival)
+        next_event = min(next_event, self.next_checkpoint)
+
+        least_idle = None
+        for core in self.cores:
+            if core.current_process == 0:
+                least_idle = core.process_0_runtime if least_idle is None else min(least_idle, core.process_0_runtime)
+            else:
+                process = self.processes[core.current_process]
+                due = min(process.total_cpu_time, process.next_event_at)
+                next_event = min(next_event, self.elapsed_time + max(due - process.elapsed_cpu_time - 1, 0))
+        if least_idle is not None and all(core.current_process == 0 for core in self.cores):
+            next_event = min(next_event, self.elapsed_time + NUM_MICRO_IN_SEC - least_idle - 1)
+
+        skipped = next_event - self.elapsed_time
+        if skipped <= 0:
+            return
+        for core in self.cores:
+            if self.tickless and next_event > next_timer:
+                core.pending_timer_time += ((next_event - next_timer - 1) // self.timer_interval + 1) * self.timer_interval
+            if core.current_process == 0:
+                core.process_0_runtime += skipped
+            else:
+                self.processes[core.current_process].elapsed_cpu_time += skipped
+        self.elapsed_time = next_event
+        self.load_core(self.cores[self.cpu])
+
+    def check_for_arrival(self):
+        while self.arrivals and self.arrivals.peek().arrival == self.elapsed_time:
+            self.store_core()
+            self.use_core(min(self.cores, key=lambda core: (core.current_process != 0, core.kernel.ready_count())))
+            new_process = self.arrivals.pop()
+            self.processes[self.next_pid] = new_process
+            arrival_kind = simlog.ARRIVAL_FOREGROUND if new_process.process_type == "Foreground" else simlog.ARRIVAL_BACKGROUND
+            self.simlog.event(self.elapsed_time, arrival_kind, self.next_pid, new_process.priority)
+            if self.metrics is not None:
+                self.metrics.arrival(self.elapsed_time, self.next_pid, new_process.priority)
+            self.flush_timer()
+            self.switch_process(self.kernel.new_process_arrived(self.next_pid, new_process.priority, new_process.process_type))
+            self.next_pid += 1
+
+    # Idle CPUs with nothing of their own to run steal from the CPU with the most ready processes.
+    def balance(self):
+        if len(self.cores) == 1:
+            return
+        for thief in self.cores:
+            self.store_core()
+            if thief.current_process != 0 or thief.kernel.ready_count() > 0:
+                continue
+            victim = max(self.cores, key=lambda core: core.kernel.ready_count())
+            if victim.kernel.ready_count() == 0:
+                return
+
+            self.use_core(victim)
+            self.flush_timer()
+            pid = self.kernel.steal_process()
+            if self.tickless:
+                self.timer_deadline = self.kernel.next_timer_deadline()
+            if self.recorder is not None:
+                self.recorder.kernel_called(self.elapsed_time, self.cpu, self.kernel)
+            if pid is None:
+                continue
+
+            self.use_core(thief)
+            self.migrations += 1
+            self.simlog.event(self.elapsed_time, simlog.MIGRATION, pid, thief.cpu)
+            self.flush_timer()
+            self.switch_process(self.kernel.process_migrated(pid))
+
+    def switch_process(self, new_process: int):
+        if new_process != 0:
+            if new_process not in self.processes:
+                raise SimulationError(f"Attempted to switch to unkown PID {new_process}")
+            for core in self.cores:
+                if core.cpu != self.cpu and core.current_process == new_process:
+                    raise SimulationError(f"CPU {self.cpu} attempted to run PID {new_process}, which is already running on CPU {core.cpu}")
+            self.process_0_runtime = 0
+            self.wait_for.dispatched(new_process)
+
+        if new_process != self.current_process:
+            self.simlog.event(self.elapsed_time, simlog.CPU_SWITCH, self.cpu, new_process)
+            if self.metrics is not None:
+                self.metrics.switch(self.elapsed_time, new_process, self.cpu)
+        self.current_process = new_process
+        if self.tickless:
+            self.timer_deadline = self.kernel.next_timer_deadline()
+        if self.recorder is not None:
+            self.recorder.kernel_called(self.elapsed_time, self.cpu, self.kernel)
+        if self.kernel.priority_inheritance:
+            self.preempt_other_cpus()
+
+    # With priority inheritance a syscall on one CPU can change the priorities of processes on the others.
+    # Each other CPU then gets the chance to switch to a process that now outranks its running one.
+    def preempt_other_cpus(self):
+        caller = self.cores[self.cpu]
+        for core in self.cores:
+            if core is caller:
+                continue
+            self.use_core(core)
+            self.flush_timer()
+            new_process = self.kernel.priority_preemption()
+            if new_process is not None:
+                self.switch_process(new_process)
+        self.use_core(caller)
+
+# Runs one simulation with the given number of CPUs and returns its metrics summary. Executed inside the worker processes.
+def run_scaling_case(description_path: Path, cpus: int, output_dir: Path) -> dict:
+    collector = MetricsCollector(cpus=cpus)
+    simulator = SMPSimulator(description_path, output_dir / f"{cpus}.trace", False, cpus, True, simlog.LEVEL_SWITCHES, True, metrics=collector)
+    simulator.run_simulator()
+    return {**collector.summary(), "migrations": simulator.migrations}
+
+# Runs the workload once per CPU count and prints how throughput and latency change.
+def run_scaling(description_path: Path, cpu_counts: list[int], jobs: int):
+    with tempfile.TemporaryDirectory() as temp_dir, ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_scaling_case, description_path, cpus, Path(temp_dir)) for cpus in cpu_counts]
+        results = [future.result() for future in futures]
+
+    print(f"{'cpus':>4} {'proc/s':>10} {'util':>6} {'mean TAT ms':>11} {'p99 TAT ms':>10} {'p99 resp ms':>11} {'switches':>9} {'migrations':>10}")
+    for cpus, summary in zip(cpu_counts, results):
+        print(f"{cpus:>4} {summary['throughput_per_s']:>10.1f} {summary['cpu_utilization']:>6.1%} "
+              f"{summary['turnaround_us']['mean'] / 1000:>11.3f} {summary['turnaround_us']['p99'] / 1000:>10.3f} "
+              f"{summary['response_us']['p99'] / 1000:>11.3f} {summary['context_switches']:>9} {summary['migrations']:>10}")
+
+def print_usage():
+    print("Usage: python smp.py <simulation_description_path> <log_path> <optional --cpus=N> <optional --no-student-logs> <optional --event-driven>")
+    print("       <optional --metrics=PATH>")
+    print("       python smp.py scaling <simulation_description_path> <optional --cpus=N,M> <optional --jobs=N>")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print_usage()
+    if sys.argv[1] == "scaling":
+        cpu_counts = DEFAULT_SCALING_CPUS
+        jobs = os.cpu_count() or 1
+        for option in sys.argv[3:]:
+            key, _, value = option.partition("=")
+            try:
+                if key == "--cpus" and all(int(cpus) > 0 for cpus in value.split(",")):
+                    cpu_counts = [int(cpus) for cpus in value.split(",")]
+                elif key == "--jobs" and int(value) > 0:
+                    jobs = int(value)
+                else:
+                    print_usage()
+            except ValueError:
+                print_usage()
+        run_scaling(Path(sys.argv[2]), cpu_counts, jobs)
+    else:
+        cpus = 2
+        student_logs = True
+        event_driven = False
+        metrics_path = None
+        for option in sys.argv[3:]:
+            key, _, value = option.partition("=")
+            if key == "--cpus" and value.isdigit() and int(value) > 0:
+                cpus = int(value)
+            elif option == "--no-student-logs":
+                student_logs = False
+            elif option == "--event-driven":
+                event_driven = True
+            elif key == "--metrics" and value:
+                metrics_path = Path(value)
+            else:
+                print_usage()
+
+        collector = None if metrics_path is None else MetricsCollector(metrics_path, cpus)
+        simulator = SMPSimulator(Path(sys.argv[1]), Path(sys.argv[2]), student_logs, cpus, event_driven, metrics=collector)
+        simulator.run_simulator()
+        if collector is not None:
+            collector.write_summary(Path(str(metrics_path) + metrics.SUMMARY_SUFFIX))
@@ -0,0 +1,207 @@
+from collections import deque
+from itertools import takewhile
+from pathlib import Path
+from typing import Callable
+import json
+import os
+import resource
+import sys
+
+import simlog
+from simlog import TextLog, LEVEL_ALL
+from metrics import MetricsCollector, Histogram, READY, BLOCKED
+from simulator import Simulator, SimulationError, VALID_SCHEDULING_ALGORITHMS, NUM_MICRO_IN_SEC, STDIN_PATH, open_description
+from generator import generate_stream, MEAN_CPU_TIME, DEFAULT_LOAD
+
+MICRO_S = int
+
+DEFAULT_WINDOW = NUM_MICRO_IN_SEC
+DEFAULT_KEEP = 10
+WINDOWS_FILE = "windows.jsonl"
+
+# The text log, split into one file per window of simulated time. Only the newest `keep` files are kept,
+# so an endless simulation uses constant disk space. A window in which nothing was logged has no file.
+class RotatingLog(TextLog):
+    def __init__(self, directory: Path, window: MICRO_S, keep: int, level: int = LEVEL_ALL):
+        self.directory = Path(directory)
+        self.window = window
+        self.keep = keep
+        self.level = level
+        self.paths = deque()
+        self.last_time = None
+        self.prefix = ""
+        self.open_window(0)
+
+    def open_window(self, start: MICRO_S):
+        self.path = os.path.abspath(self.directory / f"log_{start:015d}.txt")
+        self.file = open(self.path, 'w', buffering=simlog.WRITE_BUFFER_SIZE)
+        self.rotate_at = start + self.window
+        self.paths.append(self.path)
+        while len(self.paths) > self.keep:
+            os.unlink(self.paths.popleft())
+
+    def write(self, time: MICRO_S, delimiter: str, message: str):
+        if time >= self.rotate_at:
+            super().close()
+            self.last_time = None
+            self.open_window(time - time % self.window)
+        super().write(time, delimiter, message)
+
+# Besides the usual totals, reports a summary of every window of simulated time: arrivals, completions and their latencies,
+# how many processes are live, ready and blocked at its end, CPU utilization and the peak memory of this process.
+# Windows are closed lazily by the first arrival, switch or exit after their end; nothing else changes what they count.
+class WindowedMetrics(MetricsCollector):
+    def __init__(self, window: MICRO_S, report: Callable[[dict], None], cpus: int = 1):
+        super().__init__(cpus=cpus)
+        self.window = window
+        self.report = report
+        self.window_start = 0
+        self.start_window(0)
+
+    def start_window(self, start: MICRO_S):
+        self.window_start = start
+        self.window_arrivals = 0
+        self.window_turnaround = Histogram()
+        self.window_response = Histogram()
+        self.window_switches = self.context_switches
+        self.window_busy = self.busy_until(start)
+
+    # CPU time spent running processes, summed over all CPUs, from the start until time (at or after the last switch).
+    def busy_until(self, time: MICRO_S) -> MICRO_S:
+        idle = self.idle_time + sum(time - self.idle_since[cpu] for cpu in range(self.cpus) if self.running[cpu] == 0)
+        return time * self.cpus - idle
+
+    def end_window(self, end: MICRO_S):
+        states = [process.state for process in self.processes.values()]
+        self.report({
+            "start_us": self.window_start,
+            "end_us": end,
+            "arrivals": self.window_arrivals,
+            "completed": self.window_turnaround.count,
+            "live": len(states),
+            "ready": states.count(READY),
+            "blocked": states.count(BLOCKED),
+            "cpu_utilization": (self.busy_until(end) - self.window_busy) / ((end - self.window_start) * self.cpus),
+            "context_switches": self.context_switches - self.window_switches,
+            "turnaround_us": self.window_turnaround.summary(),
+            "response_us": self.window_response.summary(),
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        })
+        self.start_window(end)
+
+    # Ends every window that ended at or before time.
+    def roll(self, time: MICRO_S):
+        while time >= self.window_start + self.window:
+            self.end_window(self.window_start + self.window)
+
+    def arrival(self, time: MICRO_S, pid: int, priority: int = 0):
+        self.roll(time)
+        self.window_arrivals += 1
+        super().arrival(time, pid, priority)
+
+    def switch(self, time: MICRO_S, pid: int, cpu: int = 0):
+        self.roll(time)
+        super().switch(time, pid, cpu)
+
+    def exit(self, time: MICRO_S, pid: int):
+        self.roll(time)
+        process = self.processes[pid]
+        self.window_turnaround.add(time - process.arrival)
+        self.window_response.add(process.first_dispatch - process.arrival)
+        super().exit(time, pid)
+
+    # Also reports the last, partial window.
+    def finish(self, time: MICRO_S):
+        self.roll(time)
+        if time > self.window_start:
+            self.end_window(time)
+        super().finish(time)
+
+# Appends each window summary to the windows file and prints a one line digest of it.
+def window_reporter(path: Path) -> Callable[[dict], None]:
+    def report(window: dict):
+        with open(path, 'a') as file:
+            file.write(json.dumps(window) + "\n")
+        print(f"{window['end_us'] / NUM_MICRO_IN_SEC:>9.3f}s  arrivals {window['arrivals']:>6}  completed {window['completed']:>6}  "
+              f"live {window['live']:>6} (ready {window['ready']}, blocked {window['blocked']})  cpu {window['cpu_utilization']:>4.0%}  "
+              f"turnaround p50 {window['turnaround_us']['p50']}us p99 {window['turnaround_us']['p99']}us  "
+              f"rss {window['max_rss_kb'] // 1024}MB", flush=True)
+    return report
+
+# Runs a simulation whose processes come from source until it is interrupted, source ends or the arrivals stop after duration.
+# source is a description path, STDIN_PATH for a streaming description on standard input, or a scheduling algorithm, which
+# makes processes arrive as a Poisson process (see generator.generate_stream) at rate processes per simulated second.
+# The log is rotated into log_dir every window, which also gets a summary of every window in WINDOWS_FILE.
+def run_soak(source: str, log_dir: Path, window: MICRO_S = DEFAULT_WINDOW, keep: int = DEFAULT_KEEP, duration: MICRO_S | None = None,
+             rate: float | None = None, seed: int = 0, num_semaphores: int = 0, num_mutexes: int = 0, student_logs: bool = True,
+             event_driven: bool = False, log_level: int = LEVEL_ALL) -> dict:
+    if source in VALID_SCHEDULING_ALGORITHMS:
+        load = DEFAULT_LOAD if rate is None else rate * MEAN_CPU_TIME / NUM_MICRO_IN_SEC
+        header, processes = generate_stream(source, None, seed, num_semaphores, num_mutexes, load, parsed=True)
+    else:
+        header, processes = open_description(source)
+    if duration is not None:
+        processes = takewhile(lambda process: process.arrival < duration, processes)
+
+    log_dir.mkdir(parents=True, exist_ok=True)
+    windows_path = log_dir / WINDOWS_FILE
+    open(windows_path, 'w').close()
+    collector = WindowedMetrics(window, window_reporter(windows_path))
+    simulator = Simulator(None, os.devnull, student_logs, event_driven, log_level, metrics=collector, description=(header, processes))
+    simulator.simlog.close()
+    simulator.simlog = RotatingLog(log_dir, window, keep, log_level)
+    try:
+        simulator.run_simulator()
+    except KeyboardInterrupt:
+        pass
+    return collector.summary()
+
+def print_usage():
+    print("Usage: python soak.py <source> <log_dir> <optional --window=MS (default 1000)> <optional --keep=N (log files kept, default 10)>")
+    print("       <optional --duration=S (no arrivals after S simulated seconds)> <optional --no-student-logs> <optional --event-driven>")
+    print("       <optional --log-level=switches|lifecycle|all>")
+    print(f"       source is a description path, {STDIN_PATH} for a streaming description on standard input, or a scheduling algorithm for")
+    print("       endless Poisson arrivals: <optional --rate=N (processes per simulated second)> <optional --seed=N> <optional --semaphores=N> <optional --mutexes=N>")
+    print("       Runs until interrupted or out of processes, writing a summary of every window to log_dir/" + WINDOWS_FILE + ".")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print_usage()
+    options = {}
+    for option in sys.argv[3:]:
+        key, _, value = option.partition("=")
+        try:
+            if key == "--window" and float(value) > 0:
+                options["window"] = int(float(value) * 1000)
+            elif key == "--keep" and int(value) > 0:
+                options["keep"] = int(value)
+            elif key == "--duration" and float(value) > 0:
+                options["duration"] = int(float(value) * NUM_MICRO_IN_SEC)
+            elif key == "--rate" and float(value) > 0:
+                options["rate"] = float(value)
+            elif key == "--seed":
+                options["seed"] = int(value)
+            elif key == "--semaphores":
+                options["num_semaphores"] = int(value)
+            elif key == "--mutexes":
+                options["num_mutexes"] = int(value)
+            elif option == "--no-student-logs":
+                options["student_logs"] = False
+            elif option == "--event-driven":
+                options["event_driven"] = True
+            elif key == "--log-level" and value in simlog.LOG_LEVELS:
+                options["log_level"] = simlog.LOG_LEVELS[value]
+            else:
+                print_usage()
+        except ValueError:
+            print_usage()
+
+    try:
+        summary = run_soak(sys.argv[1], Path(sys.argv[2]), **options)
+    except SimulationError as e:
+        print(f"Simulation stopped: {e}", file=sys.stderr)
+        sys.exit(1)
+    json.dump(summary, sys.stdout, indent=2)
+    sys.stdout.write("\n")
@@ -0,0 +1,185 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from pathlib import Path
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+from kernel import LEVEL_SLICE, TIMER_INTERVAL, FAIR_LATENCY, FAIR_GRANULARITY, BOOST_INTERVAL
+from simulator import Simulator, VALID_SCHEDULING_ALGORITHMS, NUM_MICRO_IN_SEC
+import simulator
+import simlog
+
+DEFAULT_QUANTA = [10, 20, 40, 80, 160]
+
+@dataclass
+class SweepResult:
+    algorithm: str
+    # None where the algorithm does not use the option.
+    rr_quantum: int | None
+    level_slice: int | None
+    timer_interval: int | None
+    fair_latency: int | None
+    fair_granularity: int | None
+    boost_interval: int | None
+    completed: int
+    # Completed processes per simulated second.
+    throughput: float
+    mean_turnaround_us: float
+    p99_turnaround_us: float
+    # Time from arrival to first running.
+    p99_response_us: float
+    # Number of "Context switching to pid" lines, including switches to the idle process.
+    context_switches: int
+    wall_time: float
+    # Why the simulation failed, empty if it did not.
+    error: str
+
+# Nearest-rank percentile of values, which must be sorted.
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+# The (algorithm, options) pairs to run. Options an algorithm ignores are left out, so FCFS and Priority run once
+# and RR does not repeat itself for every level slice.
+def sweep_cases(algorithms: list[str], quanta: list[int], slices: list[int], intervals: list[int],
+                latencies: list[int] = [FAIR_LATENCY], granularities: list[int] = [FAIR_GRANULARITY],
+                boosts: list[int] = [BOOST_INTERVAL]) -> list[tuple[str, dict]]:
+    cases = []
+    for algorithm in algorithms:
+        if algorithm == "RR":
+            cases += [(algorithm, {simulator.RR_QUANTUM: quantum, simulator.TIMER_INTERVAL: interval})
+                      for quantum in quanta for interval in intervals]
+        elif algorithm == "Multilevel":
+            cases += [(algorithm, {simulator.RR_QUANTUM: quantum, simulator.LEVEL_SLICE: level_slice, simulator.TIMER_INTERVAL: interval})
+                      for quantum in quanta for level_slice in slices for interval in intervals]
+        elif algorithm == "Fair":
+            cases += [(algorithm, {simulator.FAIR_LATENCY: latency, simulator.FAIR_GRANULARITY: granularity, simulator.TIMER_INTERVAL: interval})
+                      for latency in latencies for granularity in granularities for interval in intervals]
+        elif algorithm == "MLFQ":
+            cases += [(algorithm, {simulator.BOOST_INTERVAL: boost, simulator.TIMER_INTERVAL: interval})
+                      for boost in boosts for interval in intervals]
+        else:
+            cases.append((algorithm, {}))
+    return cases
+
+# Runs the workload once with the given algorithm and options. Executed inside the worker processes.
+# The run writes a binary trace of switches, arrivals and exits, which is all the measurements need.
+def run_case(workload_path: Path, algorithm: str, options: dict, output_dir: Path) -> SweepResult:
+    trace_path = output_dir / ("_".join([algorithm, *(str(value) for value in options.values())]) + ".trace")
+    start = time.perf_counter()
+    error = ""
+    try:
+        Simulator(workload_path, trace_path, False, True, simlog.LEVEL_LIFECYCLE, True,
+                  {"scheduling_algorithm": algorithm, **options}).run_simulator()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}".strip().splitlines()[0]
+    wall_time = time.perf_counter() - start
+
+    arrivals = {}
+    turnarounds = []
+    responses = []
+    not_dispatched = set()
+    context_switches = 0
+    end_time = 0
+    if trace_path.exists():
+        for record_time, kind, a, _ in simlog.read_trace(trace_path):
+            if kind == simlog.SWITCH:
+                context_switches += 1
+                if a in not_dispatched:
+                    not_dispatched.remove(a)
+                    responses.append(record_time - arrivals[a])
+            elif kind == simlog.ARRIVAL_FOREGROUND or kind == simlog.ARRIVAL_BACKGROUND:
+                arrivals[a] = record_time
+                not_dispatched.add(a)
+            elif kind == simlog.EXIT:
+                turnarounds.append(record_time - arrivals.pop(a))
+            end_time = record_time
+        trace_path.unlink()
+
+    turnarounds.sort()
+    responses.sort()
+    return SweepResult(algorithm, options.get(simulator.RR_QUANTUM), options.get(simulator.LEVEL_SLICE), options.get(simulator.TIMER_INTERVAL),
+                       options.get(simulator.FAIR_LATENCY), options.get(simulator.FAIR_GRANULARITY), options.get(simulator.BOOST_INTERVAL),
+                       len(turnarounds), len(turnarounds) * NUM_MICRO_IN_SEC / max(end_time, 1),
+                       sum(turnarounds) / max(len(turnarounds), 1), percentile(turnarounds, 0.99), percentile(responses, 0.99),
+                       context_switches, wall_time, error)
+
+def run_sweep(workload_path: Path, cases: list[tuple[str, dict]], jobs: int) -> list[SweepResult]:
+    with tempfile.TemporaryDirectory() as temp_dir, ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_case, workload_path, algorithm, options, Path(temp_dir)) for algorithm, options in cases]
+        return [future.result() for future in futures]
+
+def print_results(results: list[SweepResult]):
+    def option(value: int | None) -> str:
+        return "-" if value is None else str(value)
+
+    print(f"{'algorithm':<10} {'quantum':>7} {'slice':>6} {'latency':>7} {'gran':>4} {'boost':>5} {'timer':>5} {'done':>8} {'proc/s':>10} "
+          f"{'mean TAT ms':>11} {'p99 TAT ms':>10} {'p99 resp ms':>11} {'switches':>9} {'wall (s)':>8}")
+    for r in results:
+        line = (f"{r.algorithm:<10} {option(r.rr_quantum):>7} {option(r.level_slice):>6} {option(r.fair_latency):>7} {option(r.fair_granularity):>4} "
+                f"{option(r.boost_interval):>5} {option(r.timer_interval):>5} {r.completed:>8} {r.throughput:>10.1f} "
+                f"{r.mean_turnaround_us / 1000:>11.3f} {r.p99_turnaround_us / 1000:>10.3f} {r.p99_response_us / 1000:>11.3f} {r.context_switches:>9} {r.wall_time:>8.2f}")
+        if r.error:
+            line += f"  FAILED {r.error}"
+        print(line)
+
+def print_usage():
+    print("Usage: python sweep.py <simulation_path> <optional --algorithms=A,B> <optional --quanta=N,M> <optional --slices=N,M> "
+          "<optional --latencies=N,M> <optional --granularities=N,M> <optional --boosts=N,M> <optional --intervals=N,M> <optional --jobs=N> <optional --output=PATH>")
+    print("       The scheduling algorithm and timing options in the simulation description are replaced by each point of the grid.")
+    print("       --output writes the results as JSON Lines.")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print_usage()
+    workload_path = Path(sys.argv[1])
+    algorithms = sorted(VALID_SCHEDULING_ALGORITHMS)
+    quanta = DEFAULT_QUANTA
+    slices = [LEVEL_SLICE]
+    latencies = [FAIR_LATENCY]
+    granularities = [FAIR_GRANULARITY]
+    boosts = [BOOST_INTERVAL]
+    intervals = [TIMER_INTERVAL]
+    jobs = os.cpu_count() or 1
+    output_path = None
+    for option in sys.argv[2:]:
+        key, _, value = option.partition("=")
+        try:
+            if key == "--algorithms" and all(a in VALID_SCHEDULING_ALGORITHMS for a in value.split(",")):
+                algorithms = value.split(",")
+            elif key == "--quanta":
+                quanta = [int(quantum) for quantum in value.split(",")]
+            elif key == "--slices":
+                slices = [int(level_slice) for level_slice in value.split(",")]
+            elif key == "--latencies":
+                latencies = [int(latency) for latency in value.split(",")]
+            elif key == "--granularities":
+                granularities = [int(granularity) for granularity in value.split(",")]
+            elif key == "--boosts":
+                boosts = [int(boost) for boost in value.split(",")]
+            elif key == "--intervals":
+                intervals = [int(interval) for interval in value.split(",")]
+            elif key == "--jobs" and int(value) > 0:
+                jobs = int(value)
+            elif key == "--output" and value:
+                output_path = Path(value)
+            else:
+                print_usage()
+        except ValueError:
+            print_usage()
+    if min(quanta + slices + latencies + granularities + boosts + intervals) <= 0:
+        print_usage()
+
+    results = run_sweep(workload_path, sweep_cases(algorithms, quanta, slices, intervals, latencies, granularities, boosts), jobs)
+    print_results(results)
+    if output_path is not None:
+        with open(output_path, 'w') as file:
+            for result in results:
+                file.write(json.dumps(asdict(result)) + "\n")
@@ -0,0 +1,49 @@
+from pathlib import Path
+from typing import Iterable
+import json
+import sys
+
+from simulator import PROCESSES, WORKLOAD_MAGIC, WORKLOAD_VERSION, WORKLOAD_HEADER, PROCESS_RECORD, EVENT_RECORD, PROCESS_TYPES
+from simulator import Process, open_description
+
+# Compiles a JSON or streaming description into the binary format read by simulator.CompiledProcesses.
+# Every process is validated here (parse_process checks its fields and events), so the simulator only has to unpack it.
+# Returns the number of processes.
+def compile_description(description_path: Path, output_path: Path) -> int:
+    header, processes = open_description(description_path)
+    header = {key: value for key, value in header.items() if key != PROCESSES}
+    return write_compiled(header, processes, output_path)
+
+# processes must be in arrival order. The events are written as they come and the process records at the end, so processes
+# can be a lazy iterator; only the process records are kept in memory.
+def write_compiled(header: dict, processes: Iterable[Process], output_path: Path) -> int:
+    header_json = json.dumps(header).encode()
+    events_offset = WORKLOAD_HEADER.size + len(header_json)
+    process_records = bytearray()
+    event_count = 0
+    with open(output_path, 'wb') as file:
+        file.write(bytes(WORKLOAD_HEADER.size))
+        file.write(header_json)
+        for process in processes:
+            file.write(b"".join(EVENT_RECORD.pack(event.arrival, event.kind, event.value) for event in process.timeline))
+            process_records += PROCESS_RECORD.pack(process.arrival, process.total_cpu_time, process.priority,
+                                                   PROCESS_TYPES.index(process.process_type), event_count, len(process.timeline))
+            event_count += len(process.timeline)
+        file.write(process_records)
+        count = len(process_records) // PROCESS_RECORD.size
+        file.seek(0)
+        file.write(WORKLOAD_HEADER.pack(WORKLOAD_MAGIC, WORKLOAD_VERSION, len(header_json), count,
+                                        events_offset, events_offset + event_count * EVENT_RECORD.size))
+    return count
+
+def print_usage():
+    print("Usage: python workload.py <simulation_description_path> <output_path>")
+    print("       Validates the description (.json, .jsonl or - for standard input) and compiles it for fast loading. Pass the output, ending in .workload, to simulator.py.")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print_usage()
+    count = compile_description(Path(sys.argv[1]), Path(sys.argv[2]))
+    print(f"Compiled {count} processes into {sys.argv[2]}")